@@ -1,32 +1,64 @@
-from flask import Flask, request, jsonify, render_template, redirect, url_for, session
+from flask import Flask, Response, g, request, jsonify, render_template, redirect, url_for, session, stream_with_context
+from flask.json.provider import DefaultJSONProvider
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
-from openai import OpenAI
 import os
 import re
+import base64
 from datetime import datetime, timedelta
 import json
+import time
 import warnings
 import uuid
 
-# SendGrid imports
-from sendgrid import SendGridAPIClient
-from sendgrid.helpers.mail import Mail, Email, To, Content
-
-# Google Calendar imports
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import Flow
-from googleapiclient.discovery import build
-from googleapiclient.errors import HttpError
-
 # Load environment variable (optional: only needed locally)
 from dotenv import load_dotenv
+from werkzeug.middleware.proxy_fix import ProxyFix
 load_dotenv()
 
+from utils.admission import AdmissionController, parse_limit
+from utils.appointment_records import AppointmentRecord, PatientProfile
+from utils.appointment_store import create_appointment_store, order_key
+from utils.availability import AvailabilityIndex
+from utils.bulk_import import AppointmentImporter, detect_format, iter_rows
+from utils.calendar_batch import CalendarOperation, batch_calendar_writes
+from utils.calendar_services import CalendarServiceCache
+from utils.calendar_sync import CalendarSyncEngine
+from utils.circuit_breaker import CircuitOpenError
+from utils.email_templates import EmailTemplates
+from utils.health_assistant import HealthAssistant
+from utils.idempotency import IdempotencyConflict, fingerprint, valid_key
+from utils.ics_feed import IcsFeed
+from utils import integrations, metrics
+from utils.integration_stubs import STUB_INTEGRATIONS
+from utils.outbox import OutboxWorker, booking_tasks
+from utils.reminders import ReminderScheduler
+from utils.response_cache import ResponseCache
+from utils.search_index import SearchIndex
+from utils.static_pages import PageCache, StaticAssets
+from utils.time_parser import CLINIC_TIMEZONE, format_slot, parse_appointment_time
+
 # Initialize Flask app
 app = Flask(__name__)
 app.secret_key = "your-secret-key"
 
+
+class ClinicJSONProvider(DefaultJSONProvider):
+    """jsonify() that also accepts the memory store's appointment records"""
+
+    @staticmethod
+    def default(o):
+        if isinstance(o, (AppointmentRecord, PatientProfile)):
+            return o.to_dict()
+        return DefaultJSONProvider.default(o)
+
+
+app.json = ClinicJSONProvider(app)
+
+# Behind a load balancer (e.g. Render), trust that many X-Forwarded-For hops
+# so rate limits apply to the patient's address rather than the proxy's
+if int(os.getenv("TRUSTED_PROXY_COUNT", "0")):
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=int(os.getenv("TRUSTED_PROXY_COUNT")))
+
 login_manager = LoginManager()
 login_manager.init_app(app)
 login_manager.login_view = "login"
@@ -76,7 +108,7 @@ def login():
             return redirect(url_for("clinic_dashboard"))
         else:
             return "Invalid credentials", 401
-    return render_template("login.html")
+    return pages.get("login", lambda: render_template("login.html")).response("public, no-cache")
 
 @app.route('/logout')
 @login_required
@@ -88,327 +120,220 @@ def logout():
 def internal_error(e):
     return f"Something broke: {str(e)}", 500
 
-# In-memory storage for appointments (now with full patient details)
-appointments = []
+# Appointment storage (now with full patient details), shared by all workers.
+# Set APPOINTMENT_STORE_URL=memory:// for a single-process in-memory store.
+appointments = create_appointment_store()
 
-# Initialize OpenAI client (for SDK v1.x)
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# The OpenAI client is built on first use by integrations.openai_client(),
+# or warmed in the background once the worker is serving. Answers to
+# repeated health inquiries come from the response cache.
+assistant = HealthAssistant(
+    integrations.openai_client,
+    os.getenv("OPENAI_MODEL", "gpt-4o-mini"),
+    ResponseCache(
+        max_entries=int(os.getenv("ASK_CACHE_SIZE", "1024")),
+        ttl=int(os.getenv("ASK_CACHE_TTL", "3600")),
+    ),
+)
+
+def assistant_configured():
+    """Check if health inquiries can be answered by the model"""
+    return bool(os.getenv('OPENAI_API_KEY')) or STUB_INTEGRATIONS
+
+# Pages without per-request data are rendered once and served precompressed;
+# static files are served from memory under content-hashed URLs
+assets = StaticAssets(app.static_folder)
+app.jinja_env.globals["asset_url"] = assets.url
+pages = PageCache()
+
+with app.test_request_context('/'):
+    pages.get("index", lambda: render_template('index.html'))
+    pages.get("login", lambda: render_template("login.html"))
 
 @app.route('/')
 def index():
-    return render_template('index.html')
+    return pages.get("index", lambda: render_template('index.html')).response("public, no-cache")
+
+@app.route('/assets/<path:name>')
+def hashed_asset(name):
+    return assets.response(name)
 
 # Email helper functions
+def sendgrid_configured():
+    return bool(SENDGRID_API_KEY) or STUB_INTEGRATIONS
+
+email_templates = EmailTemplates(os.path.join(app.root_path, 'templates', 'email'))
+email_templates.register(
+    'appointment_confirmation',
+    title='🏥 AI Clinic', subtitle='Appointment Confirmation', header_color='#007bff', footer=True
+)
+email_templates.register(
+    'doctor_notification',
+    title='🏥 AI Clinic - Doctor Portal', subtitle='New Appointment Notification', header_color='#28a745', footer=False
+)
+email_templates.register(
+    'appointment_reminder',
+    title='🏥 AI Clinic', subtitle='Appointment Reminder', header_color='#007bff', footer=True
+)
+
 def send_appointment_confirmation_email(patient_info, appointment_details):
     """Send appointment confirmation email using SendGrid"""
-    if not SENDGRID_API_KEY:
+    if not sendgrid_configured():
         print("SendGrid API key not configured")
         return False
     
     try:
         # Create the email content
         subject = f"Appointment Confirmation - {appointment_details['time']}"
-        
-        html_content = f"""
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <style>
-                body {{ font-family: Arial, sans-serif; line-height: 1.6; color: #333; }}
-                .container {{ max-width: 600px; margin: 0 auto; padding: 20px; }}
-                .header {{ background: #007bff; color: white; padding: 20px; text-align: center; border-radius: 8px 8px 0 0; }}
-                .content {{ background: #f8f9fa; padding: 30px; border-radius: 0 0 8px 8px; }}
-                .appointment-details {{ background: white; padding: 20px; border-radius: 8px; margin: 20px 0; }}
-                .detail-row {{ display: flex; justify-content: space-between; margin: 10px 0; padding: 5px 0; border-bottom: 1px solid #eee; }}
-                .footer {{ text-align: center; margin-top: 30px; color: #666; font-size: 14px; }}
-                .confirmation-id {{ background: #28a745; color: white; padding: 10px; text-align: center; border-radius: 4px; margin: 20px 0; }}
-            </style>
-        </head>
-        <body>
-            <div class="container">
-                <div class="header">
-                    <h1>🏥 AI Clinic</h1>
-                    <h2>Appointment Confirmation</h2>
-                </div>
-                
-                <div class="content">
-                    <p>Dear {patient_info['firstName']} {patient_info['lastName']},</p>
-                    
-                    <p>Your appointment has been successfully scheduled! Here are the details:</p>
-                    
-                    <div class="confirmation-id">
-                        <strong>Confirmation ID: {appointment_details['confirmationId']}</strong>
-                    </div>
-                    
-                    <div class="appointment-details">
-                        <h3>Appointment Details</h3>
-                        <div class="detail-row">
-                            <span><strong>Doctor:</strong></span>
-                            <span>Dr. Lee</span>
-                        </div>
-                        <div class="detail-row">
-                            <span><strong>Date & Time:</strong></span>
-                            <span>{appointment_details['time']}</span>
-                        </div>
-                        <div class="detail-row">
-                            <span><strong>Reason:</strong></span>
-                            <span>{appointment_details['reason']}</span>
-                        </div>
-                        <div class="detail-row">
-                            <span><strong>Patient:</strong></span>
-                            <span>{patient_info['firstName']} {patient_info['lastName']}</span>
-                        </div>
-                        <div class="detail-row">
-                            <span><strong>Age:</strong></span>
-                            <span>{patient_info['age']} years old</span>
-                        </div>
-                        <div class="detail-row">
-                            <span><strong>Phone:</strong></span>
-                            <span>{patient_info['phone']}</span>
-                        </div>
-                        {f'''<div class="detail-row">
-                            <span><strong>Medical ID:</strong></span>
-                            <span>{patient_info['medicalId']}</span>
-                        </div>''' if patient_info.get('medicalId') else ''}
-                        {f'''<div class="detail-row">
-                            <span><strong>Known Allergies:</strong></span>
-                            <span>{patient_info['allergies']}</span>
-                        </div>''' if patient_info.get('allergies') else ''}
-                    </div>
-                    
-                    <div style="background: #fff3cd; border: 1px solid #ffeaa7; padding: 15px; border-radius: 4px; margin: 20px 0;">
-                        <h4 style="margin: 0 0 10px 0; color: #856404;">📋 Important Reminders:</h4>
-                        <ul style="margin: 0; padding-left: 20px;">
-                            <li>Please arrive <strong>15 minutes early</strong> for check-in</li>
-                            <li>Bring a valid government-issued ID</li>
-                            <li>Bring your insurance card (if applicable)</li>
-                            <li>List of current medications</li>
-                            <li>Wear a mask if you have any cold symptoms</li>
-                        </ul>
-                    </div>
-                    
-                    <p>If you need to reschedule or cancel your appointment, please contact us at least 24 hours in advance.</p>
-                    
-                    <p>We look forward to seeing you!</p>
-                    
-                    <p>Best regards,<br>
-                    <strong>AI Clinic Team</strong></p>
-                </div>
-                
-                <div class="footer">
-                    <p>This is an automated message. Please do not reply to this email.</p>
-                    <p>If you have questions, please visit our website or call our office.</p>
-                </div>
-            </div>
-        </body>
-        </html>
-        """
+        html_content, text_content = email_templates.render(
+            'appointment_confirmation', patient=patient_info, appointment=appointment_details)
         
         # Create the email
+        from sendgrid.helpers.mail import Mail
         message = Mail(
             from_email=FROM_EMAIL,
             to_emails=patient_info['email'],
             subject=subject,
+            plain_text_content=text_content,
             html_content=html_content
         )
         
         # Send the email
-        sg = SendGridAPIClient(api_key=SENDGRID_API_KEY)
-        response = sg.send(message)
+        sg = integrations.sendgrid_client()
+        with integrations.breaker("sendgrid").call():
+            response = sg.send(message)
         
         print(f"Email sent successfully. Status code: {response.status_code}")
         return True
         
+    except CircuitOpenError:
+        raise  # the outbox retries once SendGrid is back
     except Exception as e:
         print(f"Error sending email: {e}")
         return False
 
 def send_doctor_notification_email(doctor_email, patient_info, appointment_details):
     """Send new appointment notification to doctor"""
-    if not SENDGRID_API_KEY:
+    if not sendgrid_configured():
         return False
     
     try:
         subject = f"New Appointment Booked - {appointment_details['time']}"
+        html_content, text_content = email_templates.render(
+            'doctor_notification', patient=patient_info, appointment=appointment_details)
         
-        html_content = f"""
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <style>
-                body {{ font-family: Arial, sans-serif; line-height: 1.6; color: #333; }}
-                .container {{ max-width: 600px; margin: 0 auto; padding: 20px; }}
-                .header {{ background: #28a745; color: white; padding: 20px; text-align: center; border-radius: 8px 8px 0 0; }}
-                .content {{ background: #f8f9fa; padding: 30px; border-radius: 0 0 8px 8px; }}
-                .patient-details {{ background: white; padding: 20px; border-radius: 8px; margin: 20px 0; }}
-                .detail-row {{ display: flex; justify-content: space-between; margin: 10px 0; padding: 5px 0; border-bottom: 1px solid #eee; }}
-            </style>
-        </head>
-        <body>
-            <div class="container">
-                <div class="header">
-                    <h1>🏥 AI Clinic - Doctor Portal</h1>
-                    <h2>New Appointment Notification</h2>
-                </div>
-                
-                <div class="content">
-                    <p>Dear Dr. Lee,</p>
-                    
-                    <p>A new appointment has been booked through the patient portal:</p>
-                    
-                    <div class="patient-details">
-                        <h3>Patient Information</h3>
-                        <div class="detail-row">
-                            <span><strong>Patient:</strong></span>
-                            <span>{patient_info['firstName']} {patient_info['lastName']}</span>
-                        </div>
-                        <div class="detail-row">
-                            <span><strong>Age:</strong></span>
-                            <span>{patient_info['age']} years old ({patient_info['gender']})</span>
-                        </div>
-                        <div class="detail-row">
-                            <span><strong>Contact:</strong></span>
-                            <span>{patient_info['phone']} | {patient_info['email']}</span>
-                        </div>
-                        <div class="detail-row">
-                            <span><strong>Appointment Time:</strong></span>
-                            <span>{appointment_details['time']}</span>
-                        </div>
-                        <div class="detail-row">
-                            <span><strong>Chief Complaint:</strong></span>
-                            <span>{appointment_details['reason']}</span>
-                        </div>
-                        <div class="detail-row">
-                            <span><strong>Confirmation ID:</strong></span>
-                            <span>{appointment_details['confirmationId']}</span>
-                        </div>
-                        {f'''<div class="detail-row">
-                            <span><strong>Medical ID:</strong></span>
-                            <span>{patient_info['medicalId']}</span>
-                        </div>''' if patient_info.get('medicalId') else ''}
-                        {f'''<div class="detail-row">
-                            <span><strong>Emergency Contact:</strong></span>
-                            <span>{patient_info['emergencyContact']} ({patient_info['emergencyPhone']})</span>
-                        </div>''' if patient_info.get('emergencyContact') else ''}
-                        {f'''<div class="detail-row">
-                            <span><strong>Known Allergies:</strong></span>
-                            <span style="color: #dc3545; font-weight: bold;">{patient_info['allergies']}</span>
-                        </div>''' if patient_info.get('allergies') else ''}
-                    </div>
-                    
-                    <p>The appointment has been automatically added to your Google Calendar (if connected).</p>
-                    
-                    <p>Best regards,<br>
-                    <strong>AI Clinic System</strong></p>
-                </div>
-            </div>
-        </body>
-        </html>
-        """
-        
+        from sendgrid.helpers.mail import Mail
         message = Mail(
             from_email=FROM_EMAIL,
             to_emails=doctor_email,
             subject=subject,
+            plain_text_content=text_content,
             html_content=html_content
         )
         
-        sg = SendGridAPIClient(api_key=SENDGRID_API_KEY)
-        response = sg.send(message)
+        sg = integrations.sendgrid_client()
+        with integrations.breaker("sendgrid").call():
+            response = sg.send(message)
         
         print(f"Doctor notification sent. Status code: {response.status_code}")
         return True
         
+    except CircuitOpenError:
+        raise
     except Exception as e:
         print(f"Error sending doctor notification: {e}")
         return False
 
+REMINDER_LEADS = {"24h": "tomorrow", "1h": "in one hour"}
+
+# Reminders share one body; SendGrid fills in these tags per recipient. The
+# HTML part gets its own tags so it can be sent escaped values.
+reminder_html = email_templates.render(
+    'appointment_reminder',
+    patient={'firstName': '-firstName.html-'},
+    appointment={'time': '-time.html-', 'confirmationId': '-confirmationId.html-'},
+    lead='-lead.html-',
+)[0]
+reminder_text = email_templates.render(
+    'appointment_reminder',
+    patient={'firstName': '-firstName-'},
+    appointment={'time': '-time-', 'confirmationId': '-confirmationId-'},
+    lead='-lead-',
+)[1]
+
+def send_reminder_batch(batch):
+    """Send a group of reminders as one SendGrid request, one personalization per patient"""
+    if not sendgrid_configured():
+        raise RuntimeError("SendGrid API key not configured")
+    from markupsafe import escape
+    from sendgrid.helpers.mail import Mail, Personalization, Substitution, To
+    message = Mail(
+        from_email=FROM_EMAIL,
+        subject="Appointment Reminder",
+        plain_text_content=reminder_text,
+        html_content=reminder_html
+    )
+    recipients = 0
+    for reminder in batch:
+        patient_info = reminder.appointment.get("patientInfo") or {}
+        if not patient_info.get("email"):
+            continue
+        lead = REMINDER_LEADS.get(reminder.kind, "coming up")
+        personalization = Personalization()
+        personalization.add_to(To(patient_info["email"]))
+        personalization.subject = f"Reminder: your appointment is {lead} - {reminder.appointment['time']}"
+        for tag, value in (("firstName", patient_info.get("firstName", "")),
+                           ("time", reminder.appointment["time"]),
+                           ("confirmationId", reminder.appointment["confirmationId"]),
+                           ("lead", lead)):
+            personalization.add_substitution(Substitution(f"-{tag}-", str(value)))
+            personalization.add_substitution(Substitution(f"-{tag}.html-", str(escape(value))))
+        message.add_personalization(personalization)
+        recipients += 1
+    if not recipients:
+        return
+    with integrations.breaker("sendgrid").call():
+        response = integrations.sendgrid_client().send(message)
+    print(f"Sent {recipients} appointment reminders. Status code: {response.status_code}")
+
 # Google Calendar Helper Functions (keeping existing functions)
-def get_google_calendar_service():
-    """Get Google Calendar service object"""
+def google_calendar_connected(doctor_id):
+    return STUB_INTEGRATIONS or os.path.exists(f'token_{doctor_id}.json')
+
+calendar_services = CalendarServiceCache(SCOPES)
+
+def get_google_calendar_service(doctor_id=None):
+    """Get Google Calendar service object for a doctor (defaults to the logged-in one)"""
+    if STUB_INTEGRATIONS:
+        return integrations.google_calendar_service(None)
     try:
-        creds = None
-        doctor_id = current_user.get_id()
-        token_file = f'token_{doctor_id}.json'
-        
-        print(f"Looking for token file: {token_file}")
-        
-        # Load existing credentials
-        if os.path.exists(token_file):
-            try:
-                creds = Credentials.from_authorized_user_file(token_file, SCOPES)
-                print("Credentials loaded from file")
-            except Exception as load_error:
-                print(f"Error loading credentials: {load_error}")
-                return None
-        else:
-            print("No token file found")
-            return None
-        
-        # If credentials are not valid, try to refresh
-        if not creds or not creds.valid:
-            if creds and creds.expired and creds.refresh_token:
-                try:
-                    print("Refreshing expired credentials")
-                    creds.refresh(Request())
-                    # Save the refreshed credentials
-                    with open(token_file, 'w') as token:
-                        token.write(creds.to_json())
-                    print("Credentials refreshed and saved")
-                except Exception as refresh_error:
-                    print(f"Error refreshing credentials: {refresh_error}")
-                    return None
-            else:
-                print("Credentials are invalid and cannot be refreshed")
-                return None
-        
-        try:
-            service = build('calendar', 'v3', credentials=creds)
-            print("Google Calendar service built successfully")
-            return service
-        except Exception as build_error:
-            print(f"Error building service: {build_error}")
-            return None
-            
+        return calendar_services.get(doctor_id or current_user.get_id())
     except Exception as e:
         print(f"Error in get_google_calendar_service: {e}")
         return None
 
-def create_google_calendar_event(patient_info, appointment_time, reason):
+def event_times(appointment_time):
+    """Google Calendar start/end fields for a one-hour appointment"""
+    event_start = parse_appointment_time(appointment_time).start
+    event_end = event_start + timedelta(hours=1)  # 1 hour appointment
+    return {
+        'start': {
+            'dateTime': event_start.isoformat(),
+            'timeZone': str(CLINIC_TIMEZONE),
+        },
+        'end': {
+            'dateTime': event_end.isoformat(),
+            'timeZone': str(CLINIC_TIMEZONE),
+        },
+    }
+
+def create_google_calendar_event(patient_info, appointment_time, reason, doctor_id=None, confirmation_id=None):
     """Create an event in Google Calendar with patient details"""
-    service = get_google_calendar_service()
+    service = get_google_calendar_service(doctor_id)
     if not service:
         return None
     
     try:
-        # Parse the time - enhanced version with patient info
-        event_start = datetime.now() + timedelta(days=1)  # Default to tomorrow
-        
-        # Try to parse common time formats
-        if 'monday' in appointment_time.lower():
-            days_ahead = 0 - datetime.now().weekday()
-            if days_ahead <= 0:
-                days_ahead += 7
-            event_start = datetime.now() + timedelta(days=days_ahead)
-        elif 'friday' in appointment_time.lower():
-            days_ahead = 4 - datetime.now().weekday()
-            if days_ahead <= 0:
-                days_ahead += 7
-            event_start = datetime.now() + timedelta(days=days_ahead)
-        # Add more day parsing as needed
-        
-        # Set time
-        if '3pm' in appointment_time.lower():
-            event_start = event_start.replace(hour=15, minute=0)
-        elif '2pm' in appointment_time.lower():
-            event_start = event_start.replace(hour=14, minute=0)
-        elif '10am' in appointment_time.lower():
-            event_start = event_start.replace(hour=10, minute=0)
-        else:
-            event_start = event_start.replace(hour=10, minute=0)  # Default 10 AM
-        
-        event_end = event_start + timedelta(hours=1)  # 1 hour appointment
-        
         # Create detailed event description
         description = f"""Patient: {patient_info['firstName']} {patient_info['lastName']}
 Age: {patient_info['age']} ({patient_info['gender']})
@@ -424,14 +349,7 @@ Booked via AI Clinic Patient Portal"""
         event = {
             'summary': f"{patient_info['firstName']} {patient_info['lastName']} - {reason}",
             'description': description,
-            'start': {
-                'dateTime': event_start.isoformat(),
-                'timeZone': 'America/New_York',  # Adjust timezone as needed
-            },
-            'end': {
-                'dateTime': event_end.isoformat(),
-                'timeZone': 'America/New_York',
-            },
+            **event_times(appointment_time),
             'attendees': [
                 {'email': patient_info['email'], 'displayName': f"{patient_info['firstName']} {patient_info['lastName']}"}
             ],
@@ -443,23 +361,237 @@ Booked via AI Clinic Patient Portal"""
                 ],
             },
         }
+        if confirmation_id:
+            # Lets calendar sync match the event to its booking
+            event['extendedProperties'] = {'private': {'clinicConfirmationId': confirmation_id}}
         
-        created_event = service.events().insert(calendarId='primary', body=event).execute()
+        with integrations.breaker("google_calendar").call():
+            created_event = service.events().insert(calendarId='primary', body=event).execute()
         return created_event.get('id')
     
+    except CircuitOpenError:
+        raise
     except Exception as e:
         print(f"Error creating Google Calendar event: {e}")
         return None
 
+# Booking side effects, run by the outbox worker after the appointment is committed
+DOCTOR_EMAIL = "doctor@clinic.com"  # Replace with actual doctor email
+
+def appointment_details_for(appointment):
+    return {
+        "time": appointment["time"],
+        "reason": appointment["reason"],
+        "confirmationId": appointment["confirmationId"]
+    }
+
+def sync_appointment_to_calendar(payload):
+    """Outbox handler: create the Google Calendar event for a booked appointment"""
+    appointment = appointments.get(payload["confirmationId"])
+    if not appointment or appointment.get("calendar_synced"):
+        return
+    if not google_calendar_connected(appointment["doctor_id"]):
+        return  # Nothing to sync until the doctor connects Google Calendar
+    google_event_id = create_google_calendar_event(
+        appointment["patientInfo"], appointment["time"], appointment["reason"], appointment["doctor_id"],
+        appointment["confirmationId"])
+    if not google_event_id:
+        raise RuntimeError("Google Calendar event was not created")
+    appointments.update(appointment["confirmationId"], google_event_id=google_event_id, calendar_synced=True)
+
+def send_patient_confirmation(payload):
+    """Outbox handler: email the booking confirmation to the patient"""
+    appointment = appointments.get(payload["confirmationId"])
+    if not appointment or appointment.get("email_sent") or not sendgrid_configured():
+        return
+    if not send_appointment_confirmation_email(appointment["patientInfo"], appointment_details_for(appointment)):
+        raise RuntimeError("Confirmation email was not sent")
+    appointments.update(appointment["confirmationId"], email_sent=True)
+
+def send_doctor_notification(payload):
+    """Outbox handler: notify the doctor about a new booking"""
+    appointment = appointments.get(payload["confirmationId"])
+    if not appointment or appointment.get("doctor_notified") or not sendgrid_configured():
+        return
+    if not send_doctor_notification_email(DOCTOR_EMAIL, appointment["patientInfo"], appointment_details_for(appointment)):
+        raise RuntimeError("Doctor notification was not sent")
+    appointments.update(appointment["confirmationId"], doctor_notified=True)
+
+outbox_worker = OutboxWorker(appointments.outbox, {
+    "calendar_event": sync_appointment_to_calendar,
+    "patient_confirmation_email": send_patient_confirmation,
+    "doctor_notification_email": send_doctor_notification,
+}, max_workers=int(os.getenv("OUTBOX_WORKERS", "4")), retention=float(os.getenv("OUTBOX_RETENTION_DAYS", "7")) * 86400)
+
+# Pulls changes from each connected doctor's Google Calendar in the background
+calendar_sync = CalendarSyncEngine(
+    appointments,
+    get_google_calendar_service,
+    lambda: [doctor_id for doctor_id in doctors if google_calendar_connected(doctor_id)],
+    interval=int(os.getenv("CALENDAR_SYNC_INTERVAL", "60")),
+)
+
+# 24-hour and 1-hour reminders, sent by whichever worker holds the "reminders" lease
+reminders = ReminderScheduler(
+    appointments,
+    lambda: list(doctors),
+    send_reminder_batch,
+    tick=int(os.getenv("REMINDER_TICK", "30")),
+)
+
+def sync_from_google_calendar(doctor_id=None):
+    """Pull Google Calendar changes for a doctor (defaults to the logged-in one) right away"""
+    return calendar_sync.sync_doctor(doctor_id or current_user.get_id())
+
+# Request latency per route, and outbound call latency per integration
+# (recorded in utils.integrations), served in Prometheus format at /metrics
+REQUEST_LATENCY = metrics.histogram(
+    "clinic_http_request_duration_seconds",
+    "Time to handle a request, by route, method and status",
+    ("route", "method", "status"),
+)
+REQUEST_ERRORS = metrics.counter(
+    "clinic_http_request_errors_total",
+    "Requests answered with a 5xx status, by route and method",
+    ("route", "method"),
+)
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    # Streamed responses (SSE answers) are timed up to their first byte
+    started = g.pop("request_started", None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        REQUEST_LATENCY.observe(time.perf_counter() - started, route, request.method, str(response.status_code))
+        if response.status_code >= 500:
+            REQUEST_ERRORS.inc(route, request.method)
+    return response
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus scrape target; set METRICS_TOKEN to require a bearer token"""
+    token = os.getenv('METRICS_TOKEN')
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        return "Unauthorized", 401
+    return Response(metrics.REGISTRY.render(), content_type=metrics.CONTENT_TYPE)
+
+# Public endpoints that cost provider quota get per-client and route-wide
+# token buckets ("requests/seconds", "0" disables) and share a cap on
+# requests in flight; anything over is answered 429 with Retry-After
+admission = AdmissionController({
+    "ask": (parse_limit(os.getenv("RATE_LIMIT_ASK", "30/60")),
+            parse_limit(os.getenv("RATE_LIMIT_ASK_TOTAL", "600/60"))),
+    "book_appointment": (parse_limit(os.getenv("RATE_LIMIT_BOOK", "10/60")),
+                         parse_limit(os.getenv("RATE_LIMIT_BOOK_TOTAL", "300/60"))),
+}, max_concurrent=int(os.getenv("ADMISSION_MAX_CONCURRENT", "64")))
+
+ADMISSION_MESSAGES = {
+    "overloaded": "We're very busy right now. Please try again in a moment.",
+    "client_rate_limited": "Too many requests from your connection. Please wait a moment and try again.",
+    "route_rate_limited": "We're very busy right now. Please try again in a moment.",
+}
+
+@app.before_request
+def admit_request():
+    if request.endpoint not in admission.routes:
+        return None
+    rejection = admission.admit(request.endpoint, request.remote_addr)
+    if rejection:
+        message = ADMISSION_MESSAGES[rejection.reason]
+        # "response" is what the chat shows, "error" what the booking form shows
+        response = jsonify({"success": False, "error": message, "response": message})
+        response.status_code = 429
+        response.headers["Retry-After"] = str(rejection.retry_after)
+        return response
+    g.admission_release = admission.release
+    return None
+
+@app.after_request
+def release_admission_when_sent(response):
+    # A streamed answer keeps its slot until the last byte is sent
+    release = g.pop("admission_release", None)
+    if release is not None:
+        response.call_on_close(release)
+    return response
+
+@app.teardown_request
+def release_admission_on_error(exc):
+    release = g.pop("admission_release", None)
+    if release is not None:
+        release()
+
+@app.before_request
+def start_background_workers():
+    integrations.ensure_warmed()
+    outbox_worker.ensure_started()
+    calendar_services.ensure_refresher_started()
+    calendar_sync.ensure_started()
+    reminders.ensure_started()
+
+# Free/booked slot bitmaps per doctor, used for every conflict check
+availability = AvailabilityIndex(appointments)
+
+UNAVAILABLE_REASONS = {
+    "past": "That time has already passed.",
+    "closed": "That is outside clinic hours.",
+    "off_grid": "Appointments start on the hour.",
+    "booked": "That slot is already booked.",
+}
+
 # New appointment booking endpoint
 @app.route('/api/book-appointment', methods=['POST'])
 def book_appointment():
-    """Complete appointment booking with patient details and email notifications"""
+    """Complete appointment booking; calendar and email notifications are queued in the outbox.
+
+    Clients that may retry send the same ``Idempotency-Key`` header on every
+    attempt; a retry is answered with the first attempt's response (marked
+    ``Idempotent-Replayed: true``) and books nothing. Keys live in the
+    appointment store (``appointments.idempotency``), so a retry reaching
+    another worker is answered the same way.
+    """
+    idempotency = appointments.idempotency
+    key = request.headers.get('Idempotency-Key')
+    if key is None:
+        return jsonify(book_from_request()[0])
+    if not valid_key(key):
+        return jsonify({"success": False, "error": "Invalid Idempotency-Key header."}), 400
+    try:
+        replay = idempotency.begin("book_appointment", key, fingerprint(request.get_json(silent=True)))
+    except IdempotencyConflict as e:
+        return jsonify({"success": False, "error": e.message}), e.status
+    if replay is not None:
+        response = jsonify(replay)
+        response.headers["Idempotent-Replayed"] = "true"
+        return response
+    result, final = None, False
+    try:
+        result, final = book_from_request(key)
+    finally:
+        # A booking stored its response along with the appointment; a
+        # failure worth retrying is forgotten, so the retry runs again
+        if not final:
+            idempotency.abandon("book_appointment", key)
+        elif not result["success"]:
+            idempotency.finish("book_appointment", key, result)
+    return jsonify(result)
+
+def book_from_request(idempotency_key=None):
+    """(response JSON, whether it is final) for the booking in the request body.
+
+    With idempotency_key, a successful booking's response is recorded for
+    that key in the same write as the appointment.
+    """
     try:
         data = request.json
         patient_info = data.get('patientInfo', {})
         health_concern = data.get('healthConcern', '')
-        appointment_time = data.get('appointmentTime', '')
+        # Canonicalise so the confirmation, conflict check and calendar event agree
+        slot = parse_appointment_time(data.get('appointmentTime', ''))
+        appointment_time = slot.label
         location = data.get('location', '')
         
         # Generate confirmation ID
@@ -470,137 +602,376 @@ def book_appointment():
             "patient": f"{patient_info['firstName']} {patient_info['lastName']}",
             "patientInfo": patient_info,
             "time": appointment_time,
+            "start": slot.start.isoformat(),
             "reason": health_concern,
             "location": location,
             "doctor_id": "drlee",  # Default doctor
             "status": "confirmed",
             "confirmationId": confirmation_id,
             "bookedAt": datetime.now().isoformat(),
-            "source": "patient_portal"
+            "source": "patient_portal",
+            "calendar_synced": False,
+            "email_sent": False
         }
         
-        # Check for conflicts one more time
-        existing = next((apt for apt in appointments 
-                        if apt.get("time") == appointment_time and 
-                        apt.get("doctor_id") == "drlee"), None)
-        
-        if existing:
-            return jsonify({
-                "success": False,
-                "error": "This time slot is no longer available. Please choose a different time."
-            })
-        
-        # Add to appointments
-        appointments.append(appointment)
-        
-        # Create Google Calendar event
-        google_event_id = create_google_calendar_event(patient_info, appointment_time, health_concern)
-        if google_event_id:
-            appointment["google_event_id"] = google_event_id
-        
-        # Send confirmation email to patient
-        appointment_details = {
-            "time": appointment_time,
-            "reason": health_concern,
-            "confirmationId": confirmation_id
-        }
-        
-        email_sent = send_appointment_confirmation_email(patient_info, appointment_details)
-        
-        # Send notification to doctor (you can add doctor's email here)
-        doctor_email = "doctor@clinic.com"  # Replace with actual doctor email
-        send_doctor_notification_email(doctor_email, patient_info, appointment_details)
-        
-        return jsonify({
+        result = {
             "success": True,
             "confirmationId": confirmation_id,
             "message": f"Appointment confirmed for {appointment_time}",
-            "emailSent": email_sent
-        })
+            "emailQueued": sendgrid_configured()
+        }
+        idempotent = ("book_appointment", idempotency_key, result) if idempotency_key else None
+
+        # The availability check and the insert happen as one step per doctor,
+        # so two patients submitting overlapping times cannot both get them
+        unavailable = availability.book(appointment, slot.start, outbox_tasks=booking_tasks(confirmation_id),
+                                        idempotent=idempotent)
+        if unavailable:
+            return {
+                "success": False,
+                "error": f"{UNAVAILABLE_REASONS[unavailable]} Please choose a different time."
+            }, True
+        outbox_worker.wake()
+        
+        return result, True
         
     except Exception as e:
         print(f"Error booking appointment: {e}")
-        return jsonify({
+        return {
             "success": False,
             "error": "Failed to book appointment. Please try again."
-        })
+        }, False
 
 # Keep all existing routes and functions...
 # (I'll include the key ones but keeping the same structure)
 
+BOOKING_HINT = "If you'd like to schedule an appointment, please mention 'appointment' or 'book' in your message."
+
+def server_sent_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
 @app.route('/api/ask', methods=['POST'])
 def ask():
+    """Answer a patient message.
+
+    Appointment requests get an availability check; other messages are
+    health inquiries answered by the model when one is configured. Clients
+    that send ``Accept: text/event-stream`` receive the answer as
+    server-sent ``token`` events followed by a ``done`` event carrying the
+    same JSON the non-streaming response returns.
+    """
     data = request.json
     user_input = data.get("message")
     location = data.get("location", "unknown")
+    stream = "text/event-stream" in request.headers.get("Accept", "")
 
     # Handle appointment requests with availability check
     name = "New Patient"
     reason = user_input
-    time = "Tomorrow 10 AM"  # Default placeholder
-    
-    # Extract time from user input
-    if "friday" in user_input.lower():
-        if "10" in user_input or "10am" in user_input.lower():
-            time = "Friday 10:00 AM"
-        else:
-            time = "Friday Morning"
-    elif "saturday" in user_input.lower():
-        if "11" in user_input or "11am" in user_input.lower():
-            time = "Saturday 11:00 AM"
-        else:
-            time = "Saturday Morning"
-    elif "sunday" in user_input.lower():
-        if "9" in user_input or "9am" in user_input.lower():
-            time = "Sunday 9:00 AM"
-        else:
-            time = "Sunday Morning"
-    elif "monday" in user_input.lower():
-        if "2" in user_input or "2pm" in user_input.lower():
-            time = "Monday 2:00 PM"
-        else:
-            time = "Monday Afternoon"
-    elif "tomorrow" in user_input.lower():
-        time = "Tomorrow 10:00 AM"
-    elif "today" in user_input.lower():
-        time = "Today (if available)"
+    lowered = user_input.lower()
+    payload = None
     
     # Check for appointment request keywords
-    if any(word in user_input.lower() for word in ["appointment", "book", "schedule", "see doctor", "visit", "consultation"]):
-        # Check if this time slot is already taken
-        existing_appointment = next((apt for apt in appointments if apt.get("time") == time and apt.get("doctor_id") == "drlee"), None)
-        
-        if existing_appointment:
-            response_text = f"❌ Sorry, Dr. Lee is not available at {time}. That slot is already booked. Please try a different time."
+    if any(word in lowered for word in ["appointment", "book", "schedule", "see doctor", "visit", "consultation"]):
+        slot = parse_appointment_time(user_input)
+        time = slot.label
+        # Check if this time slot is free
+        unavailable = availability.check("drlee", slot.start)
+        
+        if unavailable:
+            response_text = f"❌ Sorry, Dr. Lee is not available at {time}. {UNAVAILABLE_REASONS[unavailable]}"
+            next_slot = availability.next_free("drlee", slot.start)
+            if next_slot:
+                response_text += f" The next free slot is {format_slot(next_slot)}."
+            else:
+                response_text += " Please try a different time."
+            payload = {"response": response_text}
         else:
             # Show availability and ask for confirmation
             response_text = f"✅ Great! Dr. Lee is available at {time} for your concern: '{reason}'. Would you like to book this appointment?"
-    else:
+            payload = {"response": response_text, "appointment": {"time": time, "start": slot.start.isoformat()}}
+    elif not assistant_configured():
         # Just health inquiry, don't check availability
-        response_text = f"Thank you for your health inquiry about '{reason}'. If you'd like to schedule an appointment, please mention 'appointment' or 'book' in your message."
+        payload = {"response": f"Thank you for your health inquiry about '{reason}'. {BOOKING_HINT}"}
+
+    if not stream:
+        if payload is None:
+            try:
+                payload = {"response": f"{assistant.answer(user_input)}\n\n{BOOKING_HINT}"}
+            except Exception as e:
+                print(f"Error answering health inquiry: {e}")
+                payload = {"response": f"Thank you for your health inquiry about '{reason}'. {BOOKING_HINT}"}
+        return jsonify(payload)
 
-    return jsonify({"response": response_text})
+    def events():
+        if payload is not None:
+            yield server_sent_event("done", payload)
+            return
+        parts = []
+        try:
+            for text in assistant.stream(user_input):
+                parts.append(text)
+                yield server_sent_event("token", {"text": text})
+        except Exception as e:
+            print(f"Error streaming health inquiry answer: {e}")
+            if not parts:
+                parts.append(f"Thank you for your health inquiry about '{reason}'.")
+                yield server_sent_event("token", {"text": parts[-1]})
+        hint = f"\n\n{BOOKING_HINT}"
+        yield server_sent_event("token", {"text": hint})
+        yield server_sent_event("done", {"response": "".join(parts) + hint})
+
+    return Response(stream_with_context(events()), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 # Keep all existing Google Calendar and clinic routes...
 # (Including sync_from_google_calendar, parse_appointment_command, etc.)
 
+@app.route('/api/availability')
+def availability_api():
+    """Free appointment slots for a doctor over a range of days.
+
+    Query parameters: doctor_id (default drlee), start (YYYY-MM-DD, default
+    today) and days (default 7, at most 31).
+    """
+    doctor_id = request.args.get("doctor_id", "drlee")
+    if doctor_id not in doctors:
+        return jsonify({"error": "Unknown doctor"}), 404
+    try:
+        start = request.args.get("start")
+        first_day = datetime.strptime(start, "%Y-%m-%d").date() if start else datetime.now(CLINIC_TIMEZONE).date()
+        days = min(max(int(request.args.get("days", 7)), 1), 31)
+    except ValueError:
+        return jsonify({"error": "start must be YYYY-MM-DD and days a number"}), 400
+    slots = availability.free_slots(doctor_id, first_day, days)
+    return jsonify({
+        "doctor_id": doctor_id,
+        "start": first_day.isoformat(),
+        "days": days,
+        "slots": [{"start": slot.isoformat(), "time": format_slot(slot)} for slot in slots],
+    })
+
+@app.route('/api/integrations/stats')
+@login_required
+def integration_stats():
+    """Connection pool and request counters for each outbound integration"""
+    return jsonify(dict(integrations.pool_stats(), ask_cache=assistant.cache.stats()))
+
 @app.route('/clinic')
 @login_required
 def clinic_dashboard():
-    # Sync with Google Calendar when loading dashboard
-    try:
-        sync_from_google_calendar()
-    except:
-        pass  # Don't fail if sync fails
-    
+    # Appointments are fetched page by page from /api/appointments by the
+    # dashboard script; Google Calendar changes are pulled in the background
     doc_id = current_user.get_id()
-    filtered = [a for a in appointments if a.get("doctor_id") == doc_id]
+    search_index.warm(doc_id)
     
     # Check if Google Calendar is connected
-    token_file = f'token_{doc_id}.json'
-    google_connected = os.path.exists(token_file)
+    google_connected = google_calendar_connected(doc_id)
     
-    return render_template("clinic.html", appointments=filtered, google_connected=google_connected)
+    page = pages.get(("clinic", doc_id, google_connected),
+                     lambda: render_template("clinic.html", google_connected=google_connected,
+                                             ics_feed_url=ics_feed_url(doc_id)))
+    return page.response("private, no-cache")
+
+# Read-only calendar subscription per doctor, served from the local store so
+# subscribed clients never touch the Google Calendar API. The token in the
+# URL is derived from ICS_FEED_SECRET, so changing it revokes every feed.
+# Without ICS_FEED_SECRET there are no feeds: any other key in the repo
+# would let anyone compute a doctor's feed URL.
+ICS_FEED_SECRET = os.getenv("ICS_FEED_SECRET")
+ics_feeds = IcsFeed(appointments, ICS_FEED_SECRET) if ICS_FEED_SECRET else None
+
+def ics_feed_url(doctor_id):
+    # Relative on purpose: the clinic page that shows it is cached across
+    # requests, so the page script resolves it against its own location
+    # rather than freezing the first request's scheme and host into it.
+    if ics_feeds is None:
+        return None
+    return url_for("ics_feed", doctor_id=doctor_id, token=ics_feeds.token_for(doctor_id))
+
+@app.route('/calendar/<doctor_id>.ics')
+def ics_feed(doctor_id):
+    if ics_feeds is None or doctor_id not in doctors or not ics_feeds.verify(doctor_id, request.args.get("token")):
+        return "Not found", 404
+    return ics_feeds.get(doctor_id).response("private, no-cache")
+
+def encode_cursor(appointment):
+    key = json.dumps([order_key(appointment), appointment["confirmationId"]])
+    return base64.urlsafe_b64encode(key.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor):
+    padded = cursor + "=" * (-len(cursor) % 4)
+    key, confirmation_id = json.loads(base64.urlsafe_b64decode(padded))
+    return str(key), str(confirmation_id)
+
+@app.route('/api/appointments')
+@login_required
+def list_appointments():
+    """One page of the logged-in doctor's appointments, in time order.
+
+    Query parameters: start and end (YYYY-MM-DD, inclusive), status, limit
+    (default 50, at most 200) and cursor (next_cursor from the previous
+    page). The ETag changes whenever any of the doctor's appointments does,
+    so a revalidation of an unchanged view is answered with 304.
+    """
+    doc_id = current_user.get_id()
+    # Read the version before the page: a change in between only makes the ETag stale, never the data
+    etag = f"{doc_id}-{appointments.data_version(doc_id)}"
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        try:
+            start = request.args.get("start")
+            end = request.args.get("end")
+            start_key = datetime.strptime(start, "%Y-%m-%d").date().isoformat() if start else None
+            end_key = (datetime.strptime(end, "%Y-%m-%d").date() + timedelta(days=1)).isoformat() if end else None
+            cursor = request.args.get("cursor")
+            after = decode_cursor(cursor) if cursor else None
+        except (TypeError, ValueError):
+            return jsonify({"error": "start and end must be YYYY-MM-DD and cursor must come from next_cursor"}), 400
+        limit = min(max(request.args.get("limit", 50, type=int), 1), 200)
+        page = appointments.page_for_doctor(doc_id, start_key, end_key, after=after, limit=limit,
+                                            status=request.args.get("status") or None)
+        response = jsonify({
+            "appointments": page,
+            "next_cursor": encode_cursor(page[-1]) if len(page) == limit else None,
+        })
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response
+
+# Patient and appointment search for the dashboard, kept up to date from the
+# store's change notifications (bookings, syncs, imports, updates)
+search_index = SearchIndex(appointments).attach()
+
+@app.route('/api/appointments/search')
+@login_required
+def search_appointments():
+    """The logged-in doctor's appointments best matching q (name, phone, email,
+    medical ID, confirmation ID or complaint; any word may be just the start
+    of one). limit defaults to 20, at most 100.
+    """
+    limit = min(max(request.args.get("limit", 20, type=int), 1), 100)
+    results = search_index.search(current_user.get_id(), request.args.get("q", ""), limit=limit)
+    response = jsonify({"results": results})
+    response.headers["Cache-Control"] = "private, no-store"
+    return response
+
+@app.route('/api/google-calendar-sync', methods=['POST'])
+@login_required
+def google_calendar_sync():
+    """Sync the logged-in doctor's Google Calendar now instead of waiting for the next background pass"""
+    try:
+        processed = sync_from_google_calendar()
+    except Exception as e:
+        print(f"Error syncing Google Calendar: {e}")
+        return jsonify({"success": False, "error": "Google Calendar sync failed. Please try again."})
+    if processed is None:
+        return jsonify({"success": False, "error": "Google Calendar is not connected."})
+    return jsonify({"success": True, "message": f"✅ Synced {processed} changed event(s) from Google Calendar."})
+
+@app.route('/api/google-calendar-sync/status')
+@login_required
+def google_calendar_sync_status():
+    """Events processed per second and lag of the last sync, per doctor"""
+    return jsonify(calendar_sync.status())
+
+def bulk_update_appointments(doctor_id, action, changes):
+    """Reschedule or cancel many appointments, sending their calendar writes as batch requests"""
+    results = {}
+    operations = []
+    for change in changes:
+        confirmation_id = change.get("confirmationId")
+        appointment = appointments.get(confirmation_id)
+        if not appointment or appointment.get("doctor_id") != doctor_id:
+            results[confirmation_id] = {"ok": False, "error": "Appointment not found"}
+            continue
+        google_event_id = appointment.get("google_event_id")
+        if action == "reschedule":
+            new_slot = parse_appointment_time(change.get("time", ""))
+            new_time = new_slot.label
+            unavailable = availability.reschedule(appointment, new_slot.start, new_time)
+            if unavailable:
+                results[confirmation_id] = {"ok": False, "error": f"{new_time}: {UNAVAILABLE_REASONS[unavailable]}"}
+                continue
+            if google_event_id:
+                operations.append(CalendarOperation(confirmation_id, "patch", google_event_id, event_times(new_time)))
+        else:
+            availability.released(appointments.remove(confirmation_id))
+            if google_event_id:
+                operations.append(CalendarOperation(confirmation_id, "delete", google_event_id))
+        results[confirmation_id] = {"ok": True}
+
+    round_trips = 0
+    service = get_google_calendar_service(doctor_id) if operations else None
+    if service:
+        calendar_results, round_trips = batch_calendar_writes(
+            service, operations, breaker=integrations.breaker("google_calendar"))
+        for result in calendar_results:
+            results[result.key]["calendar"] = result.as_dict()
+            if result.ok and result.kind == "patch" and result.event:
+                # Record the new version so the next sync does not re-apply our own change
+                appointments.update(result.key, google_updated=result.event.get("updated"))
+    return results, round_trips
+
+@app.route('/api/appointments/bulk', methods=['POST'])
+@login_required
+def bulk_appointments():
+    """Bulk reschedule or cancel, e.g. moving an afternoon or cancelling a day.
+
+    Body: {"action": "reschedule", "changes": [{"confirmationId": ..., "time": ...}]}
+       or {"action": "cancel", "confirmationIds": [...]}
+    """
+    data = request.json or {}
+    action = data.get("action")
+    if action == "reschedule":
+        changes = data.get("changes", [])
+    elif action == "cancel":
+        changes = [{"confirmationId": cid} for cid in data.get("confirmationIds", [])]
+    else:
+        return jsonify({"success": False, "error": "action must be 'reschedule' or 'cancel'"}), 400
+
+    results, round_trips = bulk_update_appointments(current_user.get_id(), action, changes)
+    return jsonify({
+        "success": all(r["ok"] and r.get("calendar", {}).get("ok", True) for r in results.values()),
+        "results": results,
+        "calendarRoundTrips": round_trips
+    })
+
+@app.route('/api/appointments/import', methods=['POST'])
+@login_required
+def import_appointments():
+    """Import the logged-in doctor's existing appointments from CSV or JSONL.
+
+    Send the file as the raw request body (Content-Type text/csv or
+    application/x-ndjson) or as the "file" field of a multipart upload; it
+    is read row by row, never held in memory whole. Query parameters:
+    notify=1 queues confirmation emails, calendar=1 queues Google Calendar
+    events, batch_size sets rows per transaction (default 500).
+    """
+    upload = request.files.get("file")
+    if upload is not None:
+        stream, fmt = upload.stream, detect_format(upload.filename or "", upload.content_type or "")
+    else:
+        stream, fmt = request.stream, detect_format(content_type=request.content_type or "")
+    fmt = request.args.get("format", fmt)
+    if fmt not in ("csv", "jsonl"):
+        return jsonify({"success": False, "error": "format must be 'csv' or 'jsonl'"}), 400
+
+    side_effects = []
+    if request.args.get("calendar") == "1":
+        side_effects.append("calendar_event")
+    if request.args.get("notify") == "1":
+        side_effects += ["patient_confirmation_email", "doctor_notification_email"]
+    importer = AppointmentImporter(
+        appointments, availability, doctors, current_user.get_id(),
+        batch_size=min(max(request.args.get("batch_size", 500, type=int), 1), 5000),
+        side_effects=side_effects,
+    )
+    report = importer.run(iter_rows(stream, fmt))
+    if side_effects and report["imported"]:
+        outbox_worker.wake()
+    return jsonify(dict(report, success=report["failed"] == 0))
 
 # Include all other existing routes...
 # (OAuth routes, clinic-ai, etc.)
@@ -0,0 +1,94 @@
+"""Patient latency on /api/ask while one client floods it, with and without admission control.
+
+Requests are served by a fixed pool of --server-threads, standing in for
+gunicorn's worker threads, so a flood that is admitted queues in front of
+everyone else. One flooding address sends --flood requests as fast as it
+can while --patients addresses each ask a few questions; every question
+is distinct, so none is answered from the cache, and the stub model takes
+CLINIC_STUB_LATENCY_MS per answer. Latency is measured from submission
+to the last byte, queueing included.
+
+Run from the repository root:
+
+    python benchmarks/bench_admission.py [--flood 400] [--patients 20] [--server-threads 8]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+os.environ.setdefault("CLINIC_STUB_INTEGRATIONS", "1")
+os.environ.setdefault("CLINIC_STUB_LATENCY_MS", "50")
+os.environ.setdefault("INTEGRATION_WARMUP", "0")
+os.environ.setdefault("APPOINTMENT_STORE_URL", "memory://")
+os.environ.setdefault("OUTBOX_DB", os.path.join(tempfile.mkdtemp(), "outbox.db"))
+
+import app as clinic
+from utils.admission import AdmissionController, parse_limit
+
+
+def percentile(values, share):
+    values = sorted(values)
+    return values[min(len(values) - 1, max(0, round(share * len(values)) - 1))] if values else float("nan")
+
+
+def run(label, controller, args):
+    clinic.admission = controller
+    clinic.assistant.cache._entries.clear()
+    pool = ThreadPoolExecutor(max_workers=args.server_threads)
+    results = {"patient": [], "flood": []}
+    lock = threading.Lock()
+    counter = iter(range(10 ** 9))
+
+    def ask(kind, address):
+        submitted = time.perf_counter()
+
+        def serve():
+            client = clinic.app.test_client()
+            response = client.post("/api/ask", json={"message": f"question {next(counter)} about a headache?"},
+                                   headers={"Accept": "text/event-stream"},
+                                   environ_base={"REMOTE_ADDR": address}, buffered=True)
+            with lock:
+                results[kind].append((time.perf_counter() - submitted, response.status_code))
+
+        return pool.submit(serve)
+
+    futures = [ask("flood", "203.0.113.66") for _ in range(args.flood)]
+    for round_ in range(args.questions):
+        for patient in range(args.patients):
+            futures.append(ask("patient", f"198.51.100.{patient + 1}"))
+        time.sleep(0.05)
+    for future in futures:
+        future.result()
+    pool.shutdown()
+
+    for kind in ("patient", "flood"):
+        latencies = [latency * 1000 for latency, _ in results[kind]]
+        ok = [latency * 1000 for latency, status in results[kind] if status == 200]
+        shed = [latency * 1000 for latency, status in results[kind] if status == 429]
+        print(f"{label:18} {kind:8} {len(ok):6} {len(shed):6} {percentile(latencies, .5):9.1f} "
+              f"{percentile(latencies, .99):9.1f} {percentile(shed, .5):9.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--flood", type=int, default=400)
+    parser.add_argument("--patients", type=int, default=20)
+    parser.add_argument("--questions", type=int, default=3, help="questions per patient")
+    parser.add_argument("--server-threads", type=int, default=8)
+    args = parser.parse_args()
+
+    print(f"{'':18} {'client':8} {'200s':>6} {'429s':>6} {'p50 ms':>9} {'p99 ms':>9} {'429 ms':>9}")
+    run("no admission", AdmissionController({}, max_concurrent=0), args)
+    run("admission control", AdmissionController(
+        {"ask": (parse_limit("30/60"), parse_limit("600/60"))}, max_concurrent=args.server_threads * 2), args)
+
+
+if __name__ == "__main__":
+    main()
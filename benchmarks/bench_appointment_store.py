@@ -0,0 +1,78 @@
+"""Booking-path latency of MemoryAppointmentStore as the number of stored appointments grows.
+
+"book" adds appointments after every stored one, "book mid" adds them in
+the middle of the doctor's timeline, as booking an earlier slot does.
+
+Run from the repository root:
+
+    python benchmarks/bench_appointment_store.py [--sizes 1000,10000,100000,1000000]
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.appointment_store import MemoryAppointmentStore
+
+DOCTORS = ["drlee", "drsmith", "drpatel", "drgomez"]
+DAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
+
+def make_appointment(i, base, minute=None):
+    doctor_id = DOCTORS[i % len(DOCTORS)]
+    booked_at = base + timedelta(minutes=i if minute is None else minute)
+    return {
+        "patient": f"Patient {i}",
+        "patientInfo": {"firstName": "Patient", "lastName": str(i)},
+        "time": f"{DAYS[i % 7]} slot {i}",
+        "reason": "checkup",
+        "location": "",
+        "doctor_id": doctor_id,
+        "status": "confirmed",
+        "confirmationId": f"AC{i:010d}",
+        "bookedAt": booked_at.isoformat(),
+        "source": "patient_portal",
+    }
+
+
+def per_op_us(fn, iterations):
+    start = time.perf_counter()
+    for i in range(iterations):
+        fn(i)
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def run(size, iterations):
+    base = datetime(2025, 1, 1)
+    store = MemoryAppointmentStore()
+    for i in range(size):
+        store.add(make_appointment(i, base))
+
+    window_start = (base + timedelta(minutes=size // 2)).isoformat()
+    window_end = (base + timedelta(minutes=size // 2 + 7 * 24 * 60)).isoformat()
+
+    conflict = per_op_us(lambda i: store.find_conflict("drlee", f"Friday slot {i}"), iterations)
+    book = per_op_us(lambda i: store.add(make_appointment(size + i, base)), iterations)
+    middle = size // 2
+    book_mid = per_op_us(lambda i: store.add(make_appointment(size + iterations + i, base, middle)), iterations)
+    week = per_op_us(lambda i: store.for_doctor_between("drlee", window_start, window_end), iterations)
+    return conflict, book, book_mid, week
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="1000,10000,100000,1000000")
+    parser.add_argument("--iterations", type=int, default=10000)
+    args = parser.parse_args()
+
+    print(f"{'stored':>10}  {'conflict us':>12}  {'book us':>10}  {'book mid us':>12}  {'week query us':>14}")
+    for size in (int(s) for s in args.sizes.split(",")):
+        conflict, book, book_mid, week = run(size, args.iterations)
+        print(f"{size:>10}  {conflict:>12.2f}  {book:>10.2f}  {book_mid:>12.2f}  {week:>14.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""Latency of availability queries against a busy doctor's schedule.
+
+Books a share of every working slot over several weeks, then times a slot
+check and multi-day free-slot queries on the bitmap index, alongside the
+old approach of testing each candidate slot against the store one by one.
+Also times the first check after a booking made behind the index's back
+(as by another worker), which rebuilds only the day that changed, against
+rebuilding the whole schedule.
+
+Run from the repository root:
+
+    python benchmarks/bench_availability.py [--weeks 8] [--iterations 2000]
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.appointment_store import MemoryAppointmentStore
+from utils.availability import AvailabilityIndex
+from utils.time_parser import CLINIC_TIMEZONE, format_slot
+
+
+def busy_store(weeks):
+    store = MemoryAppointmentStore()
+    first = datetime.now(CLINIC_TIMEZONE).replace(hour=9, minute=0, second=0, microsecond=0) + timedelta(days=1)
+    for day in range(weeks * 7):
+        for hour in range(8):
+            if (day + hour) % 3 == 0:
+                continue
+            start = first + timedelta(days=day, hours=hour)
+            store.add({
+                "confirmationId": f"AC{day:04d}{hour:02d}",
+                "doctor_id": "drlee",
+                "time": format_slot(start),
+                "start": start.isoformat(),
+                "bookedAt": datetime.now().isoformat(),
+            })
+    return store, first
+
+
+def per_op_us(fn, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--weeks", type=int, default=8)
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    store, first = busy_store(args.weeks)
+    index = AvailabilityIndex(store)
+    index.free_slots("drlee", first.date(), 1)  # build the bitmaps once
+
+    candidate = first + timedelta(days=2, hours=3)
+    check_us = per_op_us(lambda: index.check("drlee", candidate), args.iterations)
+    week_us = per_op_us(lambda: index.free_slots("drlee", first.date(), 7), args.iterations)
+    month_us = per_op_us(lambda: index.free_slots("drlee", first.date(), 31), args.iterations)
+
+    def slot_by_slot(days):
+        free = []
+        for day in range(days):
+            for hour in range(24):
+                start = first + timedelta(days=day, hours=hour - 9)
+                if not store.find_conflict("drlee", format_slot(start)):
+                    free.append(start)
+        return free
+
+    scan_iterations = max(1, args.iterations // 50)
+    scan_us = per_op_us(lambda: slot_by_slot(7), scan_iterations)
+
+    # A slot the busy pattern leaves free, booked and cancelled by "another worker"
+    outside = first + timedelta(days=3)
+    booking = {"confirmationId": "ACOUTSIDE", "doctor_id": "drlee", "time": format_slot(outside),
+               "start": outside.isoformat(), "bookedAt": datetime.now().isoformat()}
+
+    def outside_change(rebuild):
+        if store.get("ACOUTSIDE"):
+            store.remove("ACOUTSIDE")
+        else:
+            store.add(booking)
+        (AvailabilityIndex(store) if rebuild else index).check("drlee", candidate)
+
+    rebuild_iterations = max(1, args.iterations // 10)
+    catch_up_us = per_op_us(lambda: outside_change(False), rebuild_iterations)
+    rebuild_us = per_op_us(lambda: outside_change(True), rebuild_iterations)
+
+    print(f"{len(store)} appointments over {args.weeks} weeks")
+    print(f"check one slot:              {check_us:9.1f} us")
+    print(f"free slots, 7 days:          {week_us:9.1f} us  ({len(index.free_slots('drlee', first.date(), 7))} slots)")
+    print(f"free slots, 31 days:         {month_us:9.1f} us")
+    print(f"slot-by-slot scan, 7 days:   {scan_us:9.1f} us  ({scan_iterations} iterations)")
+    print(f"outside change, changed day: {catch_up_us:9.1f} us")
+    print(f"outside change, full rebuild:{rebuild_us:9.1f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""Concurrent booking stress test: double bookings and throughput per locking scheme.
+
+Hundreds of threads book random times on the hour and half hour for 1
+to N doctors at once; check() refuses the half-hour starts as off the
+appointment grid, so those attempts only add contention.
+Every store write waits --write-ms, standing in for a database round trip
+made while the doctor's lock is held. Four schemes are compared:
+
+    check, then add    the old path: availability check, then an unlocked insert
+    global lock        AvailabilityIndex.book() with a single lock for everyone
+    striped by doctor  AvailabilityIndex.book() as the app uses it
+    two workers        threads split between two indexes with separate locks,
+                       as in two gunicorn workers; only the store's
+                       compare-and-set on schedule_version keeps them apart
+
+The locked rows must show no double bookings, and only the striped rows
+should speed up as doctors are added. The check-then-add rows are there
+for throughput: the store refuses a second appointment with the same
+doctor and time, and on the hour grid that is the only way two bookings
+can overlap, so they show none either. Exits non-zero if a locked scheme
+double-books. tests/test_booking_concurrency.py asserts one booking per
+contended slot.
+
+Run from the repository root:
+
+    python benchmarks/bench_booking_contention.py [--threads 200] [--attempts 5]
+        [--doctors 1,2,4,8,16] [--write-ms 2] [--store memory|sqlite]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.appointment_store import MemoryAppointmentStore, SlotTakenError
+from utils.availability import APPOINTMENT_MINUTES, AvailabilityIndex
+from utils.striped_lock import StripedLock
+from utils.time_parser import CLINIC_TIMEZONE, format_slot
+
+
+class SlowWrites:
+    """Store proxy whose add() takes write_seconds longer"""
+
+    def __init__(self, store, write_seconds):
+        self._store = store
+        self._write_seconds = write_seconds
+
+    def add(self, *args, **kwargs):
+        time.sleep(self._write_seconds)
+        return self._store.add(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._store, name)
+
+
+def make_store(kind):
+    if kind == "sqlite":
+        from utils.sqlite_store import SQLiteAppointmentStore
+        return SQLiteAppointmentStore(os.path.join(tempfile.mkdtemp(), "contention.db"))
+    return MemoryAppointmentStore()
+
+
+def candidate_starts(days=20):
+    first = datetime.now(CLINIC_TIMEZONE).replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
+    starts = []
+    for day in range(days * 7 // 5 + 2):
+        date = first + timedelta(days=day)
+        if date.weekday() >= 5:
+            continue
+        for minutes in range(9 * 60, 16 * 60 + 1, 30):
+            starts.append(date + timedelta(minutes=minutes))
+    return starts
+
+
+def double_bookings(store, doctor_ids):
+    overlaps = 0
+    for doctor_id in doctor_ids:
+        starts = sorted(datetime.fromisoformat(a["start"]) for a in store.for_doctor(doctor_id))
+        overlaps += sum(1 for a, b in zip(starts, starts[1:]) if b - a < timedelta(minutes=APPOINTMENT_MINUTES))
+    return overlaps
+
+
+def run(scheme, doctors, args, starts):
+    store = SlowWrites(make_store(args.store), args.write_ms / 1000)
+    locks = StripedLock(1) if scheme == "global lock" else StripedLock()
+    indexes = [AvailabilityIndex(store, booking_locks=locks)]
+    if scheme == "two workers":
+        indexes.append(AvailabilityIndex(store))
+    doctor_ids = [f"doctor{i}" for i in range(doctors)]
+    barrier = threading.Barrier(args.threads)
+    booked = []
+
+    def work(seed):
+        rng = random.Random(seed)
+        availability = indexes[seed % len(indexes)]
+        barrier.wait()
+        for attempt in range(args.attempts):
+            start = rng.choice(starts)
+            appointment = {
+                "confirmationId": f"C{seed}-{attempt}",
+                "doctor_id": rng.choice(doctor_ids),
+                "time": format_slot(start),
+                "start": start.isoformat(),
+                "bookedAt": datetime.now().isoformat(),
+            }
+            if scheme == "check, then add":
+                if availability.check(appointment["doctor_id"], start):
+                    continue
+                try:
+                    store.add(appointment)
+                except SlotTakenError:
+                    continue
+                availability.booked(appointment)
+                booked.append(1)
+            elif availability.book(appointment, start) is None:
+                booked.append(1)
+
+    threads = [threading.Thread(target=work, args=(seed,)) for seed in range(args.threads)]
+    for thread in threads:
+        thread.start()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    seconds = time.perf_counter() - started
+    return len(booked) / seconds, len(booked), double_bookings(store, doctor_ids)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--threads", type=int, default=200)
+    parser.add_argument("--attempts", type=int, default=5, help="bookings attempted per thread")
+    parser.add_argument("--doctors", default="1,2,4,8,16")
+    parser.add_argument("--write-ms", type=float, default=2.0)
+    parser.add_argument("--store", choices=("memory", "sqlite"), default="memory")
+    args = parser.parse_args()
+
+    starts = candidate_starts()
+    failed = False
+    print(f"{'scheme':20} {'doctors':>7} {'bookings/s':>11} {'booked':>7} {'double':>7}")
+    for scheme in ("check, then add", "global lock", "striped by doctor", "two workers"):
+        for doctors in [int(d) for d in args.doctors.split(",")]:
+            rate, booked, doubles = run(scheme, doctors, args, starts)
+            print(f"{scheme:20} {doctors:7} {rate:11.0f} {booked:7} {doubles:7}")
+            failed = failed or (doubles and scheme != "check, then add")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,60 @@
+"""Booking request latency with calendar and email side effects moved to the outbox.
+
+Runs the Flask app in-process with the offline SendGrid/Google stubs, each
+call delayed by --stub-latency-ms. Reports how long /api/book-appointment
+takes and how long until the outbox has delivered every side effect.
+
+Run from the repository root:
+
+    python benchmarks/bench_booking_latency.py [--bookings 50] [--stub-latency-ms 200]
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--bookings", type=int, default=50)
+    parser.add_argument("--stub-latency-ms", type=int, default=200)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    os.environ.setdefault("OPENAI_API_KEY", "offline")
+    os.environ["CLINIC_STUB_INTEGRATIONS"] = "1"
+    os.environ["CLINIC_STUB_LATENCY_MS"] = str(args.stub_latency_ms)
+    os.environ["APPOINTMENT_STORE_URL"] = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+
+    import app as clinic
+
+    client = clinic.app.test_client()
+    patient = {"firstName": "Bench", "lastName": "Patient", "age": 40, "gender": "other",
+               "email": "patient@example.com", "phone": "5550100"}
+    latencies = []
+    start = time.perf_counter()
+    for i in range(args.bookings):
+        t0 = time.perf_counter()
+        response = client.post("/api/book-appointment", json={
+            "patientInfo": patient, "healthConcern": "checkup", "appointmentTime": f"Slot {i}"})
+        latencies.append(time.perf_counter() - t0)
+        assert response.json["success"], response.json
+
+    while clinic.appointments.outbox.counts().get("pending") or clinic.appointments.outbox.counts().get("running"):
+        time.sleep(0.01)
+    drained = time.perf_counter() - start
+
+    latencies.sort()
+    print(f"stub latency per remote call: {args.stub_latency_ms} ms (3 calls per booking)")
+    print(f"booking p50: {statistics.median(latencies) * 1000:.1f} ms")
+    print(f"booking p99: {latencies[int(len(latencies) * 0.99) - 1] * 1000:.1f} ms")
+    print(f"all side effects delivered after {drained:.2f} s, outbox: {clinic.appointments.outbox.counts()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""Confirmation emails during a SendGrid outage, with and without the circuit breaker.
+
+Runs the email helper the outbox calls from --workers threads, the way the
+outbox worker pool does, while every SendGrid call hangs for --timeout-ms
+and then fails, like a read timeout against a provider that has stopped
+answering. Reports how many calls were sent to SendGrid, how long each
+attempt held a worker, and how long the whole run took. It then ends the
+outage and shows the breaker probing and closing again.
+
+Run from the repository root:
+
+    python benchmarks/bench_breaker.py [--emails 200] [--workers 4] [--timeout-ms 500]
+"""
+import argparse
+import contextlib
+import io
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+os.environ.setdefault("CLINIC_STUB_INTEGRATIONS", "1")
+os.environ.setdefault("CLINIC_STUB_LATENCY_MS", "0")
+os.environ.setdefault("INTEGRATION_WARMUP", "0")
+os.environ.setdefault("APPOINTMENT_STORE_URL", "memory://")
+os.environ.setdefault("OUTBOX_DB", os.path.join(tempfile.mkdtemp(), "outbox.db"))
+os.environ["INTEGRATION_BREAKER_RESET"] = "1"
+
+import app as clinic
+from utils import integrations
+from utils.circuit_breaker import CircuitOpenError
+
+PATIENT = {"firstName": "Bench", "lastName": "Patient", "age": 40, "gender": "other",
+           "email": "patient@example.com", "phone": "5550100"}
+
+
+def run(label, args, sendgrid):
+    latencies = []
+    fast_failures = 0
+    lock = threading.Lock()
+    calls_before = sendgrid.calls
+
+    def worker(count):
+        nonlocal fast_failures
+        for i in range(count):
+            details = {"time": "Monday 10:00 AM", "reason": "check-up", "confirmationId": f"AC{i:06d}"}
+            started = time.perf_counter()
+            try:
+                clinic.send_appointment_confirmation_email(PATIENT, details)
+            except CircuitOpenError:
+                with lock:
+                    fast_failures += 1
+            with lock:
+                latencies.append(time.perf_counter() - started)
+
+    threads = [threading.Thread(target=worker, args=(args.emails // args.workers,)) for _ in range(args.workers)]
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    print(f"{label:12} {sendgrid.calls - calls_before:9} {fast_failures:11} "
+          f"{statistics.median(latencies) * 1000:9.1f} {latencies[int(len(latencies) * 0.99) - 1] * 1000:9.1f} "
+          f"{sum(latencies):12.2f} {elapsed:9.2f}")
+
+
+class FlakySendGrid:
+    """Stands in for SendGrid; hangs and fails while down"""
+
+    def __init__(self, stub, timeout):
+        self.stub = stub
+        self.timeout = timeout
+        self.down = True
+        self.calls = 0
+
+    def send(self, message):
+        self.calls += 1
+        if self.down:
+            time.sleep(self.timeout)
+            raise TimeoutError("SendGrid read timed out")
+        return self.stub.send(message)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--emails", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--timeout-ms", type=int, default=500)
+    args = parser.parse_args()
+
+    stub = integrations.sendgrid_client()
+    sendgrid = FlakySendGrid(stub, args.timeout_ms / 1000)
+    integrations.sendgrid_client = lambda: sendgrid
+    breaker = integrations.breaker("sendgrid")
+    threshold = breaker.failure_threshold
+
+    print(f"{args.emails} confirmation emails from {args.workers} workers, SendGrid down "
+          f"(each call fails after {args.timeout_ms} ms)")
+    print(f"{'':12} {'to SendGrid':>9} {'failed fast':>11} {'p50 ms':>9} {'p99 ms':>9} "
+          f"{'worker-s':>12} {'wall s':>9}")
+    breaker.failure_threshold = float("inf")
+    run("no breaker", args, sendgrid)
+    breaker.failure_threshold = threshold
+    breaker.reset()
+    run("breaker", args, sendgrid)
+    print(f"breaker after the outage: {breaker.status()}")
+
+    sendgrid.down = False
+    time.sleep(breaker.status()["retry_after"] + 0.1)
+    print(f"SendGrid back, reset timeout passed: {breaker.status()['state']}")
+    with contextlib.redirect_stdout(io.StringIO()):
+        sent = clinic.send_appointment_confirmation_email(
+            PATIENT, {"time": "Monday 10:00 AM", "reason": "check-up", "confirmationId": "AC999999"})
+    print(f"probe email sent: {sent}, breaker now: {breaker.status()['state']}")
+
+
+if __name__ == "__main__":
+    main()
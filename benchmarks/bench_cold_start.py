@@ -0,0 +1,83 @@
+"""Worker boot latency: app import time and time to first response.
+
+Each run starts a fresh interpreter, imports app and serves GET / through
+the Flask test client, so nothing is shared with earlier runs. Reported per
+run: seconds from process spawn to first response, the app import alone,
+and the first request itself. Integrations run as offline stubs and the
+background warm-up is disabled, so the numbers are what a worker pays
+before it can answer.
+
+Run from the repository root:
+
+    python benchmarks/bench_cold_start.py [--runs 5] [--max-import-seconds 0.5]
+
+With --max-import-seconds the script exits non-zero when the median
+import time is above the limit, so it can gate a CI job.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = """
+import json, sys, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+response = app.app.test_client().get("/")
+served = time.perf_counter()
+heavy = [name for name in ("openai", "googleapiclient", "google_auth_oauthlib", "sendgrid", "dateparser")
+         if name in sys.modules]
+print(json.dumps({"import": imported - started, "first_request": served - imported,
+                  "status": response.status_code, "loaded": heavy}))
+"""
+
+
+def run_once(env):
+    spawned = time.perf_counter()
+    output = subprocess.run([sys.executable, "-c", CHILD], cwd=ROOT, env=env, check=True,
+                            capture_output=True, text=True).stdout
+    total = time.perf_counter() - spawned
+    result = json.loads(output.strip().splitlines()[-1])
+    result["spawn_to_response"] = total
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--max-import-seconds", type=float, default=None)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(
+            os.environ,
+            CLINIC_STUB_INTEGRATIONS="1",
+            INTEGRATION_WARMUP="0",
+            APPOINTMENT_STORE_URL=f"sqlite:///{os.path.join(tmp, 'clinic.db')}",
+            OPENAI_API_KEY=os.environ.get("OPENAI_API_KEY", "benchmark"),
+            PYTHONDONTWRITEBYTECODE="",
+        )
+        run_once(env)  # compile bytecode so every measured run starts alike
+        results = [run_once(env) for _ in range(args.runs)]
+
+    for key, label in (("spawn_to_response", "spawn to first response"), ("import", "import app"),
+                       ("first_request", "first GET /")):
+        values = [r[key] for r in results]
+        print(f"{label:24} median {statistics.median(values) * 1000:7.1f} ms   max {max(values) * 1000:7.1f} ms")
+    print(f"status {results[-1]['status']}; SDKs loaded before first response: {results[-1]['loaded'] or 'none'}")
+
+    median_import = statistics.median(r["import"] for r in results)
+    if args.max_import_seconds is not None and median_import > args.max_import_seconds:
+        print(f"FAIL: median import {median_import:.3f}s exceeds {args.max_import_seconds:.3f}s")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
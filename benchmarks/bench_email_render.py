@@ -0,0 +1,65 @@
+"""Per-email render cost for reminder-sized batches.
+
+Compares the cached EmailTemplates (layout pre-rendered, bodies compiled
+once) against compiling the templates for every message.
+
+Run from the repository root:
+
+    python benchmarks/bench_email_render.py [--batch 10000]
+"""
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from utils.email_templates import EmailTemplates
+
+TEMPLATE_DIR = os.path.join(ROOT, "templates", "email")
+CHROME = {"title": "🏥 AI Clinic", "subtitle": "Appointment Confirmation", "header_color": "#007bff", "footer": True}
+
+
+def patients(count):
+    for i in range(count):
+        yield (
+            {"firstName": f"Patient{i}", "lastName": "Example", "age": 20 + i % 60, "gender": "other",
+             "email": f"patient{i}@example.com", "phone": f"555{i:07d}",
+             "medicalId": f"MID{i}" if i % 3 else "", "allergies": "penicillin" if i % 5 == 0 else ""},
+            {"time": "Friday 10:00 AM", "reason": "Annual check-up", "confirmationId": f"AC{i:010d}"},
+        )
+
+
+def cached(batch):
+    templates = EmailTemplates(TEMPLATE_DIR)
+    templates.register("appointment_confirmation", **CHROME)
+    start = time.perf_counter()
+    for patient, appointment in patients(batch):
+        templates.render("appointment_confirmation", patient=patient, appointment=appointment)
+    return time.perf_counter() - start
+
+
+def uncached(batch):
+    start = time.perf_counter()
+    for patient, appointment in patients(batch):
+        templates = EmailTemplates(TEMPLATE_DIR)
+        templates.register("appointment_confirmation", **CHROME)
+        templates.render("appointment_confirmation", patient=patient, appointment=appointment)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--batch", type=int, default=10000)
+    args = parser.parse_args()
+
+    cached_seconds = cached(args.batch)
+    uncached_batch = max(1, args.batch // 20)
+    uncached_seconds = uncached(uncached_batch)
+    print(f"cached:   {cached_seconds / args.batch * 1e6:8.1f} us/email  ({args.batch} emails, html + text)")
+    print(f"compiled per email: {uncached_seconds / uncached_batch * 1e6:8.1f} us/email  ({uncached_batch} emails)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""Cost of serving a doctor's .ics feed: cold build, rebuild after one change, unchanged poll.
+
+"rebuild after one change" reschedules a single appointment and fetches
+the feed again, which re-serialises only that VEVENT and recompresses the
+feed. "unchanged poll" is what every subscribed calendar client costs
+between changes.
+
+Run from the repository root:
+
+    python benchmarks/bench_ics_feed.py [--appointments 2000] [--iterations 200]
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.appointment_store import MemoryAppointmentStore
+from utils.ics_feed import IcsFeed
+from utils.time_parser import CLINIC_TIMEZONE, format_slot
+
+
+def busy_store(count):
+    store = MemoryAppointmentStore()
+    first = datetime.now(CLINIC_TIMEZONE).replace(hour=9, minute=0, second=0, microsecond=0)
+    for i in range(count):
+        start = first + timedelta(days=i // 8, hours=i % 8)
+        store.add({
+            "confirmationId": f"AC{i:06d}",
+            "doctor_id": "drlee",
+            "patient": f"Patient {i}",
+            "reason": "Follow-up, blood pressure",
+            "time": format_slot(start),
+            "start": start.isoformat(),
+            "status": "confirmed",
+            "bookedAt": datetime.now().isoformat(),
+        })
+    return store
+
+
+def timed(fn, iterations):
+    start = time.perf_counter()
+    for i in range(iterations):
+        fn(i)
+    return (time.perf_counter() - start) / iterations * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--appointments", type=int, default=2000)
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    store = busy_store(args.appointments)
+
+    def cold(i):
+        IcsFeed(store, "secret").get("drlee")
+
+    feeds = IcsFeed(store, "secret")
+    body = feeds.get("drlee")
+    target = store.get("AC000000")
+    day = datetime.fromisoformat(target["start"])
+
+    def one_change(i):
+        start = day + timedelta(days=400 + i)
+        store.reschedule("AC000000", format_slot(start), start=start.isoformat())
+        feeds.get("drlee")
+
+    def unchanged(i):
+        feeds.get("drlee")
+
+    iterations = max(1, args.iterations // 20)
+    print(f"feed: {args.appointments} events, {len(body.variants['identity'])} bytes, "
+          f"{len(body.variants.get('br', body.variants.get('gzip', b'')))} compressed")
+    print(f"cold build                 {timed(cold, iterations):9.2f} ms")
+    print(f"rebuild after one change   {timed(one_change, iterations):9.2f} ms")
+    print(f"unchanged poll             {timed(unchanged, args.iterations * 50):9.4f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""Retried bookings with and without an Idempotency-Key.
+
+Each of --patients patients books a different slot, and every booking is
+sent --attempts times, half of them at the same moment, the way a page
+retries when a mobile response is lost. Attempts are spread over --workers
+forked worker processes sharing one SQLite store, as under gunicorn, so a
+retry usually reaches a different worker than the first attempt. Reports
+how many appointments and outbox tasks (calendar event and emails) were
+created and whether every attempt got the same confirmation back.
+
+Run from the repository root (forks, so Linux or macOS):
+
+    python benchmarks/bench_idempotency.py [--patients 30] [--attempts 4] [--workers 2]
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+os.environ.setdefault("CLINIC_STUB_INTEGRATIONS", "1")
+os.environ.setdefault("CLINIC_STUB_LATENCY_MS", "0")
+os.environ.setdefault("INTEGRATION_WARMUP", "0")
+TMP = tempfile.mkdtemp()
+os.environ.setdefault("OUTBOX_DB", os.path.join(TMP, "outbox.db"))
+os.environ.setdefault("RATE_LIMIT_BOOK", "0")
+os.environ.setdefault("RATE_LIMIT_BOOK_TOTAL", "0")
+
+import app as clinic
+from utils.appointment_store import create_appointment_store
+from utils.availability import AvailabilityIndex
+from utils.time_parser import CLINIC_TIMEZONE, format_slot
+
+
+def slots(count):
+    # Free hours over the coming week (slot labels name the weekday, so no further)
+    day = datetime.now(CLINIC_TIMEZONE).replace(hour=9, minute=0, second=0, microsecond=0) + timedelta(days=1)
+    found = []
+    for _ in range(6):
+        if day.weekday() < 5:
+            found.extend(day.replace(hour=hour) for hour in range(9, 17))
+        day += timedelta(days=1)
+    if len(found) < count:
+        raise SystemExit(f"only {len(found)} free slots in the coming week; use --patients {len(found)} or fewer")
+    return found[:count]
+
+
+def post(body, headers):
+    """One attempt, in a worker process"""
+    result = clinic.app.test_client().post("/api/book-appointment", json=body, headers=headers, buffered=True)
+    return result.get_json().get("confirmationId")
+
+
+def run(label, use_key, args):
+    clinic.appointments = create_appointment_store(f"sqlite:///{os.path.join(TMP, uuid.uuid4().hex)}.db")
+    clinic.availability = AvailabilityIndex(clinic.appointments)
+    workers = multiprocessing.get_context("fork").Pool(args.workers)
+    answers = {}
+    lock = threading.Lock()
+
+    def attempt(patient, body, headers):
+        confirmation_id = workers.apply(post, (body, headers))
+        with lock:
+            answers.setdefault(patient, []).append(confirmation_id)
+
+    started = time.perf_counter()
+    for patient, start in enumerate(slots(args.patients)):
+        body = {
+            "patientInfo": {"firstName": f"Patient{patient}", "lastName": "Test", "email": f"p{patient}@example.org",
+                            "age": 40, "gender": "female", "phone": "555-0100"},
+            "healthConcern": "follow-up",
+            "appointmentTime": format_slot(start),
+        }
+        headers = {"Idempotency-Key": str(uuid.uuid4())} if use_key else {}
+        # Half the attempts race the first one; the rest are later retries
+        racing = [threading.Thread(target=attempt, args=(patient, body, headers))
+                  for _ in range(max(1, args.attempts // 2))]
+        for thread in racing:
+            thread.start()
+        for thread in racing:
+            thread.join()
+        for _ in range(args.attempts - len(racing)):
+            attempt(patient, body, headers)
+    elapsed = time.perf_counter() - started
+    workers.close()
+    workers.join()
+
+    booked = len(clinic.appointments)
+    tasks = sum(clinic.appointments.outbox.counts().values())
+    consistent = sum(1 for ids in answers.values() if len(set(ids)) == 1 and ids[0])
+    print(f"{label:18} {booked:9} {tasks:9} {consistent:>11}/{args.patients:<4} {elapsed * 1000:9.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--patients", type=int, default=30)
+    parser.add_argument("--attempts", type=int, default=4)
+    parser.add_argument("--workers", type=int, default=2)
+    args = parser.parse_args()
+
+    # Leave the queued tasks in place to count them, and keep workers to requests only
+    for background in (clinic.outbox_worker, clinic.calendar_sync, clinic.reminders):
+        background.ensure_started = lambda: None
+    print(f"{args.patients} bookings, {args.attempts} attempts each, over {args.workers} worker processes")
+    print(f"{'':18} {'booked':>9} {'tasks':>9} {'same answer':>16} {'ms':>9}")
+    run("no key", False, args)
+    run("Idempotency-Key", True, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""Throughput of the patient portal route, before and after precompression.
+
+"render per request" re-renders templates/index.html on every hit, as the
+route used to. "precompressed" is the current / route, measured for a
+browser asking for gzip/brotli and for a revalidation that gets a 304.
+Requests go through the Flask test client, so this measures the app, not
+the network.
+
+Run from the repository root:
+
+    python benchmarks/bench_index_route.py [--requests 2000]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+os.environ.setdefault("CLINIC_STUB_INTEGRATIONS", "1")
+os.environ.setdefault("INTEGRATION_WARMUP", "0")
+os.environ.setdefault("APPOINTMENT_STORE_URL", "memory://")
+os.environ.setdefault("OUTBOX_DB", os.path.join(tempfile.mkdtemp(), "outbox.db"))
+
+from flask import render_template
+
+import app as clinic
+
+
+@clinic.app.route("/__bench/render-index")
+def render_index_per_request():
+    return render_template("index.html")
+
+
+def measure(client, path, headers, requests):
+    response = client.get(path, headers=headers)
+    size = len(response.data)
+    start = time.perf_counter()
+    for _ in range(requests):
+        client.get(path, headers=headers)
+    seconds = time.perf_counter() - start
+    return requests / seconds, response.status_code, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    args = parser.parse_args()
+
+    client = clinic.app.test_client()
+    compressed = {"Accept-Encoding": "gzip, deflate, br"}
+    etag = client.get("/", headers=compressed).headers["ETag"]
+    cases = [
+        ("render per request", "/__bench/render-index", compressed),
+        ("precompressed", "/", compressed),
+        ("precompressed, 304", "/", dict(compressed, **{"If-None-Match": etag})),
+    ]
+    print(f"{'':22} {'req/s':>9} {'status':>7} {'bytes':>7}")
+    for label, path, headers in cases:
+        rate, status, size = measure(client, path, headers, args.requests)
+        print(f"{label:22} {rate:9.0f} {status:7} {size:7}")
+
+
+if __name__ == "__main__":
+    main()
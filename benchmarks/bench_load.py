@@ -0,0 +1,246 @@
+"""Offline load test of booking, chat and dashboard traffic.
+
+Runs the Flask app in-process against local stand-ins for SendGrid, the
+Google Calendar API and OpenAI (benchmarks/standin_servers.py), with
+injectable latency and failure rates. A shuffled mix of bookings (many
+aimed at the same few slots), streamed health questions and dashboard
+polls is driven from --concurrency threads. The report gives throughput,
+p50/p95/p99 latency per operation, and how many appointments overlap once
+the run is over, which must be 0.
+
+Each run is appended as one JSON line to --output, so runs can be compared
+over time:
+
+    python benchmarks/bench_load.py [--bookings 300] [--chats 200] [--dashboards 200]
+        [--concurrency 16] [--slots 40] [--latency-ms 50] [--jitter-ms 20]
+        [--failure-rate 0.0] [--token-ms 0] [--output benchmarks/results/load.jsonl]
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from standin_servers import StandInServer
+
+QUESTIONS = [
+    "What helps with a mild fever?",
+    "How much water should I drink a day?",
+    "Is it normal to have a headache after a flu shot?",
+    "What can I do about seasonal allergies?",
+    "How long does a cold usually last?",
+    "When should I worry about a cough?",
+    "What is a healthy resting heart rate?",
+    "How can I sleep better?",
+]
+
+
+def percentile(sorted_values, share):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, round(share * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarize(samples, seconds):
+    """samples: operation -> [(latency seconds, ok)]"""
+    report = {}
+    for operation, results in sorted(samples.items()):
+        latencies = sorted(latency for latency, _ in results)
+        report[operation] = {
+            "count": len(results),
+            "errors": sum(1 for _, ok in results if not ok),
+            "throughput": round(len(results) / seconds, 1),
+            **{f"p{p}_ms": round(percentile(latencies, p / 100) * 1000, 2) for p in (50, 95, 99)},
+        }
+    return report
+
+
+def candidate_slots(count, now):
+    """count future weekday slots between 9 AM and 4 PM"""
+    from utils.time_parser import format_slot
+
+    slots = []
+    day = (now + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    while len(slots) < count:
+        if day.weekday() < 5:
+            for hour in range(9, 16):
+                slots.append(format_slot(day.replace(hour=hour)))
+        day += timedelta(days=1)
+    return slots[:count]
+
+
+def overlapping_appointments(store, doctor_id, minutes):
+    """Pairs of confirmed appointments whose start times are less than minutes apart"""
+    starts = sorted(
+        datetime.fromisoformat(a["start"]) for a in store.for_doctor(doctor_id)
+        if a.get("start") and a.get("status", "confirmed") == "confirmed" and not a.get("all_day")
+    )
+    return sum(1 for a, b in zip(starts, starts[1:]) if b - a < timedelta(minutes=minutes))
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--bookings", type=int, default=300)
+    parser.add_argument("--chats", type=int, default=200)
+    parser.add_argument("--dashboards", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--slots", type=int, default=40, help="distinct times the bookings compete for")
+    parser.add_argument("--latency-ms", type=float, default=50, help="stand-in response time")
+    parser.add_argument("--jitter-ms", type=float, default=20)
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="share of stand-in calls answered 503")
+    parser.add_argument("--token-ms", type=float, default=0, help="delay between streamed answer words")
+    parser.add_argument("--drain-seconds", type=float, default=30, help="how long to wait for the outbox")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", default=os.path.join(ROOT, "benchmarks", "results", "load.jsonl"))
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="clinic-load-")
+    server = StandInServer(args.latency_ms, args.jitter_ms, args.failure_rate, args.token_ms, seed=args.seed)
+    with server:
+        os.environ.update(server.environ())
+        os.environ.update({
+            "CLINIC_STUB_INTEGRATIONS": "0",
+            "INTEGRATION_WARMUP": "0",
+            "APPOINTMENT_STORE_URL": f"sqlite:///{os.path.join(workdir, 'clinic.db')}",
+            "OUTBOX_DB": os.path.join(workdir, "outbox.db"),
+        })
+        # Every simulated patient shares one address; per-client rate limits
+        # would turn most of the run into 429s unless set explicitly
+        for name in ("RATE_LIMIT_ASK", "RATE_LIMIT_ASK_TOTAL", "RATE_LIMIT_BOOK", "RATE_LIMIT_BOOK_TOTAL"):
+            os.environ.setdefault(name, "0")
+        # Token files are looked up relative to the working directory
+        os.chdir(workdir)
+        with open("token_drlee.json", "w") as f:
+            json.dump(server.token_info(), f)
+
+        import app as clinic
+        from utils.availability import APPOINTMENT_MINUTES
+        from utils.time_parser import CLINIC_TIMEZONE
+
+        # A deployed worker warms its clients in the background after boot;
+        # do it up front so the first requests do not time SDK imports
+        clinic.integrations.warm_up()
+
+        rng = random.Random(args.seed)
+        slots = candidate_slots(args.slots, datetime.now(CLINIC_TIMEZONE))
+        operations = ["book"] * args.bookings + ["ask"] * args.chats + ["dashboard"] * args.dashboards
+        rng.shuffle(operations)
+
+        samples = defaultdict(list)
+        samples_lock = threading.Lock()
+        local = threading.local()
+        booked = []
+
+        def client():
+            if getattr(local, "client", None) is None:
+                local.client = clinic.app.test_client()
+                local.client.post("/login", data={"username": "drlee", "password": "password123"})
+                local.etag = None
+            return local.client
+
+        def record(operation, started, ok):
+            with samples_lock:
+                samples[operation].append((time.perf_counter() - started, ok))
+
+        def book(c, i):
+            started = time.perf_counter()
+            response = c.post("/api/book-appointment", json={
+                "patientInfo": {"firstName": "Load", "lastName": f"Test{i}", "email": f"load{i}@example.com",
+                                "phone": "555-0100", "age": "40", "gender": "other"},
+                "healthConcern": "Check-up",
+                "appointmentTime": rng.choice(slots),
+            }, buffered=True)
+            body = response.get_json(silent=True) or {}
+            # A slot that is already taken is an expected answer, not an error
+            failed = body.get("error", "").startswith("Failed")
+            record("book", started, response.status_code == 200 and "success" in body and not failed)
+            if body.get("success"):
+                booked.append(body["confirmationId"])
+
+        def ask(c, i):
+            started = time.perf_counter()
+            response = c.post("/api/ask", json={"message": rng.choice(QUESTIONS)},
+                              headers={"Accept": "text/event-stream"}, buffered=False)
+            first = None
+            done = False
+            for chunk in response.response:
+                if first is None:
+                    first = time.perf_counter()
+                    record("ask_first_event", started, response.status_code == 200)
+                done = done or b"event: done" in chunk
+            response.close()
+            record("ask", started, response.status_code == 200 and done)
+
+        def dashboard(c, i):
+            started = time.perf_counter()
+            page = c.get("/clinic", buffered=True)
+            record("clinic", started, page.status_code == 200)
+            started = time.perf_counter()
+            headers = {"If-None-Match": local.etag} if local.etag else {}
+            listing = c.get("/api/appointments?limit=50", headers=headers, buffered=True)
+            local.etag = listing.headers.get("ETag") or local.etag
+            record("appointments", started, listing.status_code in (200, 304))
+
+        handlers = {"book": book, "ask": ask, "dashboard": dashboard}
+
+        def run(item):
+            i, operation = item
+            handlers[operation](client(), i)
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            list(pool.map(run, enumerate(operations)))
+        seconds = time.perf_counter() - started
+
+        # Let the outbox send the confirmation emails and calendar events
+        deadline = time.monotonic() + args.drain_seconds
+        while time.monotonic() < deadline:
+            counts = clinic.appointments.outbox.counts()
+            if not counts.get("pending") and not counts.get("running"):
+                break
+            time.sleep(0.2)
+
+        result = {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "git": git_revision(),
+            "params": {key: value for key, value in vars(args).items() if key != "output"},
+            "seconds": round(seconds, 3),
+            "requests_per_second": round(sum(len(v) for v in samples.values()) / seconds, 1),
+            "operations": summarize(samples, seconds),
+            "bookings_confirmed": len(booked),
+            "double_bookings": overlapping_appointments(clinic.appointments, "drlee", APPOINTMENT_MINUTES),
+            "outbox": clinic.appointments.outbox.counts(),
+            "standin_calls": dict(server.calls),
+            "standin_failures": dict(server.failures),
+            "ask_cache": clinic.assistant.cache.stats(),
+        }
+        clinic.outbox_worker.stop()
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "a") as f:
+        f.write(json.dumps(result) + "\n")
+    print(json.dumps(result, indent=2))
+    return 1 if result["double_bookings"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,131 @@
+"""Resident memory of the in-memory store: plain appointment dicts against compact records.
+
+Loads --appointments appointments into a MemoryAppointmentStore, spread
+over --doctors doctors, each booked by a patient drawn from a pool of
+--patients so most patients return several times. Every appointment is
+built from its own parsed request body, as a booking is, so plain dicts
+each hold their own copy of the patient's details. Each representation is
+loaded in a fresh process and the growth in resident set size reported.
+
+Run from the repository root (Linux, reads /proc):
+
+    python benchmarks/bench_memory.py [--appointments 1000000] [--patients 150000] [--doctors 10]
+"""
+import argparse
+import gc
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from utils.appointment_store import MemoryAppointmentStore
+from utils.time_parser import CLINIC_TIMEZONE, format_slot
+
+FIRST = ["James", "Mary", "Robert", "Patricia", "John", "Jennifer", "Michael", "Linda", "David", "Elizabeth",
+         "William", "Barbara", "Richard", "Susan", "Joseph", "Jessica", "Thomas", "Sarah", "Wei", "Priya"]
+LAST = ["Smith", "Johnson", "Williams", "Brown", "Jones", "Garcia", "Miller", "Davis", "Rodriguez", "Martinez",
+        "Hernandez", "Lopez", "Gonzalez", "Wilson", "Anderson", "Thomas", "Taylor", "Moore", "Jackson", "Martin"]
+COMPLAINTS = ["persistent cough", "lower back pain", "migraine headaches", "annual physical", "sore throat",
+              "blood pressure follow-up", "skin rash on arm", "knee injury from running", "diabetes check"]
+
+
+class DictStore(MemoryAppointmentStore):
+    """The store keeping each appointment dict as booked, as before compact records"""
+
+    def _record(self, appointment):
+        return appointment
+
+
+def rss():
+    with open("/proc/self/statm") as statm:
+        return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def patient_bodies(count, rng):
+    # JSON text, so every booking parses a fresh copy of the patient's details
+    pool = []
+    for i in range(count):
+        first, last = rng.choice(FIRST), rng.choice(LAST)
+        pool.append(json.dumps({
+            "firstName": first,
+            "lastName": last,
+            "email": f"{first.lower()}.{last.lower()}{i}@example.org",
+            "phone": f"({rng.randint(200, 999)}) {rng.randint(200, 999)}-{rng.randint(0, 9999):04d}",
+            "age": str(rng.randint(18, 90)),
+            "gender": rng.choice(["female", "male"]),
+            "medicalId": f"MRN-{100000 + i}",
+            "allergies": rng.choice(["", "", "penicillin", "peanuts"]),
+        }))
+    return pool
+
+
+def load(mode, args):
+    rng = random.Random(11)
+    pool = patient_bodies(args.patients, rng)
+    first = datetime(2020, 1, 6, 9, tzinfo=CLINIC_TIMEZONE)
+    per_doctor = -(-args.appointments // args.doctors)
+    slots = [first + timedelta(hours=hour) for hour in range(per_doctor)]
+    # Slot labels name no year, and a doctor's slots here run over several
+    labels = [(f"{format_slot(start)} {start.year}", start.isoformat()) for start in slots]
+    store = (DictStore if mode == "dicts" else MemoryAppointmentStore)()
+    gc.collect()
+    before = rss()
+    started = time.perf_counter()
+    for i in range(args.appointments):
+        info = json.loads(rng.choice(pool))
+        label, start = labels[i // args.doctors]
+        store.add({
+            "confirmationId": f"AC{i:010d}",
+            "doctor_id": f"doctor{i % args.doctors}",
+            "patient": f"{info['firstName']} {info['lastName']}",
+            "patientInfo": info,
+            "time": label,
+            "start": start,
+            "reason": rng.choice(COMPLAINTS),
+            "status": "confirmed",
+            "source": "patient_portal",
+            "location": "",
+            "bookedAt": datetime(2020, 1, 1).isoformat(),
+        })
+    elapsed = time.perf_counter() - started
+    del pool, labels, slots
+    gc.collect()
+    grown = rss() - before
+    profiles = len(store.patients) if mode == "records" else len(store)
+    print(json.dumps({"bytes": grown, "seconds": elapsed, "profiles": profiles}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--appointments", type=int, default=1000000)
+    parser.add_argument("--patients", type=int, default=150000)
+    parser.add_argument("--doctors", type=int, default=10)
+    parser.add_argument("--mode", choices=("dicts", "records"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.mode:
+        load(args.mode, args)
+        return
+
+    print(f"{args.appointments} appointments, {args.patients} patients, {args.doctors} doctors")
+    print(f"{'':10} {'RSS growth':>12} {'per appt':>10} {'patient copies':>15} {'load s':>8}")
+    results = {}
+    for mode in ("dicts", "records"):
+        output = subprocess.run(
+            [sys.executable, __file__, "--mode", mode, "--appointments", str(args.appointments),
+             "--patients", str(args.patients), "--doctors", str(args.doctors)],
+            check=True, capture_output=True, text=True,
+        ).stdout
+        result = results[mode] = json.loads(output.splitlines()[-1])
+        print(f"{mode:10} {result['bytes'] / 2**20:9.1f} MiB {result['bytes'] / args.appointments:8.0f} B "
+              f"{result['profiles']:15} {result['seconds']:8.1f}")
+    print(f"records use {results['records']['bytes'] / results['dicts']['bytes']:.0%} of the memory of dicts")
+
+
+if __name__ == "__main__":
+    main()
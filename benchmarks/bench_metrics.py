@@ -0,0 +1,76 @@
+"""Cost of recording a latency observation, and of a /metrics scrape.
+
+Times Histogram.observe() from one thread and from several at once, next
+to the same update guarded by a single shared lock, then renders the
+registry with a realistic number of label sets.
+
+Run from the repository root:
+
+    python benchmarks/bench_metrics.py [--observations 200000] [--threads 8]
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.metrics import Histogram, Registry
+
+ROUTES = ("/", "/api/book-appointment", "/api/ask", "/api/appointments", "/clinic")
+
+
+class LockedHistogram(Histogram):
+    """The same histogram with one lock around every update, for comparison"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._update_lock = threading.Lock()
+
+    def observe(self, amount, *labelvalues):
+        with self._update_lock:
+            super().observe(amount, *labelvalues)
+
+
+def run_threads(histogram, threads, observations):
+    per_thread = observations // threads
+
+    def work():
+        for i in range(per_thread):
+            histogram.observe((i % 1000) / 1000, ROUTES[i % len(ROUTES)], "GET", "200")
+
+    workers = [threading.Thread(target=work) for _ in range(threads)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return (time.perf_counter() - start) / (per_thread * threads) * 1e9
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--observations", type=int, default=200000)
+    parser.add_argument("--threads", type=int, default=8)
+    args = parser.parse_args()
+
+    labels = ("route", "method", "status")
+    print(f"{'':28} {'ns/observation':>15}")
+    for threads in (1, args.threads):
+        for cls in (Histogram, LockedHistogram):
+            ns = run_threads(cls("bench", "bench", labels), threads, args.observations)
+            print(f"{cls.__name__ + f', {threads} thread(s)':28} {ns:15.0f}")
+
+    registry = Registry()
+    histogram = registry.histogram("bench_seconds", "bench", labels)
+    for route in ROUTES * 4:
+        for status in ("200", "302", "400", "404", "500"):
+            histogram.observe(0.01, route + status, "GET", status)
+    start = time.perf_counter()
+    body = registry.render()
+    print(f"scrape: {(time.perf_counter() - start) * 1000:.2f} ms for {len(body.splitlines())} lines")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Reminder scheduler: heap rebuild after a restart, steady-state ticks, and grouped sends.
+
+Books --appointments appointments spread over the next two days across
+--doctors doctors, then times
+- the rebuild a restarted worker does (one range query per doctor and a heapify),
+- a tick with nothing new (one schedule_version lookup per doctor),
+- and a day of ticks, counting SendGrid requests with grouped sends
+  against one request per reminder.
+
+Run from the repository root:
+
+    python benchmarks/bench_reminders.py [--appointments 20000] [--doctors 20] [--tick 30]
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.appointment_store import MemoryAppointmentStore
+from utils.reminders import ReminderScheduler
+from utils.time_parser import CLINIC_TIMEZONE, format_slot
+
+
+def busy_store(count, doctors, now):
+    store = MemoryAppointmentStore()
+    per_doctor = -(-count // doctors)
+    spacing = max(1, 48 * 60 // per_doctor)
+    for i in range(count):
+        start = now + timedelta(minutes=60 + (i // doctors) * spacing)
+        store.add({
+            "confirmationId": f"AC{i:07d}",
+            "doctor_id": f"dr{i % doctors}",
+            "patient": f"Patient {i}",
+            "time": format_slot(start),
+            "start": start.isoformat(),
+            "status": "confirmed",
+            "patientInfo": {"firstName": f"Patient{i}", "email": f"patient{i}@example.org"},
+        })
+    return store
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--appointments", type=int, default=20000)
+    parser.add_argument("--doctors", type=int, default=20)
+    parser.add_argument("--tick", type=int, default=30, help="seconds between scheduler ticks")
+    args = parser.parse_args()
+
+    now = datetime.now(CLINIC_TIMEZONE).replace(second=0, microsecond=0)
+    store = busy_store(args.appointments, args.doctors, now)
+    doctor_ids = [f"dr{i}" for i in range(args.doctors)]
+    batches = []
+    scheduler = ReminderScheduler(store, lambda: doctor_ids, batches.append, tick=args.tick)
+
+    started = time.perf_counter()
+    queued = scheduler.refresh(now)
+    rebuild = (time.perf_counter() - started) * 1000
+    print(f"rebuild after restart      {rebuild:9.2f} ms  ({queued} reminders queued)")
+
+    iterations = 1000
+    started = time.perf_counter()
+    for _ in range(iterations):
+        scheduler.refresh(now)
+    print(f"tick with no changes       {(time.perf_counter() - started) / iterations * 1000:9.4f} ms")
+
+    ticks = 24 * 3600 // args.tick
+    started = time.perf_counter()
+    sent = 0
+    for i in range(1, ticks + 1):
+        sent += scheduler.dispatch_due(now + timedelta(seconds=i * args.tick))
+    elapsed = time.perf_counter() - started
+    print(f"one day of ticks           {elapsed * 1000:9.2f} ms  ({ticks} ticks)")
+    print(f"reminders sent             {sent:9d}")
+    print(f"SendGrid requests grouped  {len(batches):9d}  (largest group {max(map(len, batches), default=0)})")
+    print(f"SendGrid requests one each {sent:9d}")
+
+
+if __name__ == "__main__":
+    main()
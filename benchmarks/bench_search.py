@@ -0,0 +1,129 @@
+"""Dashboard search over a large practice: first build, query latency and per-booking upkeep.
+
+Fills an in-memory store with --appointments appointments for one doctor
+(patients drawn from a pool of --patients, each with a name, phone,
+email, medical ID and complaint), builds the search index, then times
+typical queries and the cost a booking or update adds to keep the index
+current. Compares against scanning every appointment per query, which is
+what finding a patient in the dashboard list amounts to today.
+
+Run from the repository root:
+
+    python benchmarks/bench_search.py [--appointments 200000] [--patients 50000]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.appointment_store import MemoryAppointmentStore
+from utils.search_index import SearchIndex
+from utils.time_parser import CLINIC_TIMEZONE, format_slot
+
+FIRST = ["James", "Mary", "Robert", "Patricia", "John", "Jennifer", "Michael", "Linda", "David", "Elizabeth",
+         "William", "Barbara", "Richard", "Susan", "Joseph", "Jessica", "Thomas", "Sarah", "Wei", "Priya"]
+LAST = ["Smith", "Johnson", "Williams", "Brown", "Jones", "Garcia", "Miller", "Davis", "Rodriguez", "Martinez",
+        "Hernandez", "Lopez", "Gonzalez", "Wilson", "Anderson", "Thomas", "Taylor", "Moore", "Jackson", "Martin",
+        "Lee", "Perez", "Thompson", "White", "Harris", "Sanchez", "Clark", "Ramirez", "Lewis", "Robinson"]
+COMPLAINTS = ["persistent cough", "lower back pain", "migraine headaches", "annual physical", "sore throat",
+              "blood pressure follow-up", "skin rash on arm", "knee injury from running", "fatigue and dizziness",
+              "diabetes check", "allergy symptoms", "ear infection", "flu vaccination", "chest tightness"]
+
+
+def patients(count, rng):
+    pool = []
+    for i in range(count):
+        first, last = rng.choice(FIRST), rng.choice(LAST)
+        pool.append({
+            "firstName": first,
+            "lastName": f"{last}{'' if i % 3 else rng.choice(['', 'son', 'ley', 'ford'])}",
+            "phone": f"({rng.randint(200, 999)}) {rng.randint(200, 999)}-{rng.randint(0, 9999):04d}",
+            "email": f"{first.lower()}.{last.lower()}{i}@example.org",
+            "medicalId": f"MRN-{100000 + i}",
+        })
+    return pool
+
+
+def appointment(i, patient, start, rng):
+    return {
+        "confirmationId": f"AC{i:08d}",
+        "doctor_id": "drlee",
+        "patient": f"{patient['firstName']} {patient['lastName']}",
+        "patientInfo": patient,
+        "time": f"{format_slot(start)} #{i}",
+        "start": start.isoformat(),
+        "reason": rng.choice(COMPLAINTS),
+        "status": "confirmed",
+    }
+
+
+def timed(fn, iterations):
+    started = time.perf_counter()
+    for i in range(iterations):
+        fn(i)
+    return (time.perf_counter() - started) / iterations * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--appointments", type=int, default=200000)
+    parser.add_argument("--patients", type=int, default=50000)
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    pool = patients(args.patients, rng)
+    store = MemoryAppointmentStore()
+    first = datetime.now(CLINIC_TIMEZONE).replace(minute=0, second=0, microsecond=0)
+    for i in range(args.appointments):
+        store.add(appointment(i, rng.choice(pool), first + timedelta(hours=i), rng))
+
+    search = SearchIndex(store).attach()
+    started = time.perf_counter()
+    search.search("drlee", "warm up")
+    print(f"first build                {(time.perf_counter() - started) * 1000:9.1f} ms  "
+          f"({search.size('drlee')} appointments)")
+
+    probe = pool[123]
+    queries = [
+        ("surname", probe["lastName"]),
+        ("full name", f"{probe['firstName']} {probe['lastName']}"),
+        ("name prefix", probe["lastName"][:3]),
+        ("phone", probe["phone"]),
+        ("last 4 of phone", probe["phone"][-4:]),
+        ("medical ID", probe["medicalId"]),
+        ("confirmation ID", "AC00012345"),
+        ("complaint + name", f"cough {probe['firstName'][:2]}"),
+    ]
+    for label, query in queries:
+        count = len(search.search("drlee", query))
+        print(f"{label:26} {timed(lambda i: search.search('drlee', query), 200):9.3f} ms  ({count} results) {query!r}")
+
+    needle = probe["lastName"].casefold()
+    scan = timed(lambda i: [a for a in store.for_doctor("drlee")
+                            if needle in (a.get("patient") or "").casefold()], 5)
+    print(f"{'scan every appointment':26} {scan:9.3f} ms")
+
+    base = args.appointments
+
+    def book(i):
+        store.add(appointment(base + i, rng.choice(pool), first + timedelta(hours=base + i), rng))
+
+    def update(i):
+        store.update(f"AC{i:08d}", email_sent=True)
+
+    plain = MemoryAppointmentStore()
+    plain_book = timed(lambda i: plain.add(appointment(i, rng.choice(pool), first + timedelta(hours=i), rng)), 2000)
+    print(f"booking, no index          {plain_book:9.4f} ms")
+    print(f"booking, index kept current{timed(book, 2000):9.4f} ms")
+    print(f"update, index kept current {timed(update, 2000):9.4f} ms")
+    started = time.perf_counter()
+    search.search("drlee", probe["lastName"])
+    print(f"next search after changes  {(time.perf_counter() - started) * 1000:9.3f} ms  (no rebuild)")
+
+
+if __name__ == "__main__":
+    main()
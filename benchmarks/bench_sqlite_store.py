@@ -0,0 +1,81 @@
+"""Concurrent booking throughput of SQLiteAppointmentStore across worker processes.
+
+Each process stands in for a gunicorn worker and tries to book the same set
+of slots, so every slot is contended. The run reports bookings per second
+and checks that each slot ended up booked exactly once.
+
+Run from the repository root:
+
+    python benchmarks/bench_sqlite_store.py [--workers 1,2,4,8] [--slots 2000]
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.appointment_store import SlotTakenError
+from utils.sqlite_store import SQLiteAppointmentStore
+
+
+def book_slots(path, slots, offset, result_queue):
+    store = SQLiteAppointmentStore(path)
+    booked = rejected = 0
+    for i in range(slots):
+        slot = (i + offset) % slots
+        appointment = {
+            "patient": "Bench Patient",
+            "time": f"slot {slot}",
+            "doctor_id": f"dr{slot % 8}",
+            "status": "confirmed",
+            "confirmationId": uuid.uuid4().hex,
+            "bookedAt": f"2025-01-01T00:00:{slot:06d}",
+        }
+        try:
+            store.add(appointment)
+            booked += 1
+        except SlotTakenError:
+            rejected += 1
+    result_queue.put((booked, rejected))
+
+
+def run(workers, slots):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        SQLiteAppointmentStore(path)
+        queue = multiprocessing.Queue()
+        procs = [
+            multiprocessing.Process(target=book_slots, args=(path, slots, n * slots // workers, queue))
+            for n in range(workers)
+        ]
+        start = time.perf_counter()
+        for p in procs:
+            p.start()
+        results = [queue.get() for _ in procs]
+        for p in procs:
+            p.join()
+        elapsed = time.perf_counter() - start
+        booked = sum(r[0] for r in results)
+        attempts = sum(r[0] + r[1] for r in results)
+        stored = len(SQLiteAppointmentStore(path))
+    return attempts / elapsed, booked, stored
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", default="1,2,4,8")
+    parser.add_argument("--slots", type=int, default=2000)
+    args = parser.parse_args()
+
+    print(f"{'workers':>8}  {'attempts/s':>11}  {'booked':>7}  {'double bookings':>16}")
+    for workers in (int(w) for w in args.workers.split(",")):
+        rate, booked, _ = run(workers, args.slots)
+        print(f"{workers:>8}  {rate:>11.0f}  {booked:>7}  {booked - args.slots:>16}")
+
+
+if __name__ == "__main__":
+    main()
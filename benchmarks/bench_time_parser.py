@@ -0,0 +1,116 @@
+"""Appointment-time parsing cost over a corpus of patient phrasings.
+
+Compares parse_appointment_time with a cold cache (every phrasing seen for
+the first time), with a warm cache, and calling dateparser directly on the
+same corpus. Before timing, checks that every slot label format_slot()
+produces over the coming year parses back to the same slot, as a booking
+form that sends the label back relies on.
+
+Run from the repository root:
+
+    python benchmarks/bench_time_parser.py [--rounds 200]
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from utils import time_parser
+
+PHRASINGS = [
+    "I need an appointment friday 10",
+    "Can I book an appointment for Friday morning?",
+    "book me in monday at 2",
+    "I'd like to see the doctor tomorrow at 3pm",
+    "Is there a slot today at noon?",
+    "schedule a visit for Tuesday afternoon please",
+    "appointment on wed at 9:30 am",
+    "Could I come in Thursday at 4:15 p.m.?",
+    "I have a sore throat, can I book for Saturday at 11am",
+    "need a consultation on Oct 23rd at 9 am",
+    "book appointment 10/30 at 14:00",
+    "can you fit me in on the 2nd of November in the morning",
+    "Sunday 9am appointment",
+    "next monday afternoon",
+    "I want to book for the day after tomorrow",
+    "appointment tonight if possible",
+    "2026-11-02 10:30",
+    "Are you open this fri at 1?",
+    "book a check-up for Dec 1 at 8:45am",
+    "I've had a headache for three days, can I see someone?",
+    "appointment please",
+    "my kid has a fever, schedule tomorrow morning",
+    "I'd like a visit on Thursday",
+    "can I get in at 10 tomorrow",
+    "Saturday, Oct 24 10:00 AM",
+    "Monday, Nov 2 2:00 PM",
+]
+
+
+def per_parse_us(parse, corpus, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for text in corpus:
+            parse(text)
+    return (time.perf_counter() - start) / (rounds * len(corpus)) * 1e6
+
+
+def check_round_trip(now):
+    """Labels for every half hour from now until a year ahead that parse back to another slot"""
+    first = now.replace(minute=0, second=0, microsecond=0)
+    mismatched = []
+    for step in range(364 * 48):
+        start = first + timedelta(minutes=30 * step)
+        label = time_parser.format_slot(start)
+        parsed = time_parser.parse_appointment_time(label, now)
+        if parsed.start != start:
+            mismatched.append((label, parsed.label))
+    return mismatched
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=200)
+    args = parser.parse_args()
+
+    now = time_parser.datetime.now(time_parser.CLINIC_TIMEZONE)
+    mismatched = check_round_trip(now)
+    if mismatched:
+        for label, parsed in mismatched[:10]:
+            print(f"{label!r} parses back as {parsed!r}")
+        raise SystemExit(f"{len(mismatched)} slot labels do not parse back to their slot")
+    time_parser._parse.cache_clear()
+
+    today = now.date()
+    unmatched = [text for text in PHRASINGS if time_parser._scan(text, today) == (None, None)]
+    matched = [text for text in PHRASINGS if text not in unmatched]
+
+    def cold(text):
+        time_parser._parse.cache_clear()
+        return time_parser.parse_appointment_time(text)
+
+    # Warm up the fallback import so it is not counted against the first round
+    time_parser.parse_appointment_time(unmatched[0] if unmatched else PHRASINGS[0])
+    cold_us = per_parse_us(cold, matched, args.rounds)
+    fallback_rounds = max(1, args.rounds // 20)
+    fallback_us = per_parse_us(cold, unmatched, fallback_rounds) if unmatched else 0.0
+    warm_us = per_parse_us(time_parser.parse_appointment_time, PHRASINGS, args.rounds * 10)
+
+    import dateparser
+    settings = {"PREFER_DATES_FROM": "future"}
+    dateparser_rounds = max(1, args.rounds // 20)
+    dateparser_us = per_parse_us(lambda text: dateparser.parse(text, settings=settings), PHRASINGS, dateparser_rounds)
+
+    print(f"corpus: {len(PHRASINGS)} phrasings, {len(unmatched)} left to the dateparser fallback")
+    print(f"regex parser, cold cache: {cold_us:9.1f} us/parse")
+    print(f"fallback, cold cache:     {fallback_us:9.1f} us/parse  ({fallback_rounds} rounds)")
+    print(f"regex parser, warm cache: {warm_us:9.1f} us/parse")
+    print(f"dateparser.parse:         {dateparser_us:9.1f} us/parse  ({dateparser_rounds} rounds)")
+
+
+if __name__ == "__main__":
+    main()
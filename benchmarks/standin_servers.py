@@ -0,0 +1,181 @@
+"""Local HTTP stand-ins for SendGrid, the Google Calendar API, Google OAuth and OpenAI.
+
+Unlike CLINIC_STUB_INTEGRATIONS, which swaps the clients out, these serve
+the real clients over HTTP, so connection pooling, timeouts, retries and
+the integration metrics are all exercised. Every response waits for
+latency_ms (plus up to jitter_ms) and fails with a 503 at failure_rate.
+
+    with StandInServer(latency_ms=80, failure_rate=0.02) as server:
+        os.environ.update(server.environ())
+        ...
+"""
+import json
+import random
+import threading
+import time
+import uuid
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, as the real providers do
+
+    def log_message(self, format, *args):
+        pass
+
+    def _body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b""
+        try:
+            return json.loads(raw) if raw else {}
+        except ValueError:
+            return {}
+
+    def _send(self, status, body=None, content_type="application/json"):
+        data = b"" if body is None else (body if isinstance(body, bytes) else json.dumps(body).encode())
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _handle(self):
+        server = self.server
+        path = urlsplit(self.path).path
+        provider = server.provider_for(path)
+        body = self._body()
+        server.calls[provider] += 1
+        server.pause()
+        if server.should_fail():
+            server.failures[provider] += 1
+            return self._send(503, {"error": "injected failure"})
+        if provider == "sendgrid":
+            return self._send(202)
+        if provider == "google_auth":
+            return self._send(200, {"access_token": uuid.uuid4().hex, "expires_in": 3600, "token_type": "Bearer"})
+        if provider == "openai":
+            return self._chat_completion(body)
+        if provider == "google_calendar":
+            return self._calendar(path, body)
+        return self._send(404, {"error": f"no stand-in for {path}"})
+
+    def _calendar(self, path, body):
+        if self.command == "GET":
+            return self._send(200, {"items": [], "nextSyncToken": uuid.uuid4().hex})
+        if self.command == "DELETE":
+            return self._send(204)
+        event = dict(body, id=path.rsplit("/", 1)[-1] if self.command != "POST" else uuid.uuid4().hex)
+        event["updated"] = time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime())
+        return self._send(200, event)
+
+    def _chat_completion(self, body):
+        words = self.server.answer.split()
+        if not body.get("stream"):
+            return self._send(200, {
+                "id": "chatcmpl-standin", "object": "chat.completion", "created": int(time.time()),
+                "model": body.get("model", ""),
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": self.server.answer}}],
+            })
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for i, word in enumerate(words + [None]):
+            chunk = {
+                "id": "chatcmpl-standin", "object": "chat.completion.chunk", "created": int(time.time()),
+                "model": body.get("model", ""),
+                "choices": [{"index": 0, "delta": {"content": word + " "} if word else {},
+                             "finish_reason": None if word else "stop"}],
+            }
+            self._chunk(f"data: {json.dumps(chunk)}\n\n".encode())
+            if word and self.server.token_ms:
+                time.sleep(self.server.token_ms / 1000)
+        self._chunk(b"data: [DONE]\n\n")
+        self._chunk(b"")
+
+    def _chunk(self, data):
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = _handle
+
+
+class StandInServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    answer = ("Rest, fluids and paracetamol usually help with a mild fever. "
+              "See a doctor if it lasts more than three days or goes above 39.5C.")
+
+    def __init__(self, latency_ms=50, jitter_ms=0, failure_rate=0.0, token_ms=0, seed=None):
+        super().__init__(("127.0.0.1", 0), _Handler)
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.failure_rate = failure_rate
+        self.token_ms = token_ms
+        self.calls = Counter()
+        self.failures = Counter()
+        self._random = random.Random(seed)
+        self._random_lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def environ(self):
+        """Environment variables that point the app's clients at this server"""
+        return {
+            "SENDGRID_API_KEY": "SG.standin",
+            "SENDGRID_API_BASE": self.url,
+            "OPENAI_API_KEY": "sk-standin",
+            "OPENAI_BASE_URL": f"{self.url}/v1",
+            "GOOGLE_CALENDAR_API_BASE": f"{self.url}/calendar/v3/",
+        }
+
+    def token_info(self):
+        """An authorized-user token file whose refreshes go to this server"""
+        return {
+            "token": "standin-token",
+            "refresh_token": "standin-refresh",
+            "token_uri": f"{self.url}/token",
+            "client_id": "standin.apps.googleusercontent.com",
+            "client_secret": "standin",
+            "scopes": ["https://www.googleapis.com/auth/calendar"],
+            "expiry": "2099-01-01T00:00:00Z",
+        }
+
+    @staticmethod
+    def provider_for(path):
+        if path.startswith("/v3/mail"):
+            return "sendgrid"
+        if path.startswith("/token"):
+            return "google_auth"
+        if path.startswith("/v1/"):
+            return "openai"
+        if path.startswith(("/calendar/", "/batch")):
+            return "google_calendar"
+        return "unknown"
+
+    def pause(self):
+        with self._random_lock:
+            jitter = self._random.uniform(0, self.jitter_ms) if self.jitter_ms else 0
+        if self.latency_ms or jitter:
+            time.sleep((self.latency_ms + jitter) / 1000)
+
+    def should_fail(self):
+        if not self.failure_rate:
+            return False
+        with self._random_lock:
+            return self._random.random() < self.failure_rate
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self.serve_forever, name="standin-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+        self.server_close()
@@ -13,18 +13,32 @@ if (navigator.geolocation) {
 
 async function send() {
   const message = document.getElementById("input").value;
+  const responseElement = document.getElementById("response");
 
   const res = await fetch("/api/ask", {
     method: "POST",
-    headers: { "Content-Type": "application/json" },
+    headers: {
+      "Content-Type": "application/json",
+      "Accept": "text/event-stream"
+    },
     body: JSON.stringify({
       message,
       location: userLocation
     })
   });
 
-  const data = await res.json();
-  document.getElementById("response").innerText = data.response;
+  let data;
+  if ((res.headers.get("Content-Type") || "").startsWith("text/event-stream")) {
+    // Render the answer as it streams in; the "done" event carries the full payload
+    responseElement.innerText = "";
+    data = await readAnswerStream(res, (text) => {
+      responseElement.innerText += text;
+    });
+  } else {
+    data = await res.json();
+  }
+  responseElement.innerText = data.response;
+  window.lastAskAppointment = data.appointment || null;
 
   if (data.confirmation_needed && data.appointment) {
     pendingAppointment = data.appointment;
@@ -35,6 +49,36 @@ async function send() {
   }
 }
 
+async function readAnswerStream(res, onToken) {
+  const reader = res.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = "";
+  let done = { response: "" };
+
+  while (true) {
+    const { value, done: finished } = await reader.read();
+    if (finished) break;
+    buffer += decoder.decode(value, { stream: true });
+
+    let boundary;
+    while ((boundary = buffer.indexOf("\n\n")) !== -1) {
+      const frame = buffer.slice(0, boundary);
+      buffer = buffer.slice(boundary + 2);
+      let event = "message";
+      let payload = "";
+      for (const line of frame.split("\n")) {
+        if (line.startsWith("event: ")) event = line.slice(7);
+        else if (line.startsWith("data: ")) payload += line.slice(6);
+      }
+      if (!payload) continue;
+      const parsed = JSON.parse(payload);
+      if (event === "token") onToken(parsed.text);
+      else if (event === "done") done = parsed;
+    }
+  }
+  return done;
+}
+
 async function confirmAppointment() {
   if (!pendingAppointment) return;
 
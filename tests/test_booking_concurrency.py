@@ -0,0 +1,115 @@
+"""Concurrent bookings through AvailabilityIndex.book(): exactly one wins each slot.
+
+Run from the repository root:
+
+    python -m pytest tests
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.appointment_store import MemoryAppointmentStore
+from utils.availability import AvailabilityIndex
+from utils.sqlite_store import SQLiteAppointmentStore
+from utils.time_parser import CLINIC_TIMEZONE, format_slot
+
+THREADS_PER_SLOT = 16
+SLOTS = 4
+
+
+class SlowWrites:
+    """Store proxy whose add() sleeps first, so racing bookings overlap"""
+
+    def __init__(self, store, write_seconds=0.005):
+        self._store = store
+        self._write_seconds = write_seconds
+
+    def add(self, *args, **kwargs):
+        time.sleep(self._write_seconds)
+        return self._store.add(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._store, name)
+
+
+def next_weekday_starts(count):
+    day = datetime.now(CLINIC_TIMEZONE).replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
+    while day.weekday() >= 5:
+        day += timedelta(days=1)
+    return [day + timedelta(hours=10 + i) for i in range(count)]
+
+
+class BookingConcurrencyTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self._tmp.cleanup)
+
+    def make_store(self, kind):
+        if kind == "sqlite":
+            return SQLiteAppointmentStore(os.path.join(self._tmp.name, "bookings.db"))
+        return MemoryAppointmentStore()
+
+    def race(self, indexes):
+        """Book every slot from THREADS_PER_SLOT threads at once; returns {start: successes}"""
+        starts = next_weekday_starts(SLOTS)
+        barrier = threading.Barrier(THREADS_PER_SLOT * SLOTS)
+        wins = {start: 0 for start in starts}
+        errors = []
+        wins_lock = threading.Lock()
+
+        def work(n):
+            start = starts[n % SLOTS]
+            availability = indexes[n % len(indexes)]
+            appointment = {
+                "confirmationId": f"C{n}",
+                "doctor_id": "drlee",
+                "time": format_slot(start),
+                "start": start.isoformat(),
+                "bookedAt": datetime.now().isoformat(),
+            }
+            barrier.wait()
+            try:
+                if availability.book(appointment, start) is None:
+                    with wins_lock:
+                        wins[start] += 1
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=work, args=(n,)) for n in range(THREADS_PER_SLOT * SLOTS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        return wins
+
+    def assert_one_per_slot(self, store, wins):
+        self.assertEqual(list(wins.values()), [1] * SLOTS)
+        self.assertEqual(sorted(a["start"] for a in store.for_doctor("drlee")),
+                         sorted(start.isoformat() for start in wins))
+
+    def test_one_index(self):
+        for kind in ("memory", "sqlite"):
+            with self.subTest(store=kind):
+                store = SlowWrites(self.make_store(kind))
+                wins = self.race([AvailabilityIndex(store)])
+                self.assert_one_per_slot(store, wins)
+
+    def test_two_workers_sharing_a_store(self):
+        # Separate indexes have separate locks, as in two gunicorn workers;
+        # only the store's compare-and-set on schedule_version keeps them apart
+        for kind in ("memory", "sqlite"):
+            with self.subTest(store=kind):
+                store = SlowWrites(self.make_store(kind))
+                wins = self.race([AvailabilityIndex(store), AvailabilityIndex(store)])
+                self.assert_one_per_slot(store, wins)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,131 @@
+"""Admission control for the public endpoints: token buckets and a concurrency cap.
+
+A request is admitted only if
+- its client's bucket for that route has a token (e.g. 10 bookings a minute per IP),
+- the route's shared bucket has a token (protects the SendGrid, Google and OpenAI quotas),
+- and fewer than max_concurrent admitted requests are still in flight.
+
+Otherwise it is refused at once with how long to wait, so a burst from
+one client is shed in microseconds instead of queueing behind real
+patients. Limits are written "requests/seconds", e.g. "20/60"; "0" or ""
+disables that limit.
+"""
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from utils import metrics
+
+DECISIONS = metrics.counter(
+    "clinic_admission_decisions_total",
+    "Admission decisions for rate-limited routes, by route and outcome",
+    ("route", "outcome"),
+)
+
+
+def parse_limit(text):
+    """'20/60' -> (rate per second, burst), or None when the limit is disabled"""
+    text = (text or "").strip()
+    if not text or text == "0":
+        return None
+    count, _, seconds = text.partition("/")
+    count, seconds = float(count), float(seconds or 1)
+    if count <= 0 or seconds <= 0:
+        return None
+    return count / seconds, count
+
+
+class TokenBucket:
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate, burst, now):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+
+    def take(self, now):
+        """0 if a token was taken, otherwise seconds until one is available"""
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    def refund(self):
+        self.tokens = min(self.burst, self.tokens + 1)
+
+
+class Rejection:
+    def __init__(self, reason, retry_after):
+        self.reason = reason
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class AdmissionController:
+    """Per-client and per-route token buckets plus a global cap on requests in flight.
+
+    routes maps a route name to (per-client limit, route-wide limit), each a
+    (rate, burst) pair from parse_limit() or None. Only the most recently
+    seen max_clients client buckets are kept; a forgotten client starts
+    again with a full bucket.
+    """
+
+    def __init__(self, routes, max_concurrent=64, max_clients=10000, clock=time.monotonic):
+        self.routes = routes
+        self.max_concurrent = max_concurrent
+        self.max_clients = max_clients
+        self.clock = clock
+        self._clients = OrderedDict()
+        self._route_buckets = {}
+        self._in_flight = 0
+        self._lock = threading.Lock()
+
+    def admit(self, route, client):
+        """None if admitted (call release() when the response is done), else a Rejection"""
+        per_client, route_wide = self.routes.get(route, (None, None))
+        now = self.clock()
+        with self._lock:
+            if self.max_concurrent and self._in_flight >= self.max_concurrent:
+                rejection = Rejection("overloaded", 1)
+            else:
+                rejection = self._take_tokens(route, client, per_client, route_wide, now)
+            if rejection is None:
+                self._in_flight += 1
+        DECISIONS.inc(route, rejection.reason if rejection else "admitted")
+        return rejection
+
+    def _take_tokens(self, route, client, per_client, route_wide, now):
+        bucket = None
+        if per_client:
+            key = (route, client)
+            bucket = self._clients.get(key)
+            if bucket is None:
+                bucket = self._clients[key] = TokenBucket(*per_client, now)
+                if len(self._clients) > self.max_clients:
+                    self._clients.popitem(last=False)
+            else:
+                self._clients.move_to_end(key)
+            wait = bucket.take(now)
+            if wait:
+                return Rejection("client_rate_limited", wait)
+        if route_wide:
+            shared = self._route_buckets.get(route)
+            if shared is None:
+                shared = self._route_buckets[route] = TokenBucket(*route_wide, now)
+            wait = shared.take(now)
+            if wait:
+                # The client's token was not used after all
+                if bucket is not None:
+                    bucket.refund()
+                return Rejection("route_rate_limited", wait)
+        return None
+
+    def release(self):
+        with self._lock:
+            self._in_flight -= 1
+
+    def in_flight(self):
+        return self._in_flight
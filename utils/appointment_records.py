@@ -0,0 +1,208 @@
+"""Compact in-memory appointment records for MemoryAppointmentStore.
+
+An appointment dict as submitted carries its own copy of the patient's
+details and a ``patient`` string that repeats their name, so a returning
+patient is stored again with every booking. Here each appointment is an
+AppointmentRecord with one slot per common field, and patient details
+live once in a PatientRegistry, keyed by a normalized identity (email,
+phone digits and name) and shared by every appointment that carries the
+same details. Repeated short values (doctor, status, source, location,
+slot labels) are interned.
+
+Records are read-only mappings with the same keys and values as the dict
+they were made from, so code that reads appointments with ``[]`` and
+``.get()`` is unchanged; to_dict() gives the plain dict back, e.g. for
+JSON responses. Only the store changes them, through set_fields().
+"""
+import json
+import re
+import sys
+import threading
+import weakref
+from collections.abc import Mapping
+
+# Fields with a slot of their own; anything else goes in a per-record dict
+SLOT_FIELDS = (
+    "confirmationId", "doctor_id", "time", "start", "status", "reason", "location", "source", "bookedAt",
+    "calendar_synced", "email_sent", "doctor_notified", "google_event_id", "google_updated", "all_day",
+    "reminders_sent",
+)
+_SLOT_SET = frozenset(SLOT_FIELDS)
+# Values shared by many appointments
+INTERNED_FIELDS = frozenset({"doctor_id", "time", "start", "status", "location", "source"})
+
+_NON_DIGIT = re.compile(r"\D+")
+
+# _patient holds this when the patient string is just the profile's name
+_FROM_PROFILE = object()
+
+
+def full_name(info):
+    return f"{info.get('firstName', '')} {info.get('lastName', '')}".strip()
+
+
+def patient_identity(info):
+    """Who a patientInfo dict describes, ignoring case and phone formatting"""
+    return (
+        str(info.get("email") or "").strip().casefold(),
+        _NON_DIGIT.sub("", str(info.get("phone") or "")),
+        str(info.get("firstName") or "").strip().casefold(),
+        str(info.get("lastName") or "").strip().casefold(),
+    )
+
+
+class PatientProfile(Mapping):
+    """One patient's details, shared read-only by all their appointments"""
+
+    __slots__ = ("_data", "__weakref__")
+
+    def __init__(self, data):
+        self._data = data
+
+    def __getitem__(self, key):
+        return self._data[key]
+
+    def get(self, key, default=None):
+        return self._data.get(key, default)
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+    def __repr__(self):
+        return f"PatientProfile({self._data!r})"
+
+    def to_dict(self):
+        return dict(self._data)
+
+
+class PatientRegistry:
+    """Patient profiles stored once per distinct set of details.
+
+    A patient who books again with the same details gets the profile they
+    already have; changed details (e.g. new allergies) become another
+    profile under the same identity, so every appointment keeps exactly
+    the details it was booked with. Profiles are held weakly: one goes
+    away with the last appointment that uses it, so cancelled, moved and
+    edited appointments do not leave their old details behind.
+    """
+
+    def __init__(self):
+        self._profiles = weakref.WeakValueDictionary()
+        self._lock = threading.Lock()
+
+    def profile(self, info):
+        details = (patient_identity(info), json.dumps(info, sort_keys=True, default=str))
+        with self._lock:
+            profile = self._profiles.get(details)
+            # default=str can make different values look alike, so the match is checked
+            if profile is None or profile._data != info:
+                profile = PatientProfile({sys.intern(str(key)): value for key, value in info.items()})
+                self._profiles[details] = profile
+            return profile
+
+    def __len__(self):
+        return len(self._profiles)
+
+
+class AppointmentRecord(Mapping):
+    """One appointment; see the module docstring. Unset slots are keys the appointment does not have."""
+
+    __slots__ = SLOT_FIELDS + ("_patient", "_profile", "_extra")
+
+    @classmethod
+    def from_dict(cls, appointment, patients):
+        record = cls()
+        record._extra = None
+        record.set_fields(appointment, patients)
+        return record
+
+    def set_fields(self, fields, patients):
+        """Set fields from a dict, as dict.update() would"""
+        if "patientInfo" in fields:
+            patient = self._patient_string()
+            info = fields["patientInfo"]
+            self._profile = patients.profile(info) if isinstance(info, dict) else info
+            if patient is not None:
+                self._set_patient(patient)
+        for key, value in fields.items():
+            if key in _SLOT_SET:
+                if key in INTERNED_FIELDS and type(value) is str:
+                    value = sys.intern(value)
+                setattr(self, key, value)
+            elif key == "patient":
+                self._set_patient(value)
+            elif key != "patientInfo":
+                if self._extra is None:
+                    self._extra = {}
+                self._extra[key] = value
+
+    def _set_patient(self, value):
+        profile = getattr(self, "_profile", None)
+        if isinstance(profile, PatientProfile) and value == full_name(profile):
+            self._patient = _FROM_PROFILE
+        else:
+            self._patient = value
+
+    def _patient_string(self):
+        patient = getattr(self, "_patient", None)
+        return full_name(self._profile) if patient is _FROM_PROFILE else patient
+
+    def __getitem__(self, key):
+        if key in _SLOT_SET:
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+        if key == "patient":
+            if not hasattr(self, "_patient"):
+                raise KeyError(key)
+            return self._patient_string()
+        if key == "patientInfo":
+            try:
+                return self._profile
+            except AttributeError:
+                raise KeyError(key) from None
+        if self._extra is None:
+            raise KeyError(key)
+        return self._extra[key]
+
+    def get(self, key, default=None):
+        # Called for every field on hot paths (availability, search, feeds), so without exceptions
+        if key in _SLOT_SET:
+            return getattr(self, key, default)
+        if key == "patient":
+            return self._patient_string() if hasattr(self, "_patient") else default
+        if key == "patientInfo":
+            return getattr(self, "_profile", default)
+        return self._extra.get(key, default) if self._extra is not None else default
+
+    def __contains__(self, key):
+        return self.get(key, _FROM_PROFILE) is not _FROM_PROFILE
+
+    def __iter__(self):
+        for key in SLOT_FIELDS:
+            if hasattr(self, key):
+                yield key
+        if hasattr(self, "_patient"):
+            yield "patient"
+        if hasattr(self, "_profile"):
+            yield "patientInfo"
+        if self._extra is not None:
+            yield from self._extra
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return f"AppointmentRecord({self.to_dict()!r})"
+
+    def to_dict(self):
+        """The appointment as a plain dict, patientInfo included"""
+        appointment = {}
+        for key in self:
+            value = self[key]
+            appointment[key] = value.to_dict() if isinstance(value, PatientProfile) else value
+        return appointment
@@ -0,0 +1,418 @@
+import bisect
+import os
+import threading
+import time
+from collections import deque
+
+from utils.appointment_records import AppointmentRecord, PatientRegistry
+from utils.striped_lock import StripedLock
+
+
+# Schedule versions for which schedule_changes() can still say what changed
+SCHEDULE_LOG_LENGTH = 1000
+
+
+class SlotTakenError(Exception):
+    """Raised when a doctor's time slot already holds an appointment"""
+
+
+class ScheduleChangedError(SlotTakenError):
+    """Raised by add() or reschedule() when the doctor's schedule_version is no longer expected_version"""
+
+
+class DoctorTimeline:
+    """Appointments for one doctor, kept ordered by (time key, confirmation ID).
+
+    Stored as sorted chunks of at most 2 * CHUNK entries, so an insert or
+    remove anywhere in the timeline moves one chunk rather than the whole
+    history. Positions are (chunk, index in chunk) pairs.
+    """
+
+    CHUNK = 512
+
+    def __init__(self):
+        self._keys = []  # one sorted list of keys per chunk
+        self._items = []
+        self._maxes = []  # last key of each chunk
+        self._len = 0
+
+    def insert(self, key, appointment):
+        if not self._keys:
+            self._keys.append([key])
+            self._items.append([appointment])
+            self._maxes.append(key)
+            self._len = 1
+            return
+        chunk = min(bisect.bisect_right(self._maxes, key), len(self._maxes) - 1)
+        keys, items = self._keys[chunk], self._items[chunk]
+        index = bisect.bisect_right(keys, key)
+        keys.insert(index, key)
+        items.insert(index, appointment)
+        self._maxes[chunk] = keys[-1]
+        self._len += 1
+        if len(keys) > 2 * self.CHUNK:
+            self._keys[chunk:chunk + 1] = [keys[:self.CHUNK], keys[self.CHUNK:]]
+            self._items[chunk:chunk + 1] = [items[:self.CHUNK], items[self.CHUNK:]]
+            self._maxes[chunk:chunk + 1] = [keys[self.CHUNK - 1], keys[-1]]
+
+    def remove(self, key, appointment):
+        chunk, index = self._left(key)
+        while chunk < len(self._keys):
+            keys, items = self._keys[chunk], self._items[chunk]
+            while index < len(keys):
+                if keys[index] != key:
+                    return False
+                if items[index] is appointment:
+                    del keys[index]
+                    del items[index]
+                    self._len -= 1
+                    if keys:
+                        self._maxes[chunk] = keys[-1]
+                    else:
+                        del self._keys[chunk], self._items[chunk], self._maxes[chunk]
+                    return True
+                index += 1
+            chunk, index = chunk + 1, 0
+        return False
+
+    def _left(self, key):
+        """Position of the first entry whose key is >= key"""
+        chunk = bisect.bisect_left(self._maxes, key)
+        if chunk == len(self._maxes):
+            return chunk, 0
+        return chunk, bisect.bisect_left(self._keys[chunk], key)
+
+    def _right(self, key):
+        """Position of the first entry whose key is > key"""
+        chunk = bisect.bisect_right(self._maxes, key)
+        if chunk == len(self._maxes):
+            return chunk, 0
+        return chunk, bisect.bisect_right(self._keys[chunk], key)
+
+    def _range(self, start, end):
+        lo = (0, 0) if start is None else self._left((start,))
+        hi = (len(self._keys), 0) if end is None else self._left((end,))
+        return lo, hi
+
+    def _slices(self, lo, hi):
+        """Appointments from position lo up to hi, a list per chunk; whole chunks are not copied"""
+        chunk, index = lo
+        while (chunk, index) < hi:
+            items = self._items[chunk]
+            stop = hi[1] if chunk == hi[0] else len(items)
+            yield items if index == 0 and stop == len(items) else items[index:stop]
+            chunk, index = chunk + 1, 0
+
+    def between(self, start=None, end=None):
+        appointments = []
+        for part in self._slices(*self._range(start, end)):
+            appointments.extend(part)
+        return appointments
+
+    def page(self, start=None, end=None, after=None, limit=50, status=None):
+        """Up to limit appointments in [start, end) that sort after the (time key, confirmation ID) after"""
+        lo, hi = self._range(start, end)
+        if after is not None:
+            lo = max(lo, self._right(tuple(after)))
+        page = []
+        for part in self._slices(lo, hi):
+            for appointment in part:
+                if status is None or appointment.get("status") == status:
+                    page.append(appointment)
+                    if len(page) == limit:
+                        return page
+        return page
+
+    def __len__(self):
+        return self._len
+
+
+def order_key(appointment):
+    """Key used to order a doctor's appointments in time: the slot start, or booking time for older records"""
+    return appointment.get("start") or appointment.get("bookedAt") or ""
+
+
+def timeline_key(appointment):
+    return order_key(appointment), appointment["confirmationId"]
+
+
+class MemoryAppointmentStore:
+    """In-process appointment store with hash indexes by slot, doctor and confirmation ID.
+
+    Only safe with a single worker process; see SQLiteAppointmentStore for a
+    store shared between gunicorn workers. Outbox tasks passed to add() are
+    enqueued right after the appointment is indexed, not atomically with it.
+    Writes take a lock striped by doctor, so different doctors' bookings do
+    not wait on each other. Appointments are kept as compact
+    AppointmentRecords sharing patient details through self.patients; see
+    utils.appointment_records.
+    """
+
+    def __init__(self, outbox=None, idempotency=None):
+        self.outbox = outbox
+        self.idempotency = idempotency
+        self._lock = threading.Lock()  # leases
+        self._doctor_locks = StripedLock()
+        self._by_id = {}
+        self._by_slot = {}
+        self._by_doctor = {}
+        self._by_event = {}
+        self._versions = {}
+        self._data_versions = {}
+        self._schedule_log = {}
+        self._state = {}
+        self._leases = {}
+        self._listeners = []
+        self.patients = PatientRegistry()
+
+    def _record(self, appointment):
+        """What an appointment is kept as"""
+        return AppointmentRecord.from_dict(appointment, self.patients)
+
+    def add_listener(self, callback):
+        """Call callback(doctor_id, data_version, changes) after every change made through this store.
+
+        changes is a list of (confirmation ID, appointment) pairs, the
+        appointment being None once removed. Callbacks run under the
+        doctor's write lock, in version order, and must not write to the
+        store.
+        """
+        self._listeners.append(callback)
+
+    def _check_version(self, doctor_id, expected_version):
+        if expected_version is not None and self._versions.get(doctor_id, 0) != expected_version:
+            raise ScheduleChangedError(doctor_id)
+
+    def add(self, appointment, outbox_tasks=(), expected_version=None, idempotent=None):
+        """Store a new appointment and its outbox tasks, raising SlotTakenError if its slot is booked.
+
+        A confirmation ID already stored raises SlotTakenError too, as the
+        SQLite store's primary key does. With expected_version, raises ScheduleChangedError instead of storing
+        if the doctor's schedule_version has moved on since it was read.
+        idempotent=(route, key, result) records result for that
+        Idempotency-Key once the appointment is stored.
+        """
+        doctor_id = appointment.get("doctor_id")
+        with self._doctor_locks(doctor_id):
+            self._check_version(doctor_id, expected_version)
+            record = self._insert(appointment)
+            self._bump(doctor_id, [(appointment["confirmationId"], record)], starts=[appointment.get("start")])
+        if outbox_tasks:
+            self.outbox.enqueue(outbox_tasks)
+        if idempotent:
+            self.idempotency.finish(*idempotent)
+        return appointment
+
+    def _insert(self, appointment):
+        """Index a new appointment; the caller holds the doctor's lock and bumps the version"""
+        doctor_id = appointment.get("doctor_id")
+        slot = (doctor_id, appointment.get("time"))
+        if slot in self._by_slot:
+            raise SlotTakenError(slot)
+        record = self._record(appointment)
+        # setdefault claims the ID in one step, so another doctor's writer cannot take it too;
+        # a duplicate is refused like the SQLite store's primary key refuses it
+        if self._by_id.setdefault(appointment["confirmationId"], record) is not record:
+            raise SlotTakenError(slot)
+        self._by_slot[slot] = record
+        timeline = self._by_doctor.get(doctor_id)
+        if timeline is None:
+            timeline = self._by_doctor[doctor_id] = DoctorTimeline()
+        timeline.insert(timeline_key(appointment), record)
+        if appointment.get("google_event_id"):
+            self._by_event[appointment["google_event_id"]] = record
+        return record
+
+    def add_many(self, appointments, outbox_tasks_for=None):
+        """Store a batch of new appointments, returning those whose slot or confirmation ID was taken.
+
+        Each doctor's schedule_version moves on once per batch, as in
+        SQLiteAppointmentStore.add_many().
+        """
+        rejected = []
+        by_doctor = {}
+        for appointment in appointments:
+            by_doctor.setdefault(appointment.get("doctor_id"), []).append(appointment)
+        for doctor_id, batch in by_doctor.items():
+            stored = []
+            changes = []
+            with self._doctor_locks(doctor_id):
+                for appointment in batch:
+                    try:
+                        changes.append((appointment["confirmationId"], self._insert(appointment)))
+                    except SlotTakenError:
+                        rejected.append(appointment)
+                        continue
+                    stored.append(appointment)
+                if changes:
+                    self._bump(doctor_id, changes, starts=[appointment.get("start") for appointment in stored])
+            if outbox_tasks_for:
+                for appointment in stored:
+                    self.outbox.enqueue(outbox_tasks_for(appointment))
+        return rejected
+
+    def remove(self, confirmation_id):
+        appointment = self._by_id.get(confirmation_id)
+        if appointment is None:
+            return None
+        doctor_id = appointment.get("doctor_id")
+        with self._doctor_locks(doctor_id):
+            if self._by_id.pop(confirmation_id, None) is not appointment:
+                return None
+            slot = (doctor_id, appointment.get("time"))
+            if self._by_slot.get(slot) is appointment:
+                del self._by_slot[slot]
+            timeline = self._by_doctor.get(doctor_id)
+            if timeline is not None:
+                timeline.remove(timeline_key(appointment), appointment)
+            self._by_event.pop(appointment.get("google_event_id"), None)
+            self._bump(doctor_id, [(confirmation_id, None)], starts=[appointment.get("start")])
+            return appointment
+
+    def update(self, confirmation_id, **fields):
+        """Set top-level fields on a stored appointment that do not affect its slot"""
+        appointment = self._by_id.get(confirmation_id)
+        if appointment is None:
+            return None
+        with self._doctor_locks(appointment.get("doctor_id")):
+            if self._by_id.get(confirmation_id) is appointment:
+                if "google_event_id" in fields:
+                    self._by_event.pop(appointment.get("google_event_id"), None)
+                    if fields["google_event_id"]:
+                        self._by_event[fields["google_event_id"]] = appointment
+                self._set_fields(appointment, fields)
+                self._bump(appointment.get("doctor_id"), [(confirmation_id, appointment)], schedule=False)
+            return appointment
+
+    def reschedule(self, confirmation_id, time, expected_version=None, **fields):
+        """Move an appointment to another slot, raising SlotTakenError if that slot is booked.
+
+        expected_version works as for add().
+        """
+        appointment = self._by_id.get(confirmation_id)
+        if appointment is None:
+            return None
+        doctor_id = appointment.get("doctor_id")
+        with self._doctor_locks(doctor_id):
+            if self._by_id.get(confirmation_id) is not appointment:
+                return None
+            self._check_version(doctor_id, expected_version)
+            old_slot = (doctor_id, appointment.get("time"))
+            new_slot = (doctor_id, time)
+            holder = self._by_slot.get(new_slot)
+            if holder is not None and holder is not appointment:
+                raise SlotTakenError(new_slot)
+            if self._by_slot.get(old_slot) is appointment:
+                del self._by_slot[old_slot]
+            timeline = self._by_doctor[doctor_id]
+            timeline.remove(timeline_key(appointment), appointment)
+            old_start = appointment.get("start")
+            self._set_fields(appointment, dict(fields, time=time))
+            self._by_slot[new_slot] = appointment
+            timeline.insert(timeline_key(appointment), appointment)
+            self._bump(doctor_id, [(confirmation_id, appointment)], starts=[old_start, appointment.get("start")])
+            return appointment
+
+    def _set_fields(self, appointment, fields):
+        if isinstance(appointment, AppointmentRecord):
+            appointment.set_fields(fields, self.patients)
+        else:
+            appointment.update(fields)
+
+    def _bump(self, doctor_id, changes, schedule=True, starts=()):
+        if schedule:
+            version = self._versions[doctor_id] = self._versions.get(doctor_id, 0) + 1
+            log = self._schedule_log.get(doctor_id)
+            if log is None:
+                log = self._schedule_log[doctor_id] = deque(maxlen=SCHEDULE_LOG_LENGTH)
+            log.append((version, [start for start in starts if start]))
+        version = self._data_versions[doctor_id] = self._data_versions.get(doctor_id, 0) + 1
+        for callback in self._listeners:
+            callback(doctor_id, version, changes)
+
+    def schedule_version(self, doctor_id):
+        """Counter bumped by every add, remove or reschedule for a doctor"""
+        return self._versions.get(doctor_id, 0)
+
+    def schedule_changes(self, doctor_id, since_version):
+        """(schedule_version, starts of the appointments added, removed or moved since since_version).
+
+        None if since_version is too far back to say; rebuild from for_doctor() then.
+        """
+        with self._doctor_locks(doctor_id):
+            version = self._versions.get(doctor_id, 0)
+            log = self._schedule_log.get(doctor_id, ())
+            if since_version > version or (version > since_version and (not log or log[0][0] > since_version + 1)):
+                return None
+            return version, {start for logged, starts in log if logged > since_version for start in starts}
+
+    def data_version(self, doctor_id):
+        """Counter bumped by every change to a doctor's appointments, including update()"""
+        return self._data_versions.get(doctor_id, 0)
+
+    def get(self, confirmation_id):
+        return self._by_id.get(confirmation_id)
+
+    def find_by_google_event_id(self, google_event_id):
+        return self._by_event.get(google_event_id)
+
+    def find_conflict(self, doctor_id, time):
+        """Return the appointment already holding this doctor's slot, if any"""
+        return self._by_slot.get((doctor_id, time))
+
+    def for_doctor(self, doctor_id):
+        timeline = self._by_doctor.get(doctor_id)
+        return timeline.between() if timeline else []
+
+    def for_doctor_between(self, doctor_id, start=None, end=None):
+        """Appointments for a doctor whose time key falls in [start, end)"""
+        timeline = self._by_doctor.get(doctor_id)
+        return timeline.between(start, end) if timeline else []
+
+    def page_for_doctor(self, doctor_id, start=None, end=None, after=None, limit=50, status=None):
+        """Keyset page of a doctor's appointments: time key in [start, end), sorting after the key pair after"""
+        with self._doctor_locks(doctor_id):
+            timeline = self._by_doctor.get(doctor_id)
+            return timeline.page(start, end, after, limit, status) if timeline else []
+
+    def get_state(self, key, default=None):
+        """Small piece of persistent bookkeeping, e.g. a calendar sync token"""
+        return self._state.get(key, default)
+
+    def set_state(self, key, value):
+        self._state[key] = value
+
+    def acquire_lease(self, name, owner, ttl):
+        """Claim name for owner for ttl seconds; True if owner now holds it"""
+        with self._lock:
+            now = time.time()
+            holder = self._leases.get(name)
+            if holder and holder[0] != owner and holder[1] > now:
+                return False
+            self._leases[name] = (owner, now + ttl)
+            return True
+
+    def __len__(self):
+        return len(self._by_id)
+
+    def __iter__(self):
+        return iter(list(self._by_id.values()))
+
+
+def create_appointment_store(url=None):
+    """Build the appointment store named by url or $APPOINTMENT_STORE_URL.
+
+    Supported URLs are ``memory://`` and ``sqlite:///path/to/file.db``. The
+    in-memory store keeps its outbox in $OUTBOX_DB (default outbox.db) and
+    its idempotency keys in this process.
+    """
+    url = url or os.getenv("APPOINTMENT_STORE_URL", "sqlite:///clinic.db")
+    if url.startswith("memory://"):
+        from utils.idempotency import IdempotencyCache
+        from utils.outbox import Outbox
+        return MemoryAppointmentStore(outbox=Outbox(os.getenv("OUTBOX_DB", "outbox.db")),
+                                      idempotency=IdempotencyCache())
+    if url.startswith("sqlite:///"):
+        from utils.sqlite_store import SQLiteAppointmentStore
+        return SQLiteAppointmentStore(url[len("sqlite:///"):])
+    raise ValueError(f"Unsupported appointment store URL: {url}")
@@ -0,0 +1,282 @@
+"""Per-doctor availability kept as one slot bitmap per day.
+
+A day is SLOTS_PER_DAY bits (15-minute slots); bit i set means slot i is
+taken. Working hours are a bitmask per weekday, so the free slots of a day
+are ``hours & ~booked`` and "n consecutive free slots" is a handful of
+shifts and ANDs on a Python int rather than a loop over slots.
+"""
+import threading
+from datetime import datetime, timedelta
+
+from utils.appointment_store import ScheduleChangedError, SlotTakenError
+from utils.striped_lock import StripedLock
+from utils.time_parser import CLINIC_TIMEZONE
+
+SLOT_MINUTES = 15
+SLOTS_PER_DAY = 24 * 60 // SLOT_MINUTES
+APPOINTMENT_MINUTES = 60
+FULL_DAY = (1 << SLOTS_PER_DAY) - 1
+
+# weekday -> (opening hour, closing hour); days not listed are closed
+DEFAULT_WORKING_HOURS = {0: (9, 17), 1: (9, 17), 2: (9, 17), 3: (9, 17), 4: (9, 17), 5: (9, 13)}
+
+
+def hours_mask(open_hour, close_hour):
+    first = open_hour * 60 // SLOT_MINUTES
+    last = close_hour * 60 // SLOT_MINUTES
+    return ((1 << (last - first)) - 1) << first
+
+
+class DoctorSchedule:
+    def __init__(self, version):
+        self.version = version
+        self.days = {}
+
+    def mark(self, day, mask):
+        self.days[day] = self.days.get(day, 0) | mask
+
+    def clear(self, day, mask):
+        self.days[day] = self.days.get(day, 0) & ~mask
+
+
+class AvailabilityIndex:
+    """Free and booked slots per doctor, derived from the appointment store.
+
+    When the store's schedule_version for a doctor has moved on, because
+    another worker process or the calendar sync changed the schedule, the
+    next query rebuilds just the days the store's schedule_changes() log
+    names, or every day if the log no longer reaches back that far.
+    Bookings and reschedules made through this index, and booked(),
+    booked_many() and released(), are applied in place.
+
+    book() and reschedule() check a slot and write it as one step; see book().
+    """
+
+    def __init__(self, store, working_hours=None, appointment_minutes=APPOINTMENT_MINUTES, booking_locks=None,
+                 max_attempts=5):
+        self.store = store
+        self.booking_locks = booking_locks or StripedLock()
+        self.max_attempts = max_attempts
+        self.working_hours = working_hours or {}
+        self.slots_needed = -(-appointment_minutes // SLOT_MINUTES)
+        self._span_mask = (1 << self.slots_needed) - 1
+        # Appointments start on the hour grid of the appointment length
+        self._starts_mask = sum(1 << i for i in range(0, SLOTS_PER_DAY, self.slots_needed))
+        self._hours = {}
+        self._schedules = {}
+        self._lock = threading.Lock()
+
+    def _hours_for(self, doctor_id, day):
+        key = (doctor_id, day.weekday())
+        mask = self._hours.get(key)
+        if mask is None:
+            hours = self.working_hours.get(doctor_id, DEFAULT_WORKING_HOURS).get(day.weekday())
+            mask = self._hours[key] = hours_mask(*hours) if hours else 0
+        return mask
+
+    def _position(self, start):
+        start = start.astimezone(CLINIC_TIMEZONE)
+        return start.date(), (start.hour * 60 + start.minute) // SLOT_MINUTES
+
+    def slot_mask(self, start):
+        """(day, mask) of the slots an appointment starting at start occupies"""
+        day, offset = self._position(start)
+        return day, (self._span_mask << offset) & FULL_DAY
+
+    def _footprint(self, appointment):
+        """(day, mask) of the slots an appointment occupies, or None if it has no start or is cancelled"""
+        start = appointment.get("start")
+        if not start or appointment.get("status") == "cancelled":
+            return None
+        day, mask = self.slot_mask(datetime.fromisoformat(start))
+        return (day, FULL_DAY) if appointment.get("all_day") else (day, mask)
+
+    def _schedule(self, doctor_id):
+        version = self.store.schedule_version(doctor_id)
+        schedule = self._schedules.get(doctor_id)
+        if schedule is not None and schedule.version == version:
+            return schedule
+        changed = self.store.schedule_changes(doctor_id, schedule.version) if schedule is not None else None
+        if changed is None:
+            schedule = DoctorSchedule(version)
+            for appointment in self.store.for_doctor(doctor_id):
+                footprint = self._footprint(appointment)
+                if footprint:
+                    schedule.mark(*footprint)
+        else:
+            with self._lock:
+                days = dict(schedule.days)
+            schedule = DoctorSchedule(changed[0])
+            schedule.days = days
+            for day in {self._position(datetime.fromisoformat(start))[0] for start in changed[1]}:
+                self._rebuild_day(doctor_id, schedule, day)
+        with self._lock:
+            self._schedules[doctor_id] = schedule
+        return schedule
+
+    def _rebuild_day(self, doctor_id, schedule, day):
+        # Starts are kept in clinic time, but look a day either side in case one is not
+        mask = 0
+        for appointment in self.store.for_doctor_between(
+                doctor_id, (day - timedelta(days=1)).isoformat(), (day + timedelta(days=2)).isoformat()):
+            footprint = self._footprint(appointment)
+            if footprint and footprint[0] == day:
+                mask |= footprint[1]
+        if mask:
+            schedule.days[day] = mask
+        else:
+            schedule.days.pop(day, None)
+
+    def _apply(self, doctor_id, cleared=(), marked=()):
+        """Apply the one schedule change just written: the (day, mask) footprints cleared, then marked"""
+        with self._lock:
+            schedule = self._schedules.get(doctor_id)
+            if schedule is None:
+                return
+            if self.store.schedule_version(doctor_id) != schedule.version + 1:
+                # Someone else changed the schedule too; the next query catches up from the store
+                return
+            for footprint in cleared:
+                if footprint:
+                    schedule.clear(*footprint)
+            for footprint in marked:
+                if footprint:
+                    schedule.mark(*footprint)
+            schedule.version += 1
+
+    def booked(self, appointment):
+        """Record an appointment just added to the store"""
+        if appointment is not None:
+            self._apply(appointment.get("doctor_id"), marked=[self._footprint(appointment)])
+
+    def booked_many(self, doctor_id, appointments):
+        """Record a doctor's appointments just added to the store by one add_many() call"""
+        if appointments:
+            self._apply(doctor_id, marked=[self._footprint(appointment) for appointment in appointments])
+
+    def released(self, appointment):
+        """Record an appointment just removed from the store"""
+        if appointment is not None:
+            self._apply(appointment.get("doctor_id"), cleared=[self._footprint(appointment)])
+
+    def check(self, doctor_id, start, ignore=None, now=None):
+        """None if an appointment can start at start, otherwise 'past', 'closed', 'off_grid' or 'booked'.
+
+        Appointments start only where free_slots() offers them, on the grid
+        of the appointment length ('off_grid' otherwise).
+        ignore is an appointment whose own slots count as free, for rescheduling it.
+        """
+        now = now or datetime.now(CLINIC_TIMEZONE)
+        if start < now:
+            return "past"
+        day, mask = self.slot_mask(start)
+        if self._hours_for(doctor_id, day) & mask != mask:
+            return "closed"
+        offset = self._position(start)[1]
+        if not self._starts_mask >> offset & 1 or start.minute % SLOT_MINUTES or start.second or start.microsecond:
+            return "off_grid"
+        booked = self.booked_mask(doctor_id, day)
+        if ignore is not None:
+            footprint = self._footprint(ignore)
+            if footprint and footprint[0] == day:
+                booked &= ~footprint[1]
+        return "booked" if booked & mask else None
+
+    def _claim(self, doctor_id, start, write, ignore=None):
+        with self.booking_locks(doctor_id):
+            for _ in range(self.max_attempts):
+                version = self.store.schedule_version(doctor_id)
+                unavailable = self.check(doctor_id, start, ignore=ignore)
+                if unavailable:
+                    return unavailable
+                try:
+                    write(version)
+                except ScheduleChangedError:
+                    continue
+                except SlotTakenError:
+                    return "booked"
+                return None
+        # The schedule kept changing under us; treat the slot as taken
+        return "booked"
+
+    def book(self, appointment, start, outbox_tasks=(), idempotent=None):
+        """Check that start is free and add appointment to the store, atomically per doctor.
+
+        Returns None once the appointment is stored, otherwise the reason
+        from check(). Bookings for one doctor are serialised by a lock
+        striped by doctor, so other doctors never wait on them. The store
+        write is a compare-and-set on the doctor's schedule_version, so a
+        change made between the check and the write by another process or
+        the calendar sync fails the write and the check is repeated.
+        idempotent is passed on to store.add().
+        """
+        doctor_id = appointment.get("doctor_id")
+
+        def write(version):
+            self.store.add(appointment, outbox_tasks=outbox_tasks, expected_version=version, idempotent=idempotent)
+            self.booked(appointment)
+
+        return self._claim(doctor_id, start, write)
+
+    def reschedule(self, appointment, start, time):
+        """Move a stored appointment to start (labelled time); returns None or the reason, as book()"""
+        doctor_id = appointment.get("doctor_id")
+        old = self._footprint(appointment)
+        new = self._footprint({"start": start.isoformat(), "all_day": appointment.get("all_day")})
+
+        def write(version):
+            self.store.reschedule(appointment["confirmationId"], time, expected_version=version, start=start.isoformat())
+            self._apply(doctor_id, cleared=[old], marked=[new])
+
+        return self._claim(doctor_id, start, write, ignore=appointment)
+
+    def booked_mask(self, doctor_id, day):
+        """Bitmap of a doctor's taken slots on day"""
+        return self._schedule(doctor_id).days.get(day, 0)
+
+    def is_free(self, doctor_id, start, ignore=None):
+        return self.check(doctor_id, start, ignore) is None
+
+    def _free_starts(self, doctor_id, day, days, now):
+        free = self._hours_for(doctor_id, day) & ~days.get(day, 0)
+        starts = free
+        for k in range(1, self.slots_needed):
+            starts &= free >> k
+        starts &= self._starts_mask
+        if day == now.date():
+            starts &= ~((1 << ((now.hour * 60 + now.minute) // SLOT_MINUTES + 1)) - 1)
+        return starts
+
+    def free_slots(self, doctor_id, first_day, days=7, now=None):
+        """Start datetimes of every free appointment slot in [first_day, first_day + days)"""
+        now = (now or datetime.now(CLINIC_TIMEZONE)).astimezone(CLINIC_TIMEZONE)
+        booked = self._schedule(doctor_id).days
+        slots = []
+        for i in range(days):
+            day = first_day + timedelta(days=i)
+            if day < now.date():
+                continue
+            starts = self._free_starts(doctor_id, day, booked, now)
+            midnight = datetime.combine(day, datetime.min.time(), tzinfo=CLINIC_TIMEZONE)
+            while starts:
+                low = starts & -starts
+                slots.append(midnight + timedelta(minutes=(low.bit_length() - 1) * SLOT_MINUTES))
+                starts ^= low
+        return slots
+
+    def next_free(self, doctor_id, after, horizon_days=14):
+        """First free slot starting at or after after, looking up to horizon_days ahead"""
+        now = datetime.now(CLINIC_TIMEZONE)
+        after = max(after, now).astimezone(CLINIC_TIMEZONE)
+        booked = self._schedule(doctor_id).days
+        day, offset = self._position(after)
+        for i in range(horizon_days):
+            current = day + timedelta(days=i)
+            starts = self._free_starts(doctor_id, current, booked, now)
+            if i == 0:
+                starts &= ~((1 << offset) - 1)
+            if starts:
+                minutes = ((starts & -starts).bit_length() - 1) * SLOT_MINUTES
+                return datetime.combine(current, datetime.min.time(), tzinfo=CLINIC_TIMEZONE) + timedelta(minutes=minutes)
+        return None
+
@@ -0,0 +1,219 @@
+"""Bulk import of existing appointments from CSV or JSONL.
+
+Rows are read one at a time, validated, checked against the doctor's
+schedule and the rows already accepted from the same file, and written in
+batches of batch_size per transaction. Confirmation emails and calendar
+events are only queued when asked for.
+
+Columns (CSV header or JSONL keys): firstName and lastName (or patient),
+time (free text) or start (ISO 8601), and optionally email, phone, age,
+gender, reason, location, doctor_id, status and confirmationId.
+
+Command line, against the store named by $APPOINTMENT_STORE_URL:
+
+    python -m utils.bulk_import appointments.csv --doctor drlee [--notify] [--calendar]
+"""
+import argparse
+import csv
+import io
+import json
+import sys
+import time
+import uuid
+from datetime import datetime
+
+from utils.outbox import booking_tasks
+from utils.time_parser import CLINIC_TIMEZONE, format_slot, parse_appointment_time
+
+PATIENT_FIELDS = ("firstName", "lastName", "email", "phone", "age", "gender", "medicalId", "allergies")
+
+
+class RowError(Exception):
+    pass
+
+
+def iter_rows(stream, fmt):
+    """(row number, dict) pairs from a binary or text stream, read lazily"""
+    if isinstance(stream, io.TextIOBase):
+        text = stream
+    else:
+        text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    if fmt == "csv":
+        # Row 1 is the header
+        for number, row in enumerate(csv.DictReader(text), start=2):
+            yield number, {key.strip(): (value or "").strip() for key, value in row.items() if key}
+        return
+    for number, line in enumerate(text, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield number, RowError(f"Invalid JSON: {e}")
+            continue
+        yield number, row if isinstance(row, dict) else RowError("Each line must be a JSON object")
+
+
+def detect_format(filename="", content_type=""):
+    if filename.endswith((".jsonl", ".ndjson")) or "json" in content_type:
+        return "jsonl"
+    return "csv"
+
+
+def parse_start(row):
+    if row.get("start"):
+        try:
+            start = datetime.fromisoformat(str(row["start"]).replace("Z", "+00:00"))
+        except ValueError:
+            raise RowError(f"Invalid start: {row['start']}")
+        if start.tzinfo is None:
+            start = start.replace(tzinfo=CLINIC_TIMEZONE)
+        return start.astimezone(CLINIC_TIMEZONE)
+    if not row.get("time"):
+        raise RowError("Missing time or start")
+    slot = parse_appointment_time(str(row["time"]))
+    if not slot.matched:
+        raise RowError(f"Could not understand time: {row['time']}")
+    return slot.start
+
+
+def appointment_from_row(row, doctor_id):
+    patient_info = {field: str(row.get(field, "") or "") for field in PATIENT_FIELDS}
+    if not patient_info["firstName"] and row.get("patient"):
+        first, _, last = str(row["patient"]).partition(" ")
+        patient_info.update(firstName=first, lastName=last)
+    if not patient_info["firstName"]:
+        raise RowError("Missing patient name")
+    start = parse_start(row)
+    return {
+        "patient": f"{patient_info['firstName']} {patient_info['lastName']}".strip(),
+        "patientInfo": patient_info,
+        "time": format_slot(start),
+        "start": start.isoformat(),
+        "reason": str(row.get("reason", "") or ""),
+        "location": str(row.get("location", "") or ""),
+        "doctor_id": doctor_id,
+        "status": str(row.get("status") or "confirmed"),
+        "confirmationId": str(row.get("confirmationId") or f"AC{datetime.now():%Y%m%d}{uuid.uuid4().hex[:8].upper()}"),
+        "bookedAt": datetime.now().isoformat(),
+        "source": "import",
+    }
+
+
+class AppointmentImporter:
+    """Validates, conflict-checks and stores rows in batches; see the module docstring.
+
+    side_effects lists the outbox task kinds to queue for every imported
+    appointment (none by default).
+    """
+
+    def __init__(self, store, availability, doctors, doctor_id, batch_size=500, side_effects=()):
+        self.store = store
+        self.availability = availability
+        self.doctors = doctors
+        self.doctor_id = doctor_id
+        self.batch_size = batch_size
+        self.side_effects = tuple(side_effects)
+
+    def run(self, rows):
+        started = time.perf_counter()
+        errors = []
+        imported = total = 0
+        claimed = {}  # (doctor_id, day) -> slots taken by earlier rows of this file
+        batch = []
+
+        def flush():
+            nonlocal imported
+            tasks_for = None
+            if self.side_effects:
+                tasks_for = lambda appointment: booking_tasks(appointment["confirmationId"], self.side_effects)
+            # Patients may have booked since the rows were checked; re-check
+            # under the doctor's booking lock so the batch cannot overlap them
+            with self.availability.booking_locks(self.doctor_id):
+                fresh = []
+                for number, appointment, day, mask in batch:
+                    if self.availability.booked_mask(self.doctor_id, day) & mask:
+                        errors.append({"row": number, "error": f"{appointment['time']} overlaps another appointment"})
+                    else:
+                        fresh.append((number, appointment))
+                # Live rows first, so a cancelled one never holds the slot label a live one needs
+                fresh.sort(key=lambda item: item[1]["status"] == "cancelled")
+                rejected = {id(a) for a in self.store.add_many([a for _, a in fresh], outbox_tasks_for=tasks_for)}
+                # Keep the bitmaps current rather than rebuilding them on the next check
+                self.availability.booked_many(self.doctor_id, [a for _, a in fresh if id(a) not in rejected])
+            for number, appointment in fresh:
+                if id(appointment) in rejected:
+                    errors.append({"row": number, "error": "Slot or confirmation ID already taken"})
+                else:
+                    imported += 1
+            batch.clear()
+
+        for number, row in rows:
+            total += 1
+            try:
+                if isinstance(row, RowError):
+                    raise row
+                doctor_id = row.get("doctor_id") or self.doctor_id
+                if doctor_id != self.doctor_id or doctor_id not in self.doctors:
+                    raise RowError(f"Cannot import appointments for doctor {doctor_id}")
+                appointment = appointment_from_row(row, doctor_id)
+                day, mask = self.availability.slot_mask(datetime.fromisoformat(appointment["start"]))
+                if appointment["status"] == "cancelled":
+                    mask = 0  # holds no time, so neither conflicts nor blocks later rows
+                key = (doctor_id, day)
+                if (self.availability.booked_mask(doctor_id, day) | claimed.get(key, 0)) & mask:
+                    raise RowError(f"{appointment['time']} overlaps another appointment")
+            except RowError as e:
+                errors.append({"row": number, "error": str(e)})
+                continue
+            claimed[key] = claimed.get(key, 0) | mask
+            batch.append((number, appointment, day, mask))
+            if len(batch) >= self.batch_size:
+                flush()
+        if batch:
+            flush()
+
+        seconds = time.perf_counter() - started
+        errors.sort(key=lambda error: error["row"])
+        return {
+            "rows": total,
+            "imported": imported,
+            "failed": len(errors),
+            "errors": errors,
+            "seconds": round(seconds, 3),
+            "rows_per_second": round(total / seconds, 1) if seconds else None,
+        }
+
+
+def main():
+    from utils.appointment_store import create_appointment_store
+    from utils.availability import AvailabilityIndex
+
+    parser = argparse.ArgumentParser(description="Import appointments from a CSV or JSONL file")
+    parser.add_argument("path", help="CSV or JSONL file, or - for stdin")
+    parser.add_argument("--doctor", required=True)
+    parser.add_argument("--format", choices=("csv", "jsonl"))
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--notify", action="store_true", help="queue patient and doctor emails")
+    parser.add_argument("--calendar", action="store_true", help="queue Google Calendar events")
+    parser.add_argument("--store", help="store URL (default $APPOINTMENT_STORE_URL)")
+    args = parser.parse_args()
+
+    store = create_appointment_store(args.store)
+    side_effects = (["calendar_event"] if args.calendar else []) + (
+        ["patient_confirmation_email", "doctor_notification_email"] if args.notify else [])
+    importer = AppointmentImporter(store, AvailabilityIndex(store), {args.doctor}, args.doctor,
+                                   batch_size=args.batch_size, side_effects=side_effects)
+    fmt = args.format or detect_format(args.path)
+    if args.path == "-":
+        report = importer.run(iter_rows(sys.stdin.buffer, fmt))
+    else:
+        with open(args.path, "rb") as f:
+            report = importer.run(iter_rows(f, fmt))
+    json.dump(report, sys.stdout, indent=2)
+    print()
+    return 1 if report["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,134 @@
+import random
+import time
+from contextlib import nullcontext
+
+from utils.circuit_breaker import CircuitOpenError
+
+# Google recommends at most 50 calls per Calendar batch request
+MAX_BATCH_SIZE = 50
+
+# Sub-request statuses worth sending again; anything else is final
+RETRYABLE_STATUSES = {403, 429, 500, 502, 503, 504}
+
+
+class CalendarOperation:
+    """One insert, patch or delete against a doctor's primary calendar.
+
+    key identifies the operation in the results (usually a confirmation ID).
+    """
+
+    def __init__(self, key, kind, event_id=None, body=None):
+        if kind not in ("insert", "patch", "delete"):
+            raise ValueError(f"Unknown calendar operation: {kind}")
+        self.key = key
+        self.kind = kind
+        self.event_id = event_id
+        self.body = body
+
+    def request(self, service):
+        events = service.events()
+        if self.kind == "insert":
+            return events.insert(calendarId="primary", body=self.body)
+        if self.kind == "patch":
+            return events.patch(calendarId="primary", eventId=self.event_id, body=self.body)
+        return events.delete(calendarId="primary", eventId=self.event_id)
+
+
+class CalendarOperationResult:
+    def __init__(self, operation):
+        self.key = operation.key
+        self.kind = operation.kind
+        self.ok = False
+        self.status = None
+        self.event = None
+        self.error = None
+        self.attempts = 0
+
+    def as_dict(self):
+        return {
+            "key": self.key,
+            "kind": self.kind,
+            "ok": self.ok,
+            "status": self.status,
+            "eventId": (self.event or {}).get("id"),
+            "error": self.error,
+            "attempts": self.attempts,
+        }
+
+
+def _error_status(exception):
+    resp = getattr(exception, "resp", None)
+    return getattr(resp, "status", None)
+
+
+def batch_calendar_writes(service, operations, batch_size=MAX_BATCH_SIZE, max_attempts=3, base_delay=1.0,
+                          breaker=None):
+    """Send calendar writes as Google batch requests of up to batch_size operations.
+
+    Returns (results, round_trips): one CalendarOperationResult per operation,
+    in input order, and the number of batch HTTP requests sent. Only
+    sub-requests that failed with a retryable status are sent again, with
+    exponential backoff between rounds. Deleting an event that is already
+    gone counts as success. With a circuit breaker, each batch request goes
+    through it, and once it is open the operations not yet done fail at once.
+    batch.execute() does not raise for failed sub-requests, so each one the
+    breaker's is_failure() blames on Google (5xx, 429) is reported to it.
+    """
+    results = [CalendarOperationResult(op) for op in operations]
+    pending = list(range(len(operations)))
+    round_trips = 0
+
+    for attempt in range(1, max_attempts + 1):
+        if not pending:
+            break
+        if attempt > 1:
+            time.sleep(base_delay * 2 ** (attempt - 2) * random.uniform(0.5, 1.0))
+        retry = []
+        for start in range(0, len(pending), batch_size):
+            chunk = pending[start:start + batch_size]
+            faults = []
+
+            def callback(request_id, response, exception):
+                index = int(request_id)
+                result = results[index]
+                result.attempts = attempt
+                if exception is None:
+                    result.ok = True
+                    result.status = 200
+                    result.event = response or None
+                    result.error = None
+                    return
+                status = _error_status(exception)
+                result.status = status
+                result.error = str(exception)
+                if breaker and breaker.is_failure(exception):
+                    faults.append(index)
+                if operations[index].kind == "delete" and status in (404, 410):
+                    result.ok = True
+                    result.error = None
+                elif status is None or status in RETRYABLE_STATUSES:
+                    retry.append(index)
+
+            batch = service.new_batch_http_request(callback=callback)
+            for index in chunk:
+                batch.add(operations[index].request(service), request_id=str(index))
+            try:
+                with breaker.call() if breaker else nullcontext() as call:
+                    batch.execute()
+                    if faults:
+                        call.failed(len(faults))
+                round_trips += 1
+            except CircuitOpenError as e:
+                for index in pending[start:]:
+                    results[index].error = str(e)
+                return results, round_trips
+            except Exception as e:
+                # The whole batch failed in transit; every operation in it is retried
+                print(f"Google Calendar batch request failed: {e}")
+                for index in chunk:
+                    results[index].attempts = attempt
+                    results[index].error = str(e)
+                retry.extend(i for i in chunk if not results[i].ok and i not in retry)
+        pending = sorted(set(retry))
+
+    return results, round_trips
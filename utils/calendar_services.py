@@ -0,0 +1,176 @@
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+from utils import integrations
+from utils.striped_lock import StripedLock
+
+
+class _CachedCredentials:
+    def __init__(self, credentials, mtime):
+        self.credentials = credentials
+        self.mtime = mtime
+        self.checked_at = time.monotonic()
+
+
+class CalendarServiceCache:
+    """Authorized Google Calendar services, cached per doctor.
+
+    Credentials are read from token_<doctor_id>.json once and shared by all
+    threads; each thread keeps its own service object because the underlying
+    httplib2 connection is not thread-safe. The token file's mtime is checked
+    at most every recheck_seconds, and a changed file replaces the cached
+    credentials. A background refresher renews access tokens refresh_margin
+    before they expire, so requests never refresh inline unless it is late.
+
+    A refresh works on a copy of the credentials and holds only that
+    doctor's refresh lock, never the cache lock, so requests for other
+    doctors (and for this one, while its token is still valid) do not wait
+    on the network. The refreshed copy is swapped in afterwards. Every
+    worker process runs a refresher; each writes the token file through its
+    own temporary file, and a worker that sees the file change loads the
+    token another worker refreshed instead of refreshing again.
+    """
+
+    def __init__(self, scopes, token_file_pattern="token_{doctor_id}.json", recheck_seconds=5,
+                 refresh_margin=timedelta(minutes=5), refresh_interval=60):
+        self.scopes = scopes
+        self.token_file_pattern = token_file_pattern
+        self.recheck_seconds = recheck_seconds
+        self.refresh_margin = refresh_margin
+        self.refresh_interval = refresh_interval
+        self._lock = threading.Lock()
+        self._refresh_locks = StripedLock()
+        self._credentials = {}
+        self._services = threading.local()
+        self._refresher_pid = None
+
+    def token_file(self, doctor_id):
+        return self.token_file_pattern.format(doctor_id=doctor_id)
+
+    def _load(self, doctor_id):
+        token_file = self.token_file(doctor_id)
+        try:
+            mtime = os.stat(token_file).st_mtime_ns
+        except FileNotFoundError:
+            print(f"No token file found: {token_file}")
+            return None
+        cached = self._credentials.get(doctor_id)
+        if cached and cached.mtime == mtime:
+            cached.checked_at = time.monotonic()
+            return cached
+        try:
+            from google.oauth2.credentials import Credentials
+
+            credentials = Credentials.from_authorized_user_file(token_file, self.scopes)
+        except Exception as load_error:
+            print(f"Error loading credentials: {load_error}")
+            return None
+        entry = self._credentials[doctor_id] = _CachedCredentials(credentials, mtime)
+        return entry
+
+    def _entry(self, doctor_id):
+        cached = self._credentials.get(doctor_id)
+        if cached and time.monotonic() - cached.checked_at < self.recheck_seconds:
+            return cached
+        with self._lock:
+            return self._load(doctor_id)
+
+    def _refresh(self, doctor_id, entry):
+        """Refresh entry's token and swap the result in; returns the entry now cached"""
+        from google.oauth2.credentials import Credentials
+
+        with self._refresh_locks(doctor_id):
+            current = self._credentials.get(doctor_id)
+            if current is not None and current is not entry:
+                return current  # refreshed by another thread, or reloaded from another worker's file
+            credentials = Credentials.from_authorized_user_info(json.loads(entry.credentials.to_json()), self.scopes)
+            with integrations.timed("google_auth", "token_refresh"):
+                credentials.refresh(integrations.google_auth_request())
+            token_file = self.token_file(doctor_id)
+            tmp_file = f"{token_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_file, "w") as token:
+                token.write(credentials.to_json())
+            os.replace(tmp_file, token_file)
+            refreshed = _CachedCredentials(credentials, os.stat(token_file).st_mtime_ns)
+            with self._lock:
+                if self._credentials.get(doctor_id) is not entry:
+                    return self._credentials.get(doctor_id) or refreshed
+                self._credentials[doctor_id] = refreshed
+            return refreshed
+
+    def get(self, doctor_id):
+        """Authorized calendar service for doctor_id, or None if it is not connected"""
+        entry = self._entry(doctor_id)
+        if entry is None:
+            return None
+        credentials = entry.credentials
+        if not credentials.valid:
+            if not (credentials.expired and credentials.refresh_token):
+                print("Credentials are invalid and cannot be refreshed")
+                return None
+            # The background refresher fell behind; refresh inline this once
+            try:
+                entry = self._refresh(doctor_id, entry)
+            except Exception as refresh_error:
+                print(f"Error refreshing credentials: {refresh_error}")
+                return None
+            credentials = entry.credentials
+
+        services = getattr(self._services, "by_doctor", None)
+        if services is None:
+            services = self._services.by_doctor = {}
+        cached = services.get(doctor_id)
+        if cached and cached[0] is entry:
+            return cached[1]
+        try:
+            service = integrations.google_calendar_service(credentials)
+        except Exception as build_error:
+            print(f"Error building service: {build_error}")
+            return None
+        services[doctor_id] = (entry, service)
+        return service
+
+    def invalidate(self, doctor_id):
+        with self._lock:
+            self._credentials.pop(doctor_id, None)
+
+    def refresh_expiring(self):
+        """Renew every cached token that expires within refresh_margin"""
+        deadline = datetime.utcnow() + self.refresh_margin
+        expiring = []
+        with self._lock:
+            for doctor_id in list(self._credentials):
+                entry = self._load(doctor_id)
+                if entry is None:
+                    self._credentials.pop(doctor_id, None)
+                    continue
+                credentials = entry.credentials
+                if credentials.refresh_token and not (credentials.expiry and credentials.expiry > deadline):
+                    expiring.append((doctor_id, entry))
+        for doctor_id, entry in expiring:
+            try:
+                self._refresh(doctor_id, entry)
+                print(f"Refreshed Google token for {doctor_id}")
+            except Exception as refresh_error:
+                print(f"Error refreshing credentials for {doctor_id}: {refresh_error}")
+
+    def ensure_refresher_started(self):
+        """Start the background token refresher in this process if it is not running yet"""
+        if self._refresher_pid == os.getpid():
+            return
+        with self._lock:
+            if self._refresher_pid == os.getpid():
+                return
+            threading.Thread(target=self._refresh_loop, name="google-token-refresher", daemon=True).start()
+            self._refresher_pid = os.getpid()
+
+    def _refresh_loop(self):
+        while True:
+            time.sleep(self.refresh_interval)
+            try:
+                self.refresh_expiring()
+            except Exception as e:
+                print(f"Google token refresher error: {e}")
@@ -0,0 +1,240 @@
+import os
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from utils.appointment_store import SlotTakenError
+from utils.time_parser import CLINIC_TIMEZONE, format_slot
+
+
+def event_start(event):
+    start = event.get("start", {})
+    if "dateTime" in start:
+        return datetime.fromisoformat(start["dateTime"].replace("Z", "+00:00"))
+    if "date" in start:
+        return datetime.fromisoformat(start["date"]).replace(tzinfo=CLINIC_TIMEZONE)
+    return None
+
+
+def event_time_label(event):
+    start = event_start(event)
+    if start is None:
+        return None
+    if "dateTime" not in event.get("start", {}):
+        return f"{start:%A}, {start:%b} {start.day} (all day)"
+    return format_slot(start)
+
+
+def appointment_from_event(doctor_id, event):
+    """Appointment record for a Google Calendar event created outside the clinic app"""
+    return {
+        "patient": event.get("summary", "(no title)"),
+        "time": event_time_label(event),
+        "start": event_start(event).astimezone(CLINIC_TIMEZONE).isoformat(),
+        "reason": event.get("description", "") or event.get("summary", ""),
+        "location": "Google Calendar",
+        "doctor_id": doctor_id,
+        "status": "confirmed",
+        "confirmationId": f"GC{event['id']}",
+        "bookedAt": event.get("created") or datetime.now().isoformat(),
+        "source": "google_calendar",
+        "google_event_id": event["id"],
+        "google_updated": event.get("updated"),
+        "calendar_synced": True,
+        "all_day": "dateTime" not in event.get("start", {}),
+    }
+
+
+def empty_sync_stats():
+    return {
+        "last_sync_at": None,
+        "last_full_sync_at": None,
+        "last_duration_seconds": 0.0,
+        "last_events": 0,
+        "events_per_second": 0.0,
+        "total_events": 0,
+        "last_error": None,
+    }
+
+
+class CalendarSyncEngine:
+    """Incremental sync of each doctor's primary Google Calendar into the appointment store.
+
+    The first sync lists every event and stores Google's nextSyncToken; later
+    syncs send that token and only receive events changed since. Events are
+    merged into the store by google_event_id. A 410 Gone response means the
+    token has expired, and triggers one full resync. The background loop
+    started by ensure_started() syncs all connected doctors on a fixed
+    interval, holding a store lease per doctor so only one worker process
+    syncs a doctor at a time. Sync statistics are kept in the store so any
+    worker can report them.
+    """
+
+    def __init__(self, store, service_for_doctor, doctor_ids, interval=60, page_size=250):
+        self.store = store
+        self.service_for_doctor = service_for_doctor
+        self.doctor_ids = doctor_ids
+        self.interval = interval
+        self.page_size = page_size
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._pid = None
+        self._start_lock = threading.Lock()
+        self._doctor_locks = {}
+
+    def _token_key(self, doctor_id):
+        return f"calendar_sync_token:{doctor_id}"
+
+    def _pages(self, service, sync_token):
+        page_token = None
+        while True:
+            params = {"calendarId": "primary", "showDeleted": True, "singleEvents": True,
+                      "maxResults": self.page_size}
+            if sync_token:
+                params["syncToken"] = sync_token
+            if page_token:
+                params["pageToken"] = page_token
+            response = service.events().list(**params).execute()
+            yield response
+            page_token = response.get("nextPageToken")
+            if not page_token:
+                return
+
+    def _merge(self, doctor_id, event):
+        existing = self.store.find_by_google_event_id(event["id"])
+        if event.get("status") == "cancelled":
+            if existing:
+                self.store.remove(existing["confirmationId"])
+            return
+        label = event_time_label(event)
+        if label is None:
+            return
+        if existing is None:
+            confirmation_id = event.get("extendedProperties", {}).get("private", {}).get("clinicConfirmationId")
+            if confirmation_id and self.store.get(confirmation_id):
+                # Created by the clinic, seen before the booking recorded its event id
+                self.store.update(confirmation_id, google_event_id=event["id"], google_updated=event.get("updated"))
+                return
+            try:
+                self.store.add(appointment_from_event(doctor_id, event))
+            except SlotTakenError:
+                print(f"Google event {event['id']} overlaps a booked slot ({label}); not imported")
+            return
+        if existing.get("google_updated") is None:
+            # First time we see an event the clinic created itself; remember
+            # its version so only later edits made in Google are applied
+            self.store.update(existing["confirmationId"], google_updated=event.get("updated"))
+            return
+        if existing.get("google_updated") == event.get("updated"):
+            return
+        fields = {"google_updated": event.get("updated")}
+        if existing.get("source") == "google_calendar":
+            fields["patient"] = event.get("summary", existing.get("patient"))
+            fields["reason"] = event.get("description", "") or event.get("summary", "")
+        try:
+            if label != existing.get("time"):
+                start = event_start(event).astimezone(CLINIC_TIMEZONE).isoformat()
+                self.store.reschedule(existing["confirmationId"], label, start=start, **fields)
+            else:
+                self.store.update(existing["confirmationId"], **fields)
+        except SlotTakenError:
+            print(f"Google event {event['id']} moved onto a booked slot ({label}); keeping local time")
+
+    def _remove_missing(self, doctor_id, seen_event_ids):
+        for appointment in self.store.for_doctor(doctor_id):
+            if appointment.get("source") == "google_calendar" and appointment.get("google_event_id") not in seen_event_ids:
+                self.store.remove(appointment["confirmationId"])
+
+    def _stats_key(self, doctor_id):
+        return f"calendar_sync_stats:{doctor_id}"
+
+    def sync_doctor(self, doctor_id):
+        """Pull changes for one doctor; returns the number of events processed or None if not connected"""
+        lock = self._doctor_locks.setdefault(doctor_id, threading.Lock())
+        with lock:
+            service = self.service_for_doctor(doctor_id)
+            if service is None:
+                return None
+            stats = self.store.get_state(self._stats_key(doctor_id)) or empty_sync_stats()
+            sync_token = self.store.get_state(self._token_key(doctor_id))
+            started = time.perf_counter()
+            try:
+                try:
+                    processed = self._sync_pass(doctor_id, service, sync_token)
+                except Exception as e:
+                    # googleapiclient's HttpError (or the stub's) with 410 Gone
+                    if getattr(getattr(e, "resp", None), "status", None) != 410 or not sync_token:
+                        raise
+                    print(f"Sync token for {doctor_id} expired; running a full resync")
+                    self.store.set_state(self._token_key(doctor_id), None)
+                    sync_token = None
+                    processed = self._sync_pass(doctor_id, service, None)
+            except Exception as e:
+                stats["last_error"] = str(e)
+                self.store.set_state(self._stats_key(doctor_id), stats)
+                raise
+            duration = time.perf_counter() - started
+            stats.update(
+                last_sync_at=time.time(),
+                last_duration_seconds=round(duration, 4),
+                last_events=processed,
+                events_per_second=round(processed / duration, 1) if duration else 0.0,
+                total_events=stats["total_events"] + processed,
+                last_error=None,
+            )
+            if not sync_token:
+                stats["last_full_sync_at"] = stats["last_sync_at"]
+            self.store.set_state(self._stats_key(doctor_id), stats)
+            return processed
+
+    def _sync_pass(self, doctor_id, service, sync_token):
+        processed = 0
+        seen = set()
+        next_sync_token = None
+        for page in self._pages(service, sync_token):
+            for event in page.get("items", []):
+                self._merge(doctor_id, event)
+                seen.add(event["id"])
+                processed += 1
+            next_sync_token = page.get("nextSyncToken")
+        if not sync_token:
+            self._remove_missing(doctor_id, seen)
+        if next_sync_token:
+            self.store.set_state(self._token_key(doctor_id), next_sync_token)
+        return processed
+
+    def sync_all(self):
+        for doctor_id in self.doctor_ids():
+            if not self.store.acquire_lease(f"calendar_sync:{doctor_id}", self.owner, self.interval * 2):
+                continue
+            try:
+                self.sync_doctor(doctor_id)
+            except Exception as e:
+                print(f"Error syncing Google Calendar for {doctor_id}: {e}")
+
+    def ensure_started(self):
+        """Start the background sync loop in this process if it is not running yet"""
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            threading.Thread(target=self._run_forever, name="calendar-sync", daemon=True).start()
+            self._pid = os.getpid()
+
+    def _run_forever(self):
+        while True:
+            started = time.monotonic()
+            self.sync_all()
+            time.sleep(max(0.0, self.interval - (time.monotonic() - started)))
+
+    def status(self):
+        """Per-doctor sync statistics, with lag measured from the last successful sync"""
+        now = time.time()
+        status = {}
+        for doctor_id in self.doctor_ids():
+            stats = self.store.get_state(self._stats_key(doctor_id))
+            if stats:
+                last = stats.get("last_sync_at")
+                status[doctor_id] = dict(stats, lag_seconds=round(now - last, 3) if last else None)
+        return status
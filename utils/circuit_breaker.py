@@ -0,0 +1,159 @@
+"""Circuit breakers for outbound integrations: stop calling a provider that keeps failing.
+
+A breaker starts closed and lets every call through. After
+failure_threshold failures in a row (errors the provider is to blame for,
+failures reported through the call's failed(), or calls that took longer
+than latency_budget) it opens, and calls fail at once with CircuitOpenError
+instead of each waiting out a timeout. The breaker only measures a call
+once it returns; the client's own timeout is what stops it waiting longer
+than the budget (see utils.integrations). After
+reset_timeout it lets up to half_open_trials calls through as probes: if
+they all succeed it closes again; if one fails it reopens for twice as
+long as last time, up to max_reset_timeout, with jitter so that workers do
+not all probe at the same moment.
+"""
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from utils import metrics
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+TRANSITIONS = metrics.counter(
+    "clinic_circuit_breaker_transitions_total",
+    "Circuit breaker state changes, by breaker and the state entered",
+    ("breaker", "state"),
+)
+REJECTED = metrics.counter(
+    "clinic_circuit_breaker_rejected_total",
+    "Calls failed fast because their circuit breaker was open",
+    ("breaker",),
+)
+
+
+class CircuitOpenError(Exception):
+    """The breaker is open; retry_after is seconds until it next lets a probe through"""
+
+    def __init__(self, name, retry_after):
+        super().__init__(f"{name} is unavailable; calls are paused for {retry_after:.0f}s")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class BreakerCall:
+    """Handle for one call through a breaker, yielded by CircuitBreaker.call()"""
+
+    __slots__ = ("failures",)
+
+    def __init__(self):
+        self.failures = 0
+
+    def failed(self, count=1):
+        """Count failures the provider answered with but that did not raise, e.g. batch sub-requests"""
+        self.failures += count
+
+
+class CircuitBreaker:
+    """One breaker per provider; see the module docstring.
+
+    Wrap each call in ``with breaker.call():``. is_failure(exception)
+    decides whether an exception counts against the provider; by default
+    every exception does.
+    """
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30.0, max_reset_timeout=300.0,
+                 half_open_trials=1, latency_budget=None, is_failure=None, clock=time.monotonic):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+        self.half_open_trials = half_open_trials
+        self.latency_budget = latency_budget
+        self.is_failure = is_failure or (lambda error: True)
+        self.clock = clock
+        self._state = CLOSED
+        self._failures = 0
+        self._opened = 0  # times reopened since last closed, for the backoff
+        self._open_until = 0.0
+        self._trials = 0
+        self._successes = 0
+        self._lock = threading.Lock()
+
+    def _enter(self, state):
+        self._state = state
+        TRANSITIONS.inc(self.name, state)
+
+    def _admit(self):
+        with self._lock:
+            if self._state == OPEN:
+                now = self.clock()
+                if now < self._open_until:
+                    REJECTED.inc(self.name)
+                    raise CircuitOpenError(self.name, self._open_until - now)
+                self._enter(HALF_OPEN)
+                self._trials = self._successes = 0
+            if self._state == HALF_OPEN:
+                if self._trials >= self.half_open_trials:
+                    # Probes are still out; wait for their outcome
+                    REJECTED.inc(self.name)
+                    raise CircuitOpenError(self.name, self.reset_timeout)
+                self._trials += 1
+
+    def _record(self, ok, failures=1):
+        with self._lock:
+            if ok:
+                self._failures = 0
+                if self._state == HALF_OPEN:
+                    self._successes += 1
+                    if self._successes >= self.half_open_trials:
+                        self._opened = 0
+                        self._enter(CLOSED)
+                return
+            self._failures += failures
+            if self._state == HALF_OPEN or (self._state == CLOSED and self._failures >= self.failure_threshold):
+                timeout = min(self.max_reset_timeout, self.reset_timeout * 2 ** self._opened)
+                self._open_until = self.clock() + timeout * random.uniform(0.5, 1.0)
+                self._opened += 1
+                self._enter(OPEN)
+
+    @contextmanager
+    def call(self):
+        """Run the body as one call, raising CircuitOpenError instead if the breaker is open.
+
+        Yields a BreakerCall; failures reported through its failed() are
+        recorded in place of the call's own success.
+        """
+        self._admit()
+        call = BreakerCall()
+        started = self.clock()
+        try:
+            yield call
+        except Exception as e:
+            self._record(not self.is_failure(e))
+            raise
+        if call.failures:
+            self._record(False, call.failures)
+        else:
+            self._record(self.latency_budget is None or self.clock() - started <= self.latency_budget)
+
+    def reset(self):
+        """Close the breaker and forget past failures"""
+        with self._lock:
+            self._failures = self._opened = 0
+            if self._state != CLOSED:
+                self._enter(CLOSED)
+
+    def status(self):
+        with self._lock:
+            state = self._state
+            if state == OPEN and self.clock() >= self._open_until:
+                state = HALF_OPEN  # the next call will be a probe
+            return {
+                "state": state,
+                "consecutive_failures": self._failures,
+                "retry_after": round(max(0.0, self._open_until - self.clock()), 1) if state == OPEN else 0.0,
+            }
@@ -1,9 +1,10 @@
 import os
-import sendgrid
 from sendgrid.helpers.mail import Mail, Email, To, Content, Attachment
 import base64
 import datetime
 
+from utils import integrations
+
 def send_email_with_ics(to_email, subject, body, summary, start_time, end_time, location):
     sg_api_key = os.getenv("SENDGRID_API_KEY")
     from_email_address = os.getenv("SENDGRID_VERIFIED_EMAIL")
@@ -16,7 +17,7 @@ def send_email_with_ics(to_email, subject, body, summary, start_time, end_time,
         print("Missing SENDGRID_VERIFIED_EMAIL.")
         return
 
-    sg = sendgrid.SendGridAPIClient(api_key=sg_api_key)
+    sg = integrations.sendgrid_client()
 
     # Generate ICS data
     dtstamp = datetime.datetime.utcnow().strftime("%Y%m%dT%H%M%SZ")
@@ -0,0 +1,56 @@
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+from markupsafe import Markup
+
+# Stands in for the message body while the layout is rendered once at startup
+_CONTENT_MARKER = "\x00email-content\x00"
+
+
+class EmailTemplate:
+    def __init__(self, prefix, suffix, html_body, text_body):
+        self.prefix = prefix
+        self.suffix = suffix
+        self.html_body = html_body
+        self.text_body = text_body
+
+    def render(self, **context):
+        """(html, text) for one message"""
+        return (
+            self.prefix + self.html_body.render(context) + self.suffix,
+            self.text_body.render(context),
+        )
+
+
+class EmailTemplates:
+    """Email templates compiled once and cached for the life of the process.
+
+    The shared layout (styles, header and footer) is rendered once per email
+    type when it is registered, so sending a message only renders the
+    per-patient body. HTML is auto-escaped; every email has a plain-text
+    alternative rendered from a matching .txt template.
+    """
+
+    def __init__(self, directory):
+        self.env = Environment(
+            loader=FileSystemLoader(directory),
+            autoescape=select_autoescape(["html"]),
+            auto_reload=False,
+            cache_size=-1,
+            trim_blocks=True,
+            lstrip_blocks=True,
+            keep_trailing_newline=True,
+        )
+        self.templates = {}
+
+    def register(self, name, **chrome):
+        """Compile <name>.html and <name>.txt and pre-render the layout with chrome"""
+        shell = self.env.get_template("layout.html").render(content=Markup(_CONTENT_MARKER), **chrome)
+        prefix, suffix = shell.split(_CONTENT_MARKER)
+        self.templates[name] = EmailTemplate(
+            prefix,
+            suffix,
+            self.env.get_template(f"{name}.html"),
+            self.env.get_template(f"{name}.txt"),
+        )
+
+    def render(self, name, **context):
+        return self.templates[name].render(**context)
@@ -0,0 +1,52 @@
+from utils.response_cache import normalize_prompt
+
+SYSTEM_PROMPT = (
+    "You are the front-desk assistant of a small medical clinic. Give brief, general "
+    "health information in plain language. Do not diagnose or prescribe. If symptoms "
+    "sound urgent, tell the patient to call emergency services. Keep answers under 150 words."
+)
+
+
+class HealthAssistant:
+    """Answers general health inquiries with an OpenAI chat model.
+
+    stream() yields the answer as the model produces it. Completed answers
+    are cached under the normalized question, so a repeated inquiry is
+    answered from the cache without a model call; an answer cut short by a
+    disconnect or an error is never cached.
+    """
+
+    def __init__(self, client, model, cache, max_tokens=400):
+        self.client = client
+        self.model = model
+        self.cache = cache
+        self.max_tokens = max_tokens
+
+    def stream(self, question):
+        key = normalize_prompt(question)
+        cached = self.cache.get(key)
+        if cached is not None:
+            yield cached
+            return
+        response = self.client().chat.completions.create(
+            model=self.model,
+            messages=[
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": question},
+            ],
+            max_tokens=self.max_tokens,
+            stream=True,
+        )
+        parts = []
+        try:
+            for chunk in response:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    parts.append(chunk.choices[0].delta.content)
+                    yield parts[-1]
+        finally:
+            # Releases the HTTP connection if the patient disconnects mid-answer
+            response.close()
+        self.cache.put(key, "".join(parts))
+
+    def answer(self, question):
+        return "".join(self.stream(question))
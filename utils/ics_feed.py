@@ -0,0 +1,141 @@
+"""Per-doctor iCalendar (.ics) subscription feeds built from the appointment store.
+
+Each appointment's VEVENT is serialised once and kept until a field it
+shows changes, and the whole feed is reassembled only when the doctor's
+data_version moves on. The assembled feed is held precompressed with a
+strong ETag, so a calendar client polling an unchanged feed costs one
+version lookup and a 304.
+"""
+import hashlib
+import hmac
+import threading
+from datetime import datetime, timedelta, timezone
+
+from utils.availability import APPOINTMENT_MINUTES
+from utils.static_pages import PrecompressedBody
+
+PRODID = "-//AI Clinic//Appointments//EN"
+
+# Fields that appear in a VEVENT; a change to any other field keeps the cached text
+EVENT_FIELDS = ("start", "all_day", "time", "status", "patient", "reason", "location", "bookedAt")
+
+
+def escape_text(value):
+    """TEXT value escaping from RFC 5545 section 3.3.11; CRLF and lone CR count as line breaks"""
+    value = str(value).replace("\r\n", "\n").replace("\r", "\n")
+    return value.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,").replace("\n", "\\n")
+
+
+def fold(line):
+    """Split a content line into 75-octet pieces, continuation lines starting with a space"""
+    data = line.encode("utf-8")
+    if len(data) <= 75:
+        return line + "\r\n"
+    pieces = []
+    while data:
+        limit = 75 if not pieces else 74
+        cut = min(limit, len(data))
+        # Never split inside a multi-byte UTF-8 sequence
+        while cut < len(data) and data[cut] & 0xC0 == 0x80:
+            cut -= 1
+        pieces.append(data[:cut].decode("utf-8"))
+        data = data[cut:]
+    return "\r\n ".join(pieces) + "\r\n"
+
+
+def _utc(value):
+    return value.astimezone(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+
+
+def vevent(appointment, domain="clinic"):
+    """The VEVENT for one appointment, or "" if it has no start time"""
+    if not appointment.get("start"):
+        return ""
+    start = datetime.fromisoformat(appointment["start"])
+    booked_at = appointment.get("bookedAt")
+    stamp = datetime.fromisoformat(booked_at) if booked_at else start
+    if stamp.tzinfo is None:
+        stamp = stamp.astimezone()
+    lines = [
+        "BEGIN:VEVENT",
+        f"UID:{appointment['confirmationId']}@{domain}",
+        f"DTSTAMP:{_utc(stamp)}",
+    ]
+    if appointment.get("all_day"):
+        lines += [f"DTSTART;VALUE=DATE:{start:%Y%m%d}", f"DTEND;VALUE=DATE:{start + timedelta(days=1):%Y%m%d}"]
+    else:
+        end = start + timedelta(minutes=APPOINTMENT_MINUTES)
+        lines += [f"DTSTART:{_utc(start)}", f"DTEND:{_utc(end)}"]
+    summary = appointment.get("patient") or "Appointment"
+    if appointment.get("reason"):
+        summary = f"{summary} - {appointment['reason']}"
+    lines.append(f"SUMMARY:{escape_text(summary)}")
+    if appointment.get("location"):
+        lines.append(f"LOCATION:{escape_text(appointment['location'])}")
+    lines.append(f"DESCRIPTION:{escape_text('Confirmation ' + appointment['confirmationId'])}")
+    lines.append("STATUS:CANCELLED" if appointment.get("status") == "cancelled" else "STATUS:CONFIRMED")
+    lines.append("END:VEVENT")
+    return "".join(fold(line) for line in lines)
+
+
+class _DoctorFeed:
+    def __init__(self, version, events, body):
+        self.version = version
+        self.events = events  # confirmation ID -> (event fields, VEVENT text)
+        self.body = body
+
+
+class IcsFeed:
+    """Cached .ics feeds per doctor, with capability tokens derived from secret.
+
+    get(doctor_id) returns a PrecompressedBody; call .response(...) on it to
+    answer the request with ETag and If-None-Match handling.
+    """
+
+    def __init__(self, store, secret, name="Clinic appointments", domain="clinic"):
+        self.store = store
+        self.secret = secret.encode() if isinstance(secret, str) else secret
+        self.name = name
+        self.domain = domain
+        self._feeds = {}
+        self._lock = threading.Lock()
+
+    def token_for(self, doctor_id):
+        return hmac.new(self.secret, f"ics:{doctor_id}".encode(), hashlib.sha256).hexdigest()[:32]
+
+    def verify(self, doctor_id, token):
+        return hmac.compare_digest(self.token_for(doctor_id), token or "")
+
+    def get(self, doctor_id):
+        version = self.store.data_version(doctor_id)
+        feed = self._feeds.get(doctor_id)
+        if feed is not None and feed.version == version:
+            return feed.body
+        with self._lock:
+            feed = self._feeds.get(doctor_id)
+            if feed is not None and feed.version == version:
+                return feed.body
+            # The version is read before the appointments, so a change made
+            # meanwhile only causes one more rebuild on the next request
+            previous = feed.events if feed is not None else {}
+            events = {}
+            for appointment in self.store.for_doctor(doctor_id):
+                fields = tuple(appointment.get(field) for field in EVENT_FIELDS)
+                cached = previous.get(appointment["confirmationId"])
+                if cached is not None and cached[0] == fields:
+                    events[appointment["confirmationId"]] = cached
+                else:
+                    events[appointment["confirmationId"]] = (fields, vevent(appointment, self.domain))
+            body = "".join([
+                "BEGIN:VCALENDAR\r\n",
+                "VERSION:2.0\r\n",
+                f"PRODID:{PRODID}\r\n",
+                "CALSCALE:GREGORIAN\r\n",
+                "METHOD:PUBLISH\r\n",
+                fold(f"X-WR-CALNAME:{escape_text(self.name)}"),
+                *(text for _, text in events.values()),
+                "END:VCALENDAR\r\n",
+            ])
+            body = PrecompressedBody(body, "text/calendar", fast=True)
+            feed = self._feeds[doctor_id] = _DoctorFeed(version, events, body)
+        return feed.body
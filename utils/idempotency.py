@@ -0,0 +1,245 @@
+"""Idempotency-Key support: remember what a request did so a retry can be answered the same way.
+
+A client that may retry a request (e.g. a booking whose response was lost
+to a mobile timeout) sends an Idempotency-Key header, the same value on
+every attempt. The first attempt runs; its result is kept for ttl seconds
+and any retry with that key gets the stored result instead of running
+again, so nothing is booked, synced or emailed twice. A retry that arrives
+while the first attempt is still running waits for it rather than racing
+it. Reusing a key for a different request body is refused.
+
+Each appointment store carries the cache its bookings use, as
+``store.idempotency``. SQLiteIdempotencyCache keeps keys in the store's
+database, so every worker process shares them, and a booking's result is
+written in the same transaction as the appointment: a retry that lands on
+another worker gets the original confirmation. IdempotencyCache keeps
+them in this process only, for the in-memory store, at most max_entries
+of them, the oldest completed ones forgotten first.
+
+IDEMPOTENCY_TTL sets how long results are kept (default one day).
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from utils import metrics
+
+OUTCOMES = metrics.counter(
+    "clinic_idempotency_requests_total",
+    "Requests carrying an Idempotency-Key, by route and outcome",
+    ("route", "outcome"),
+)
+
+MAX_KEY_LENGTH = 255
+DEFAULT_TTL = int(os.getenv("IDEMPOTENCY_TTL", str(24 * 3600)))
+
+
+class IdempotencyConflict(Exception):
+    """The key cannot be used for this request; status is the HTTP status to answer with"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def fingerprint(payload):
+    """Stable digest of a JSON request body"""
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, separators=(",", ":")).encode()).hexdigest()
+
+
+def valid_key(key):
+    return bool(key) and len(key) <= MAX_KEY_LENGTH and key.isprintable()
+
+
+class _Entry:
+    __slots__ = ("fingerprint", "done", "result", "expires")
+
+    def __init__(self, fingerprint):
+        self.fingerprint = fingerprint
+        self.done = threading.Event()
+        self.result = None
+        self.expires = None
+
+
+class IdempotencyCache:
+    """Completed and in-flight results by (route, key); see the module docstring.
+
+    begin() returns None when the caller is the first attempt, which must
+    then call finish() with its result, or abandon() if it failed in a way
+    worth retrying. Otherwise it returns the first attempt's result.
+    """
+
+    def __init__(self, ttl=DEFAULT_TTL, max_entries=10000, wait_timeout=30, clock=time.monotonic):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.wait_timeout = wait_timeout
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def begin(self, route, key, fingerprint):
+        """None if this is the first attempt, else its result; raises IdempotencyConflict"""
+        cache_key = (route, key)
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is not None and entry.expires is not None and entry.expires <= self.clock():
+                del self._entries[cache_key]
+                entry = None
+            if entry is None:
+                self._entries[cache_key] = _Entry(fingerprint)
+                self._evict()
+                OUTCOMES.inc(route, "first")
+                return None
+        if entry.fingerprint != fingerprint:
+            OUTCOMES.inc(route, "mismatch")
+            raise IdempotencyConflict(422, "This Idempotency-Key was already used for a different request.")
+        if not entry.done.wait(self.wait_timeout):
+            OUTCOMES.inc(route, "in_progress")
+            raise IdempotencyConflict(409, "A request with this Idempotency-Key is still being processed.")
+        if entry.result is None:
+            # The first attempt was abandoned; this retry runs it again
+            return self.begin(route, key, fingerprint)
+        OUTCOMES.inc(route, "replayed")
+        return entry.result
+
+    def finish(self, route, key, result, conn=None):
+        """Store the first attempt's result and release any retries waiting on it"""
+        with self._lock:
+            entry = self._entries.get((route, key))
+            if entry is None:
+                return
+            entry.result = result
+            entry.expires = self.clock() + self.ttl
+            self._entries.move_to_end((route, key))
+        entry.done.set()
+
+    def abandon(self, route, key):
+        """Forget an attempt that failed, so the next retry runs again; a stored result is kept"""
+        with self._lock:
+            entry = self._entries.get((route, key))
+            if entry is None or entry.result is not None:
+                return
+            del self._entries[(route, key)]
+        entry.done.set()
+
+    def _evict(self):
+        # Entries are ordered by completion; in-flight ones are skipped, never dropped
+        while len(self._entries) > self.max_entries:
+            for cache_key, entry in self._entries.items():
+                if entry.done.is_set():
+                    break
+            else:
+                return
+            del self._entries[cache_key]
+
+    def __len__(self):
+        return len(self._entries)
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+    route TEXT NOT NULL,
+    key TEXT NOT NULL,
+    fingerprint TEXT NOT NULL,
+    result TEXT,
+    claimed_at REAL NOT NULL,
+    expires_at REAL,
+    PRIMARY KEY (route, key)
+);
+CREATE INDEX IF NOT EXISTS idempotency_keys_expiry ON idempotency_keys (expires_at);
+"""
+
+SELECT_KEY = "SELECT fingerprint, result, claimed_at, expires_at FROM idempotency_keys WHERE route = ? AND key = ?"
+CLAIM_KEY = (
+    "INSERT INTO idempotency_keys (route, key, fingerprint, claimed_at) VALUES (?, ?, ?, ?) "
+    "ON CONFLICT (route, key) DO UPDATE SET fingerprint = excluded.fingerprint, result = NULL, "
+    "claimed_at = excluded.claimed_at, expires_at = NULL"
+)
+STORE_RESULT = "UPDATE idempotency_keys SET result = ?, expires_at = ? WHERE route = ? AND key = ?"
+RELEASE_KEY = "DELETE FROM idempotency_keys WHERE route = ? AND key = ? AND result IS NULL"
+DELETE_EXPIRED = "DELETE FROM idempotency_keys WHERE expires_at < ?"
+
+
+class SQLiteIdempotencyCache:
+    """Idempotency keys in a SQLite table shared by every worker process.
+
+    Same interface as IdempotencyCache. begin() claims the key with a row
+    whose result is still empty; a retry that finds that row waits for the
+    result by polling it, up to wait_timeout. finish() accepts the open
+    connection of the transaction that made the change, so the result is
+    committed together with it. A claim left unfinished for lease_seconds
+    (its worker died) is taken over by the next attempt.
+    """
+
+    def __init__(self, path, ttl=DEFAULT_TTL, wait_timeout=30, lease_seconds=120, clock=time.time):
+        self.path = path
+        self.ttl = ttl
+        self.wait_timeout = wait_timeout
+        self.lease_seconds = lease_seconds
+        self.clock = clock
+        self._local = threading.local()
+        self._connection().executescript(SCHEMA)
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _claim(self, route, key, fingerprint):
+        """None if this attempt now holds the key, else the (fingerprint, result) row found"""
+        conn = self._connection()
+        now = self.clock()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(DELETE_EXPIRED, (now,))
+            row = conn.execute(SELECT_KEY, (route, key)).fetchone()
+            if row is None or (row[1] is None and row[2] < now - self.lease_seconds):
+                conn.execute(CLAIM_KEY, (route, key, fingerprint, now))
+                row = None
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        return row
+
+    def begin(self, route, key, fingerprint):
+        """None if this is the first attempt, else its result; raises IdempotencyConflict"""
+        deadline = time.monotonic() + self.wait_timeout
+        delay = 0.02
+        while True:
+            row = self._claim(route, key, fingerprint)
+            if row is None:
+                OUTCOMES.inc(route, "first")
+                return None
+            if row[0] != fingerprint:
+                OUTCOMES.inc(route, "mismatch")
+                raise IdempotencyConflict(422, "This Idempotency-Key was already used for a different request.")
+            if row[1] is not None:
+                OUTCOMES.inc(route, "replayed")
+                return json.loads(row[1])
+            if time.monotonic() + delay > deadline:
+                OUTCOMES.inc(route, "in_progress")
+                raise IdempotencyConflict(409, "A request with this Idempotency-Key is still being processed.")
+            time.sleep(delay)
+            delay = min(delay * 2, 0.5)
+
+    def finish(self, route, key, result, conn=None):
+        """Store the first attempt's result, in conn's transaction if given"""
+        (conn or self._connection()).execute(STORE_RESULT, (json.dumps(result), self.clock() + self.ttl, route, key))
+
+    def abandon(self, route, key):
+        """Forget an attempt that failed, so the next retry runs again; a stored result is kept"""
+        self._connection().execute(RELEASE_KEY, (route, key))
+
+    def __len__(self):
+        return self._connection().execute("SELECT COUNT(*) FROM idempotency_keys").fetchone()[0]
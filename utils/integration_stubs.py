@@ -0,0 +1,151 @@
+"""Offline stand-ins for SendGrid, Google Calendar and OpenAI.
+
+Enable with CLINIC_STUB_INTEGRATIONS=1. Every call sleeps for
+CLINIC_STUB_LATENCY_MS (default 200) to mimic a remote round trip, which
+makes it possible to measure booking latency without network access.
+"""
+import os
+import time
+import uuid
+from types import SimpleNamespace
+
+STUB_INTEGRATIONS = os.getenv("CLINIC_STUB_INTEGRATIONS", "") not in ("", "0", "false")
+STUB_LATENCY_SECONDS = float(os.getenv("CLINIC_STUB_LATENCY_MS", "200")) / 1000
+
+
+class StubResponse:
+    def __init__(self, status_code, body=None):
+        self.status_code = status_code
+        self.status = status_code
+        self.body = body or {}
+
+
+class StubSendGridClient:
+    def __init__(self, latency=None):
+        self.latency = STUB_LATENCY_SECONDS if latency is None else latency
+        self.sent = []
+
+    def send(self, message):
+        time.sleep(self.latency)
+        self.sent.append(message)
+        return StubResponse(202)
+
+
+class StubHttpError(Exception):
+    def __init__(self, status):
+        super().__init__(f"HTTP {status}")
+        self.resp = StubResponse(status)
+
+
+class _StubRequest:
+    def __init__(self, latency, result):
+        self.latency = latency
+        self.result = result
+
+    def execute(self):
+        time.sleep(self.latency)
+        return self._run()
+
+    def _run(self):
+        if callable(self.result):
+            return self.result()
+        return self.result
+
+
+class _StubBatch:
+    """Runs every added request in one simulated round trip"""
+
+    def __init__(self, latency, callback):
+        self.latency = latency
+        self.callback = callback
+        self.requests = []
+
+    def add(self, request, callback=None, request_id=None):
+        self.requests.append((request, callback or self.callback, request_id or str(len(self.requests))))
+
+    def execute(self):
+        time.sleep(self.latency)
+        for request, callback, request_id in self.requests:
+            try:
+                callback(request_id, request._run(), None)
+            except StubHttpError as e:
+                callback(request_id, None, e)
+
+
+class _StubEvents:
+    def __init__(self, latency):
+        self.latency = latency
+        self.store = {}
+
+    def insert(self, calendarId, body):
+        event = dict(body, id=uuid.uuid4().hex)
+        self.store[event["id"]] = event
+        return _StubRequest(self.latency, event)
+
+    def patch(self, calendarId, eventId, body):
+        def run():
+            if eventId not in self.store:
+                raise StubHttpError(404)
+            self.store[eventId].update(body)
+            return self.store[eventId]
+        return _StubRequest(self.latency, run)
+
+    def delete(self, calendarId, eventId):
+        def run():
+            if self.store.pop(eventId, None) is None:
+                raise StubHttpError(404)
+            return ""
+        return _StubRequest(self.latency, run)
+
+    def list(self, calendarId, **params):
+        # Always a full listing; the stub does not track changes between sync tokens
+        return _StubRequest(self.latency, {"items": list(self.store.values()), "nextSyncToken": "stub"})
+
+
+class StubCalendarService:
+    def __init__(self, latency=None):
+        self._events = _StubEvents(STUB_LATENCY_SECONDS if latency is None else latency)
+
+    def events(self):
+        return self._events
+
+    def new_batch_http_request(self, callback=None):
+        return _StubBatch(self._events.latency, callback)
+
+
+class _StubCompletionStream:
+    """Yields a canned answer word by word after one round trip of latency"""
+
+    def __init__(self, latency, text):
+        self.latency = latency
+        self.words = text.split(" ")
+        self.closed = False
+
+    def __iter__(self):
+        time.sleep(self.latency)
+        for i, word in enumerate(self.words):
+            if self.closed:
+                return
+            content = word if i == 0 else " " + word
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=content))])
+            time.sleep(self.latency / 20)
+
+    def close(self):
+        self.closed = True
+
+
+class _StubCompletions:
+    def __init__(self, latency):
+        self.latency = latency
+
+    def create(self, model, messages, stream=True, **params):
+        # Only streaming completions are used by the clinic
+        question = messages[-1]["content"]
+        return _StubCompletionStream(self.latency, f"This is a general answer about \"{question}\" from the "
+                                     "offline assistant. Rest, stay hydrated and see a doctor if it gets worse.")
+
+
+class StubOpenAIClient:
+    def __init__(self, latency=None):
+        latency = STUB_LATENCY_SECONDS if latency is None else latency
+        self.chat = SimpleNamespace(completions=_StubCompletions(latency))
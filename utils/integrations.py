@@ -0,0 +1,383 @@
+"""Long-lived, pooled HTTP clients for SendGrid, Google Calendar and OpenAI.
+
+Every outbound call goes through the clients built here, so a booking reuses
+warm keep-alive connections instead of paying for a TLS handshake per call.
+Timeouts come from the environment:
+
+    INTEGRATION_CONNECT_TIMEOUT   seconds to establish a connection (default 3)
+    INTEGRATION_READ_TIMEOUT      seconds to wait for a response (default 10)
+    INTEGRATION_POOL_SIZE         keep-alive connections per provider (default 10)
+    INTEGRATION_WARMUP            set to 0 to skip warming clients after boot
+
+SendGrid and Google Calendar calls also go through a circuit breaker per
+provider (see utils.circuit_breaker), so an outage fails calls fast
+instead of holding a worker for a timeout on each one:
+
+    INTEGRATION_BREAKER_FAILURES  failures in a row that open a breaker (default 5)
+    INTEGRATION_BREAKER_RESET     seconds before an open breaker is probed (default 30)
+    INTEGRATION_LATENCY_BUDGET    seconds after which a call counts as failed (default 5)
+
+The latency budget is also these two providers' read timeout (when below
+INTEGRATION_READ_TIMEOUT), so a slow call is cut off at the budget rather
+than only counted against the breaker once it finally returns.
+
+SENDGRID_API_BASE and GOOGLE_CALENDAR_API_BASE (e.g.
+http://127.0.0.1:8080/calendar/v3/) point the clients at another host, as
+the load test does with its stand-in servers; OpenAI reads OPENAI_BASE_URL.
+
+The provider SDKs are imported on first use rather than at import time, so
+a new worker can serve its first request without waiting for them;
+ensure_warmed() loads them in a background thread once the worker is up.
+"""
+import json
+import os
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+
+from utils import metrics
+from utils.circuit_breaker import CircuitBreaker
+from utils.integration_stubs import STUB_INTEGRATIONS, StubCalendarService, StubOpenAIClient, StubSendGridClient
+
+CONNECT_TIMEOUT = float(os.getenv("INTEGRATION_CONNECT_TIMEOUT", "3"))
+READ_TIMEOUT = float(os.getenv("INTEGRATION_READ_TIMEOUT", "10"))
+POOL_SIZE = int(os.getenv("INTEGRATION_POOL_SIZE", "10"))
+
+SENDGRID_API_BASE = os.getenv("SENDGRID_API_BASE", "https://api.sendgrid.com")
+GOOGLE_CALENDAR_API_BASE = os.getenv("GOOGLE_CALENDAR_API_BASE")
+WARMUP = os.getenv("INTEGRATION_WARMUP", "1") not in ("", "0", "false")
+
+BREAKER_FAILURES = int(os.getenv("INTEGRATION_BREAKER_FAILURES", "5"))
+BREAKER_RESET = float(os.getenv("INTEGRATION_BREAKER_RESET", "30"))
+LATENCY_BUDGET = float(os.getenv("INTEGRATION_LATENCY_BUDGET", "5"))
+# Read timeout of the calls that go through a breaker
+BREAKER_READ_TIMEOUT = min(READ_TIMEOUT, LATENCY_BUDGET)
+
+_lock = threading.Lock()
+_clients = {}
+_counters = {}
+
+
+def _count(provider, key, amount=1):
+    with _lock:
+        counters = _counters.setdefault(provider, {"requests": 0, "errors": 0})
+        counters[key] = counters.get(key, 0) + amount
+
+
+LATENCY = metrics.histogram(
+    "clinic_integration_request_duration_seconds",
+    "Outbound calls to SendGrid, Google and OpenAI, by provider and operation",
+    ("provider", "operation"),
+)
+ERRORS = metrics.counter(
+    "clinic_integration_errors_total",
+    "Outbound calls that raised, by provider and operation",
+    ("provider", "operation"),
+)
+
+
+@contextmanager
+def timed(provider, operation):
+    """Count, time and record failures of one outbound call"""
+    _count(provider, "requests")
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        _count(provider, "errors")
+        ERRORS.inc(provider, operation)
+        raise
+    finally:
+        LATENCY.observe(time.perf_counter() - started, provider, operation)
+
+
+def provider_fault(error):
+    """Whether an exception from a provider call means the provider is in trouble.
+
+    Timeouts, connection errors, 5xx, 408 and 429 do; other HTTP errors
+    (e.g. 404 for an event already deleted) are answers about the request.
+    """
+    response = getattr(error, "response", None)
+    if response is None:
+        response = getattr(error, "resp", None)  # googleapiclient's HttpError
+    status = getattr(response, "status_code", None)
+    if status is None:
+        status = getattr(response, "status", None)
+    if status is None:
+        return True
+    status = int(status)
+    return status >= 500 or status in (408, 429)
+
+
+_breakers = {
+    provider: CircuitBreaker(provider, failure_threshold=BREAKER_FAILURES, reset_timeout=BREAKER_RESET,
+                             latency_budget=LATENCY_BUDGET, is_failure=provider_fault)
+    for provider in ("sendgrid", "google_calendar")
+}
+
+
+def breaker(provider):
+    """The circuit breaker for provider ("sendgrid" or "google_calendar")"""
+    return _breakers[provider]
+
+
+def _singleton(name, factory):
+    client = _clients.get(name)
+    if client is None:
+        with _lock:
+            client = _clients.get(name)
+            if client is None:
+                client = _clients[name] = factory()
+    return client
+
+
+def _pooled_session():
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def _urllib3_pool_stats(session):
+    connections = requests_served = 0
+    for adapter in set(session.adapters.values()):
+        pools = adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is not None:
+                connections += pool.num_connections
+                requests_served += pool.num_requests
+    return {"connections_opened": connections, "pool_requests": requests_served}
+
+
+# SendGrid
+
+class PooledSendGridClient:
+    """Sends SendGrid mail over a shared keep-alive session.
+
+    Mirrors SendGridAPIClient.send(): takes a Mail object, returns a response
+    with status_code and raises on HTTP errors.
+    """
+
+    def __init__(self, api_key, host=SENDGRID_API_BASE):
+        self.api_key = api_key
+        self.url = f"{host.rstrip('/')}/v3/mail/send"
+        self.session = _pooled_session()
+        self.session.headers.update({
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json",
+        })
+
+    def send(self, message):
+        payload = message.get() if hasattr(message, "get") else message
+        with timed("sendgrid", "mail_send"):
+            response = self.session.post(self.url, json=payload, timeout=(CONNECT_TIMEOUT, BREAKER_READ_TIMEOUT))
+            response.raise_for_status()
+        return response
+
+
+def sendgrid_client():
+    """Shared SendGrid client, or the offline stub when CLINIC_STUB_INTEGRATIONS is set"""
+    if STUB_INTEGRATIONS:
+        return _singleton("sendgrid_stub", StubSendGridClient)
+    return _singleton("sendgrid", lambda: PooledSendGridClient(os.getenv("SENDGRID_API_KEY")))
+
+
+# Google
+
+def _counting_http_class():
+    import httplib2
+
+    class CountingHttp(httplib2.Http):
+        def request(self, uri, method="GET", *args, **kwargs):
+            with timed("google_calendar", _calendar_operation(uri, method)):
+                return super().request(uri, method, *args, **kwargs)
+
+    return CountingHttp
+
+
+_CALENDAR_OPERATIONS = {"GET": "read", "POST": "insert", "PUT": "update", "PATCH": "update", "DELETE": "delete"}
+
+
+def _calendar_operation(uri, method):
+    if "/batch" in uri:
+        return "batch"
+    return _CALENDAR_OPERATIONS.get(method.upper(), method.lower())
+
+
+_google_http = threading.local()
+# For pool_stats(); weak, so a finished thread's Http (and its sockets) can be freed
+_google_http_objects = weakref.WeakSet()
+
+
+def _thread_google_http():
+    # httplib2.Http is not thread-safe, so each thread keeps its own
+    # connection cache and reuses it for every calendar call it makes.
+    http = getattr(_google_http, "http", None)
+    if http is None:
+        http_class = _singleton("google_http_class", _counting_http_class)
+        http = _google_http.http = http_class(timeout=BREAKER_READ_TIMEOUT)
+        with _lock:
+            _google_http_objects.add(http)
+    return http
+
+
+def google_auth_request():
+    """Transport for OAuth token refreshes, backed by a pooled session.
+
+    Callers time the refresh itself with timed("google_auth", "token_refresh").
+    """
+    from google.auth.transport.requests import Request as GoogleAuthRequest
+
+    return GoogleAuthRequest(session=_singleton("google_auth", _pooled_session))
+
+
+def _calendar_discovery_doc():
+    # The discovery document ships with google-api-python-client; parse it
+    # once instead of letting every build() read and decode it again.
+    from googleapiclient import discovery_cache
+
+    return json.loads(discovery_cache.get_static_doc("calendar", "v3"))
+
+
+_build_lock = threading.Lock()
+
+
+def google_calendar_service(credentials):
+    """Calendar API service whose requests go over this thread's keep-alive connections"""
+    if STUB_INTEGRATIONS:
+        return _singleton("google_calendar_stub", StubCalendarService)
+    from google_auth_httplib2 import AuthorizedHttp
+    from googleapiclient.discovery import build_from_document
+
+    document = _singleton("calendar_discovery_doc", _calendar_discovery_doc)
+    _count("google_calendar", "services_built")
+    http = AuthorizedHttp(credentials, http=_thread_google_http())
+    # build_from_document normalises the document in place, so builds are serialised
+    with _build_lock:
+        return build_from_document(document, http=http, client_options={"api_endpoint": GOOGLE_CALENDAR_API_BASE})
+
+
+# OpenAI
+
+def _build_openai_client():
+    import httpx
+    from openai import OpenAI
+
+    class TimedTransport(httpx.HTTPTransport):
+        # Streamed completions return once the response headers arrive, so
+        # this measures time to first byte rather than the whole answer
+        def handle_request(self, request):
+            with timed("openai", request.url.path.rsplit("/v1", 1)[-1].strip("/").replace("/", ".")):
+                return super().handle_request(request)
+
+    limits = httpx.Limits(max_connections=POOL_SIZE, max_keepalive_connections=POOL_SIZE)
+    http_client = httpx.Client(
+        limits=limits,
+        timeout=httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT),
+        transport=TimedTransport(limits=limits),
+    )
+    return OpenAI(api_key=os.getenv("OPENAI_API_KEY"), http_client=http_client)
+
+
+def openai_client():
+    """Shared OpenAI client with a bounded keep-alive connection pool, or the offline stub"""
+    if STUB_INTEGRATIONS:
+        return _singleton("openai_stub", StubOpenAIClient)
+    return _singleton("openai", _build_openai_client)
+
+
+# Warm-up
+
+def _warm_openai():
+    openai_client()
+
+
+def _warm_sendgrid():
+    sendgrid_client()
+    # Only imported for its load time; the module is used on first call
+    import sendgrid.helpers.mail  # noqa: F401
+
+
+def _warm_google():
+    # Doctors connect their calendars at any time, so this needs no credentials
+    import google.oauth2.credentials  # noqa: F401
+    import google_auth_httplib2  # noqa: F401
+    import googleapiclient.discovery  # noqa: F401
+    if not STUB_INTEGRATIONS:
+        _singleton("calendar_discovery_doc", _calendar_discovery_doc)
+        _singleton("google_http_class", _counting_http_class)
+
+
+# provider -> (environment variable holding its credentials, or None, warm-up function)
+_WARMERS = {
+    "openai": ("OPENAI_API_KEY", _warm_openai),
+    "sendgrid": ("SENDGRID_API_KEY", _warm_sendgrid),
+    "google_calendar": (None, _warm_google),
+}
+
+
+def warm_up():
+    """Import the provider SDKs and build the shared clients; returns seconds taken.
+
+    Each provider is warmed on its own: one whose credentials are not set
+    is skipped, and one that fails is reported without stopping the rest.
+    """
+    started = time.perf_counter()
+    for provider, (credentials, warm) in _WARMERS.items():
+        if credentials and not STUB_INTEGRATIONS and not os.getenv(credentials):
+            continue
+        try:
+            warm()
+        except Exception as e:
+            print(f"Integration warm-up failed for {provider}: {e}")
+    return time.perf_counter() - started
+
+
+_warm_pid = None
+
+
+def ensure_warmed():
+    """Warm the integrations in a background thread, once per worker process"""
+    global _warm_pid
+    if not WARMUP or _warm_pid == os.getpid():
+        return
+    with _lock:
+        if _warm_pid == os.getpid():
+            return
+        _warm_pid = os.getpid()
+
+    def run():
+        try:
+            print(f"Integrations warmed in {warm_up():.2f}s")
+        except Exception as e:
+            print(f"Integration warm-up failed: {e}")
+
+    threading.Thread(target=run, name="integration-warmup", daemon=True).start()
+
+
+def pool_stats():
+    """Per-provider request, error and connection counters and circuit breaker state"""
+    with _lock:
+        stats = {provider: dict(counters) for provider, counters in _counters.items()}
+        clients = dict(_clients)
+        google_http_objects = list(_google_http_objects)
+    for provider, provider_breaker in _breakers.items():
+        stats.setdefault(provider, {})["breaker"] = provider_breaker.status()
+    if "sendgrid" in clients:
+        stats.setdefault("sendgrid", {}).update(_urllib3_pool_stats(clients["sendgrid"].session))
+    if "google_auth" in clients:
+        stats.setdefault("google_auth", {}).update(_urllib3_pool_stats(clients["google_auth"]))
+    if google_http_objects:
+        stats.setdefault("google_calendar", {})["connections_open"] = sum(
+            len(http.connections) for http in google_http_objects)
+    if "openai" in clients:
+        pool = getattr(getattr(clients["openai"]._client, "_transport", None), "_pool", None)
+        if pool is not None:
+            stats.setdefault("openai", {})["connections_open"] = len(pool.connections)
+    return stats
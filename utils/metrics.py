@@ -0,0 +1,175 @@
+"""Latency histograms and error counters, exposed in the Prometheus text format.
+
+Recording takes no lock: every thread writes to its own shard of each
+metric, and the shards are merged when /metrics is scraped. Shards of
+threads that have exited are folded into a retired total at scrape time,
+so a server that starts a thread per request does not accumulate them.
+
+A scrape may read a shard while its thread is updating it, which can make
+a single observation show up in a bucket one scrape before it shows up in
+_count; the next scrape is consistent again.
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds; covers a cached page (< 5ms) up to a slow provider timeout
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=""):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{%s}" % ",".join(pairs) if pairs else ""
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._local = threading.local()
+        self._shards = []  # (thread, {label values: value}), one per recording thread
+        self._retired = {}
+        self._lock = threading.Lock()  # taken once per thread and at scrape time
+
+    def _shard(self):
+        try:
+            return self._local.values
+        except AttributeError:
+            values = self._local.values = {}
+            with self._lock:
+                self._shards.append((threading.current_thread(), values))
+            return values
+
+    def _merge(self, into, values):
+        raise NotImplementedError
+
+    def collect(self):
+        """{label values: value}, merged across threads"""
+        with self._lock:
+            live = []
+            for thread, values in self._shards:
+                if thread.is_alive():
+                    live.append((thread, values))
+                else:
+                    self._merge(self._retired, values)
+            self._shards = live
+            merged = {}
+            self._merge(merged, self._retired)
+            for _, values in live:
+                self._merge(merged, values)
+        return merged
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for labelvalues, value in sorted(self.collect().items()):
+            lines.extend(self._samples(labelvalues, value))
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *labelvalues, amount=1):
+        values = self._shard()
+        values[labelvalues] = values.get(labelvalues, 0) + amount
+
+    def _merge(self, into, values):
+        for labelvalues, value in list(values.items()):
+            into[labelvalues] = into.get(labelvalues, 0) + value
+
+    def _samples(self, labelvalues, value):
+        yield f"{self.name}{_labels(self.labelnames, labelvalues)} {_number(value)}"
+
+
+class Histogram(_Metric):
+    """Per label set: a count per bucket (the last one is +Inf) followed by the sum"""
+
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, amount, *labelvalues):
+        values = self._shard()
+        value = values.get(labelvalues)
+        if value is None:
+            value = values[labelvalues] = [0] * (len(self.buckets) + 1) + [0.0]
+        value[bisect_left(self.buckets, amount)] += 1
+        value[-1] += amount
+
+    @contextmanager
+    def time(self, *labelvalues):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *labelvalues)
+
+    def _merge(self, into, values):
+        for labelvalues, value in list(values.items()):
+            total = into.get(labelvalues)
+            if total is None:
+                into[labelvalues] = list(value)
+            else:
+                for i, amount in enumerate(value):
+                    total[i] += amount
+
+    def _samples(self, labelvalues, value):
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), value):
+            cumulative += count
+            le = 'le="%s"' % _number(bound)
+            yield f"{self.name}_bucket{_labels(self.labelnames, labelvalues, le)} {cumulative}"
+        labels = _labels(self.labelnames, labelvalues)
+        yield f"{self.name}_sum{labels} {_number(value[-1])}"
+        yield f"{self.name}_count{labels} {cumulative}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self._register(Counter(name, help, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, help, labelnames, buckets))
+
+    def render(self):
+        """Every registered metric in the Prometheus text exposition format"""
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+counter = REGISTRY.counter
+histogram = REGISTRY.histogram
@@ -0,0 +1,264 @@
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.circuit_breaker import CircuitOpenError
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    dedupe_key TEXT NOT NULL UNIQUE,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    claimed_at REAL,
+    last_error TEXT,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS outbox_due ON outbox (status, next_attempt_at);
+"""
+
+# Outboxes created before finished_at existed; their done rows count as finished when last claimed
+ADD_FINISHED_AT = "ALTER TABLE outbox ADD COLUMN finished_at REAL"
+BACKFILL_FINISHED_AT = (
+    "UPDATE outbox SET finished_at = COALESCE(claimed_at, next_attempt_at) WHERE status = 'done' AND finished_at IS NULL"
+)
+
+INSERT_TASK = (
+    "INSERT OR IGNORE INTO outbox (kind, dedupe_key, payload, next_attempt_at) VALUES (?, ?, ?, ?)"
+)
+SELECT_DUE = (
+    "SELECT id, kind, payload, attempts FROM outbox "
+    "WHERE (status = 'pending' AND next_attempt_at <= ?) OR (status = 'running' AND claimed_at < ?) "
+    "ORDER BY next_attempt_at LIMIT ?"
+)
+MARK_RUNNING = "UPDATE outbox SET status = 'running', claimed_at = ?, attempts = attempts + 1 WHERE id = ?"
+MARK_DONE = "UPDATE outbox SET status = 'done', last_error = NULL, finished_at = ? WHERE id = ?"
+MARK_RETRY = "UPDATE outbox SET status = 'pending', next_attempt_at = ?, last_error = ? WHERE id = ?"
+MARK_DEFERRED = "UPDATE outbox SET status = 'pending', next_attempt_at = ?, attempts = attempts - 1 WHERE id = ?"
+MARK_DEAD = "UPDATE outbox SET status = 'dead', last_error = ? WHERE id = ?"
+COUNT_BY_STATUS = "SELECT status, COUNT(*) FROM outbox GROUP BY status"
+PURGE_DONE = (
+    "DELETE FROM outbox WHERE id IN "
+    "(SELECT id FROM outbox WHERE status = 'done' AND finished_at < ? LIMIT ?)"
+)
+
+
+class OutboxTask:
+    """A side effect to run after an appointment is committed"""
+
+    def __init__(self, kind, dedupe_key, payload):
+        self.kind = kind
+        self.dedupe_key = dedupe_key
+        self.payload = payload
+
+
+# Side effects of a booking, in the order they are enqueued
+BOOKING_SIDE_EFFECTS = ("calendar_event", "patient_confirmation_email", "doctor_notification_email")
+
+
+def booking_tasks(confirmation_id, kinds=BOOKING_SIDE_EFFECTS):
+    """Outbox tasks for a booking's side effects, one per kind, deduplicated per appointment"""
+    payload = {"confirmationId": confirmation_id}
+    return [OutboxTask(kind, f"{kind}:{confirmation_id}", payload) for kind in kinds]
+
+
+class Outbox:
+    """Persistent queue of booking side effects in a SQLite table.
+
+    Tasks are deduplicated by dedupe_key, so enqueueing the same side effect
+    twice is a no-op. enqueue() accepts an open connection so the tasks can
+    be written in the same transaction as the appointment they belong to.
+    Done tasks are deleted by purge() once past the retention window, which
+    ends their deduplication too; dead tasks are kept for inspection.
+    """
+
+    def __init__(self, path, lease_seconds=300):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self._local = threading.local()
+        self._migrate()
+
+    def _migrate(self):
+        conn = self._connection()
+        conn.executescript(SCHEMA)
+        if "finished_at" not in [row[1] for row in conn.execute("PRAGMA table_info(outbox)")]:
+            try:
+                conn.execute(ADD_FINISHED_AT)
+            except sqlite3.OperationalError as e:
+                # Another worker applied the same migration first
+                if "duplicate column" not in str(e):
+                    raise
+            conn.execute(BACKFILL_FINISHED_AT)
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def enqueue(self, tasks, conn=None):
+        conn = conn or self._connection()
+        now = time.time()
+        conn.executemany(INSERT_TASK, [
+            (task.kind, task.dedupe_key, json.dumps(task.payload), now) for task in tasks
+        ])
+
+    def claim(self, limit):
+        """Mark up to limit due tasks as running and return them.
+
+        Tasks left running by a worker that died are reclaimed once their
+        lease has expired.
+        """
+        conn = self._connection()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = conn.execute(SELECT_DUE, (now, now - self.lease_seconds, limit)).fetchall()
+            conn.executemany(MARK_RUNNING, [(now, row[0]) for row in rows])
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        return [(row[0], row[1], json.loads(row[2]), row[3] + 1) for row in rows]
+
+    def complete(self, task_id):
+        self._connection().execute(MARK_DONE, (time.time(), task_id))
+
+    def retry(self, task_id, error, delay):
+        self._connection().execute(MARK_RETRY, (time.time() + delay, str(error), task_id))
+
+    def defer(self, task_id, delay):
+        """Put a claimed task back for later without counting the attempt"""
+        self._connection().execute(MARK_DEFERRED, (time.time() + delay, task_id))
+
+    def bury(self, task_id, error):
+        self._connection().execute(MARK_DEAD, (str(error), task_id))
+
+    def counts(self):
+        return dict(self._connection().execute(COUNT_BY_STATUS).fetchall())
+
+    def purge(self, older_than, batch_size=1000):
+        """Delete done tasks finished more than older_than seconds ago; returns how many.
+
+        Deletes in batches of batch_size, so bookings are not held up
+        behind one long write.
+        """
+        conn = self._connection()
+        cutoff = time.time() - older_than
+        purged = 0
+        while True:
+            deleted = conn.execute(PURGE_DONE, (cutoff, batch_size)).rowcount
+            purged += deleted
+            if deleted < batch_size:
+                return purged
+
+
+class OutboxWorker:
+    """Drains an Outbox with a bounded thread pool.
+
+    Handlers are looked up by task kind and called with the task payload.
+    A handler that raises is retried with exponential backoff until
+    max_attempts, after which the task is marked dead. A handler that
+    raises CircuitOpenError never reached its provider, so its task waits
+    until the breaker lets calls through again, without using up an attempt.
+    Every purge_interval seconds the dispatcher deletes done tasks older
+    than retention seconds (None keeps them).
+    """
+
+    def __init__(self, outbox, handlers, max_workers=4, max_attempts=5, poll_interval=1.0,
+                 base_delay=2.0, max_delay=300.0, retention=7 * 24 * 3600, purge_interval=3600):
+        self.outbox = outbox
+        self.handlers = handlers
+        self.max_workers = max_workers
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retention = retention
+        self.purge_interval = purge_interval
+        self._next_purge = 0.0
+        self._wakeup = threading.Event()
+        self._slots = threading.Semaphore(max_workers)
+        self._pid = None
+        self._start_lock = threading.Lock()
+        self._stopped = False
+
+    def ensure_started(self):
+        """Start the dispatcher in this process if it is not running yet (e.g. after fork)"""
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="outbox")
+            thread = threading.Thread(target=self._dispatch_loop, name="outbox-dispatcher", daemon=True)
+            thread.start()
+            self._pid = os.getpid()
+
+    def wake(self):
+        self._wakeup.set()
+
+    def stop(self):
+        self._stopped = True
+        self._wakeup.set()
+
+    def _dispatch_loop(self):
+        while not self._stopped:
+            self._wakeup.clear()
+            try:
+                self._dispatch_due()
+                self._purge_due()
+            except Exception as e:
+                print(f"Outbox dispatcher error: {e}")
+            self._wakeup.wait(self.poll_interval)
+
+    def _purge_due(self):
+        if self.retention is None or time.monotonic() < self._next_purge:
+            return
+        self._next_purge = time.monotonic() + self.purge_interval
+        self.outbox.purge(self.retention)
+
+    def _dispatch_due(self):
+        while not self._stopped:
+            free = 0
+            while self._slots.acquire(blocking=False):
+                free += 1
+            if not free:
+                return
+            tasks = self.outbox.claim(free)
+            for _ in range(free - len(tasks)):
+                self._slots.release()
+            if not tasks:
+                return
+            for task in tasks:
+                self._executor.submit(self._run, *task)
+
+    def _run(self, task_id, kind, payload, attempt):
+        try:
+            handler = self.handlers[kind]
+            handler(payload)
+            self.outbox.complete(task_id)
+        except CircuitOpenError as e:
+            self.outbox.defer(task_id, e.retry_after * random.uniform(1.0, 1.5))
+        except Exception as e:
+            if attempt >= self.max_attempts:
+                print(f"Outbox task {kind} #{task_id} failed permanently: {e}")
+                self.outbox.bury(task_id, e)
+            else:
+                delay = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+                print(f"Outbox task {kind} #{task_id} failed (attempt {attempt}), retrying in {delay:.0f}s: {e}")
+                self.outbox.retry(task_id, e, delay * random.uniform(0.5, 1.0))
+        finally:
+            self._slots.release()
+            self._wakeup.set()
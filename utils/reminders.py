@@ -0,0 +1,182 @@
+"""Appointment reminders (24 hours and 1 hour ahead) from an in-process min-heap.
+
+The heap holds (due time, confirmation ID, kind, start) for every reminder
+within the next window (48 hours by default). It is filled from the
+store, so nothing extra has to be persisted: sent reminders are recorded
+on the appointment (reminders_sent), and after a restart the heap is
+rebuilt from one indexed range query per doctor and a heapify, O(n log n)
+in the appointments in the window.
+
+While running, a doctor's range is only re-read when their
+schedule_version has moved on (a booking, cancellation or reschedule by
+any worker), and the window slides forward once a day. Each tick pops
+everything that is due and hands it to send_batch in groups of up to
+batch_size, so the reminders that fall due together go out as a few
+grouped sends instead of one request each. An entry is
+checked against the stored appointment before it is sent, so cancelled or
+moved appointments are skipped without removing anything from the heap.
+One worker process sends at a time, holding a store lease.
+"""
+import heapq
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from utils.time_parser import CLINIC_TIMEZONE
+
+REMINDER_OFFSETS = {"24h": timedelta(hours=24), "1h": timedelta(hours=1)}
+
+
+class Reminder:
+    def __init__(self, kind, appointment):
+        self.kind = kind
+        self.appointment = appointment
+
+
+class ReminderScheduler:
+    """See the module docstring.
+
+    send_batch(reminders) sends up to batch_size reminders (one SendGrid
+    request) and raises if they were not sent; they are then retried after
+    retry_delay seconds.
+    """
+
+    def __init__(self, store, doctor_ids, send_batch, offsets=REMINDER_OFFSETS, tick=30, batch_size=1000,
+                 window=timedelta(hours=48), grace=timedelta(minutes=10), retry_delay=60):
+        self.store = store
+        self.doctor_ids = doctor_ids
+        self.send_batch = send_batch
+        self.offsets = offsets
+        self.tick = tick
+        self.batch_size = batch_size
+        self.window = window
+        self.grace = grace
+        self.retry_delay = retry_delay
+        self._heap = []
+        self._queued = set()
+        self._versions = {}
+        self._window_end = None
+        self._owner = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def _entries(self, appointment, now):
+        if appointment.get("status", "confirmed") != "confirmed" or appointment.get("all_day"):
+            return
+        start = appointment.get("start")
+        if not start:
+            return
+        sent = appointment.get("reminders_sent") or ()
+        for kind, offset in self.offsets.items():
+            due = datetime.fromisoformat(start) - offset
+            # A reminder whose time passed long ago (e.g. booked for later today) is not sent late
+            if kind not in sent and due >= now - self.grace:
+                yield due.timestamp(), appointment["confirmationId"], kind, start
+
+    def _load_doctor(self, doctor_id, now):
+        version = self.store.schedule_version(doctor_id)
+        if self._versions.get(doctor_id) == version:
+            return []
+        self._versions[doctor_id] = version
+        entries = []
+        for appointment in self.store.for_doctor_between(doctor_id, now.isoformat(), self._window_end.isoformat()):
+            for entry in self._entries(appointment, now):
+                key = entry[1:]
+                if key not in self._queued:
+                    self._queued.add(key)
+                    entries.append(entry)
+        return entries
+
+    def refresh(self, now=None):
+        """Add reminders for appointments booked or moved since the last refresh"""
+        now = (now or datetime.now(CLINIC_TIMEZONE)).astimezone(CLINIC_TIMEZONE)
+        max_offset = max(self.offsets.values())
+        if self._window_end is None or now + max_offset + timedelta(seconds=self.tick) >= self._window_end:
+            # Slide the window and re-read every doctor; queued entries stay put
+            self._window_end = now + self.window + max_offset
+            self._versions.clear()
+        entries = []
+        for doctor_id in self.doctor_ids():
+            entries.extend(self._load_doctor(doctor_id, now))
+        if len(entries) > len(self._heap):
+            self._heap.extend(entries)
+            heapq.heapify(self._heap)
+        else:
+            for entry in entries:
+                heapq.heappush(self._heap, entry)
+        return len(entries)
+
+    def _current(self, confirmation_id, kind, start):
+        appointment = self.store.get(confirmation_id)
+        if (appointment is None or appointment.get("start") != start
+                or appointment.get("status", "confirmed") != "confirmed"
+                or kind in (appointment.get("reminders_sent") or ())):
+            return None
+        return appointment
+
+    def dispatch_due(self, now=None):
+        """Send every reminder that is due as one batch; returns how many were sent"""
+        now_ts = (now or datetime.now(CLINIC_TIMEZONE)).timestamp()
+        popped = []
+        while self._heap and self._heap[0][0] <= now_ts:
+            popped.append(heapq.heappop(self._heap))
+        reminders = []
+        for due, confirmation_id, kind, start in popped:
+            self._queued.discard((confirmation_id, kind, start))
+            appointment = self._current(confirmation_id, kind, start)
+            if appointment is not None:
+                reminders.append(Reminder(kind, appointment))
+        sent = 0
+        for i in range(0, len(reminders), self.batch_size):
+            batch = reminders[i:i + self.batch_size]
+            try:
+                self.send_batch(batch)
+            except Exception as e:
+                print(f"Sending {len(batch)} reminders failed, retrying in {self.retry_delay}s: {e}")
+                for reminder in batch:
+                    key = (reminder.appointment["confirmationId"], reminder.kind, reminder.appointment["start"])
+                    self._queued.add(key)
+                    heapq.heappush(self._heap, (now_ts + self.retry_delay, *key))
+                continue
+            for reminder in batch:
+                appointment = reminder.appointment
+                kinds = list(appointment.get("reminders_sent") or ()) + [reminder.kind]
+                self.store.update(appointment["confirmationId"], reminders_sent=kinds)
+            sent += len(batch)
+        return sent
+
+    def next_due(self):
+        return self._heap[0][0] if self._heap else None
+
+    def ensure_started(self):
+        """Start the scheduler loop in this process if it is not running yet (e.g. after fork)"""
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            self._owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+            threading.Thread(target=self._run_forever, name="reminders", daemon=True).start()
+            self._pid = os.getpid()
+
+    def _run_forever(self):
+        leader = False
+        while True:
+            try:
+                holds_lease = self.store.acquire_lease("reminders", self._owner, self.tick * 3)
+                if holds_lease and not leader:
+                    # Another worker may have sent reminders meanwhile; start from the store
+                    self._heap, self._queued, self._versions, self._window_end = [], set(), {}, None
+                leader = holds_lease
+                if leader:
+                    self.refresh()
+                    self.dispatch_due()
+            except Exception as e:
+                print(f"Reminder scheduler error: {e}")
+            delay = self.tick
+            next_due = self.next_due() if leader else None
+            if next_due is not None:
+                delay = max(0.0, min(delay, next_due - time.time()))
+            time.sleep(delay)
@@ -0,0 +1,330 @@
+"""Per-doctor search over patients and appointments for the clinic dashboard.
+
+Each appointment is broken into tokens (patient name words, phone digits,
+email, medical ID, confirmation ID and the words of the complaint) and
+kept in an inverted index, token -> {confirmation ID: field weight}, with
+the doctor's vocabulary in a sorted list, so a query term is matched as a
+whole token or as a prefix of one with a bisect. Every query term must
+match; results are ranked by the summed weight of the fields they matched
+on, exact matches counting more than prefixes.
+
+The index listens to the appointment store and re-indexes just the
+appointments a booking, sync, import or update touched. A doctor's index
+is built in the background when their dashboard opens, or else on their
+first search. When data_version shows a change this process was not told
+about (another worker's), searches keep answering from the index while it
+catches up in the background, re-indexing only the appointments whose
+searchable fields changed.
+"""
+import bisect
+import heapq
+import re
+import threading
+
+_WORD = re.compile(r"[^\W_]+")
+_NON_DIGIT = re.compile(r"\D+")
+_PHONE_QUERY = re.compile(r"^\+?[\d\s().-]{4,}$")
+
+# Weight of a token by the field it came from
+CONFIRMATION_ID_WEIGHT = 8
+MEDICAL_ID_WEIGHT = 8
+PHONE_WEIGHT = 6
+NAME_WEIGHT = 5
+EMAIL_WEIGHT = 4
+REASON_WEIGHT = 1
+# A term that is only a prefix of a token counts for this share of the token's weight
+PREFIX_SHARE = 0.6
+# Prefixes shorter than this only match whole tokens, and at most this many tokens are expanded
+MIN_PREFIX = 2
+MAX_EXPANSIONS = 256
+# Changes to more appointments than this at once sort the vocabulary afresh instead of per token
+BULK_CHANGES = 1000
+# Typical tokens per appointment, for choosing how to match a query's later terms
+TOKENS_PER_APPOINTMENT = 16
+
+# Fields copied into each result, so a search never reads the store
+RESULT_FIELDS = ("confirmationId", "patient", "time", "start", "status", "reason", "location")
+
+
+def words(text):
+    return _WORD.findall(str(text or "").casefold())
+
+
+def digits(text):
+    return _NON_DIGIT.sub("", str(text or ""))
+
+
+def query_terms(query):
+    """Search terms for a query.
+
+    A phone number typed with separators, an email address, and an ID such
+    as MRN-100123 are each one term.
+    """
+    query = (query or "").strip()
+    if _PHONE_QUERY.match(query):
+        return [digits(query)]
+    if "@" in query and not any(ch.isspace() for ch in query):
+        return [query.casefold()]
+    if any(ch.isdigit() for ch in query) and not any(ch.isspace() for ch in query):
+        return ["".join(words(query))]
+    return words(query)
+
+
+def search_fields(appointment):
+    """The values tokens are made from; an appointment is only re-indexed when these change"""
+    info = appointment.get("patientInfo") or {}
+    return (
+        appointment.get("confirmationId"),
+        appointment.get("patient"),
+        info.get("firstName"),
+        info.get("lastName"),
+        info.get("phone"),
+        info.get("email"),
+        info.get("medicalId"),
+        appointment.get("reason"),
+        appointment.get("time"),
+        appointment.get("start"),
+        appointment.get("status"),
+        appointment.get("location"),
+    )
+
+
+def tokens_for(appointment):
+    """{token: weight} for one appointment, keeping each token's highest weight"""
+    info = appointment.get("patientInfo") or {}
+    # Fields are added from the lowest weight up, so a later weight always wins
+    tokens = dict.fromkeys(words(appointment.get("reason")), REASON_WEIGHT)
+    email = str(info.get("email") or "").casefold()
+    tokens[email] = EMAIL_WEIGHT
+    tokens.update(dict.fromkeys(words(email.partition("@")[0]), EMAIL_WEIGHT))
+    for name in (appointment.get("patient"), info.get("firstName"), info.get("lastName")):
+        tokens.update(dict.fromkeys(words(name), NAME_WEIGHT))
+    phone = digits(info.get("phone"))
+    # Also findable by the local number without a country code, or its last four digits
+    tokens[phone] = tokens[phone[-7:]] = tokens[phone[-4:]] = PHONE_WEIGHT
+    medical_id = words(info.get("medicalId"))
+    tokens["".join(medical_id)] = MEDICAL_ID_WEIGHT
+    tokens.update(dict.fromkeys(medical_id, MEDICAL_ID_WEIGHT))
+    tokens[str(appointment.get("confirmationId") or "").casefold()] = CONFIRMATION_ID_WEIGHT
+    tokens.pop("", None)
+    return tokens
+
+
+def search_result(appointment):
+    info = appointment.get("patientInfo") or {}
+    result = {field: appointment.get(field) for field in RESULT_FIELDS}
+    result.update(phone=info.get("phone"), email=info.get("email"), medicalId=info.get("medicalId"))
+    return result
+
+
+class _DoctorIndex:
+    def __init__(self, version):
+        self.version = version
+        self.docs = {}  # confirmation ID -> (search fields, {token: weight}, result)
+        self.postings = {}  # token -> {confirmation ID: weight}
+        self._vocabulary = []  # sorted tokens, or None until the next query after a bulk change
+
+    def stale(self, appointment):
+        current = self.docs.get(appointment["confirmationId"])
+        return current is None or current[0] != search_fields(appointment)
+
+    def put(self, appointment):
+        confirmation_id = appointment["confirmationId"]
+        fields = search_fields(appointment)
+        current = self.docs.get(confirmation_id)
+        if current is not None:
+            if current[0] == fields:
+                return
+            self.drop(confirmation_id)
+        tokens = tokens_for(appointment)
+        for token, weight in tokens.items():
+            posting = self.postings.get(token)
+            if posting is None:
+                posting = self.postings[token] = {}
+                if self._vocabulary is not None:
+                    bisect.insort(self._vocabulary, token)
+            posting[confirmation_id] = weight
+        self.docs[confirmation_id] = (fields, tokens, search_result(appointment))
+
+    def drop(self, confirmation_id):
+        current = self.docs.pop(confirmation_id, None)
+        if current is None:
+            return
+        for token in current[1]:
+            posting = self.postings[token]
+            del posting[confirmation_id]
+            if not posting:
+                del self.postings[token]
+                if self._vocabulary is not None:
+                    del self._vocabulary[bisect.bisect_left(self._vocabulary, token)]
+
+    def bulk(self):
+        """Stop keeping the vocabulary sorted per token; it is sorted once on the next query"""
+        self._vocabulary = None
+
+    def expansions(self, term):
+        """Tokens longer than term that start with it"""
+        if len(term) < MIN_PREFIX:
+            return []
+        if self._vocabulary is None:
+            self._vocabulary = sorted(self.postings)
+        start = bisect.bisect_right(self._vocabulary, term)
+        found = []
+        for token in self._vocabulary[start:start + MAX_EXPANSIONS]:
+            if not token.startswith(term):
+                break
+            found.append(token)
+        return found
+
+    def estimate(self, term):
+        """How many appointments term matches, counting one twice if several of its tokens do"""
+        return len(self.postings.get(term, ())) + sum(len(self.postings[token]) for token in self.expansions(term))
+
+    def matches(self, term):
+        """{confirmation ID: score} for one query term"""
+        scores = dict(self.postings.get(term, ()))
+        for token in self.expansions(term):
+            for confirmation_id, weight in self.postings[token].items():
+                score = weight * PREFIX_SHARE
+                if scores.get(confirmation_id, 0) < score:
+                    scores[confirmation_id] = score
+        return scores
+
+    def score(self, confirmation_id, term):
+        """Score of term against one appointment's tokens, 0 if it does not match"""
+        best = 0
+        prefixes = len(term) >= MIN_PREFIX
+        for token, weight in self.docs[confirmation_id][1].items():
+            if token == term:
+                score = weight
+            elif prefixes and token.startswith(term):
+                score = weight * PREFIX_SHARE
+            else:
+                continue
+            if score > best:
+                best = score
+        return best
+
+
+class SearchIndex:
+    """Inverted index of a store's appointments, per doctor; see the module docstring.
+
+    Call attach() once to have it follow the store's changes, and warm()
+    to build a doctor's index before their first search.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self._doctors = {}
+        self._refreshing = set()
+        self._lock = threading.Lock()
+
+    def attach(self):
+        self.store.add_listener(self._changed)
+        return self
+
+    def _changed(self, doctor_id, version, changes):
+        with self._lock:
+            index = self._doctors.get(doctor_id)
+            # Not built yet, or already re-read from the store past this change
+            if index is None or version is None or version <= index.version:
+                return
+            if len(changes) > BULK_CHANGES:
+                index.bulk()
+            for confirmation_id, appointment in changes:
+                if appointment is None:
+                    index.drop(confirmation_id)
+                else:
+                    index.put(appointment)
+            if version == index.version + 1:
+                index.version = version
+            # Otherwise a change we have not heard of came first; the next search refreshes
+
+    def _refresh(self, doctor_id):
+        """Build the doctor's index, or bring it up to date with changes it was not told about"""
+        # The version is read before the appointments, so a change made
+        # meanwhile only causes one more refresh later
+        version = self.store.data_version(doctor_id)
+        appointments = self.store.for_doctor(doctor_id)
+        with self._lock:
+            index = self._doctors.get(doctor_id)
+        if index is None:
+            # Built outside the lock, so bookings are not held up meanwhile
+            index = _DoctorIndex(version)
+            index.bulk()
+            for appointment in appointments:
+                index.put(appointment)
+            with self._lock:
+                return self._doctors.setdefault(doctor_id, index)
+        with self._lock:
+            seen = {appointment["confirmationId"] for appointment in appointments}
+            changed = [appointment for appointment in appointments if index.stale(appointment)]
+            gone = [confirmation_id for confirmation_id in index.docs if confirmation_id not in seen]
+            if len(changed) + len(gone) > BULK_CHANGES:
+                index.bulk()
+            for appointment in changed:
+                index.put(appointment)
+            for confirmation_id in gone:
+                index.drop(confirmation_id)
+            index.version = version
+        return index
+
+    def _refresh_in_background(self, doctor_id):
+        with self._lock:
+            if doctor_id in self._refreshing:
+                return
+            self._refreshing.add(doctor_id)
+
+        def run():
+            try:
+                self._refresh(doctor_id)
+            except Exception as e:
+                print(f"Search index refresh for {doctor_id} failed: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(doctor_id)
+
+        threading.Thread(target=run, name="search-index", daemon=True).start()
+
+    def warm(self, doctor_id):
+        """Build doctor_id's index in the background if there is none yet"""
+        if doctor_id not in self._doctors:
+            self._refresh_in_background(doctor_id)
+
+    def _index_for(self, doctor_id):
+        index = self._doctors.get(doctor_id)
+        if index is None:
+            return self._refresh(doctor_id)
+        if index.version != self.store.data_version(doctor_id):
+            # Changed by another worker: answer from the index as it is and catch up meanwhile
+            self._refresh_in_background(doctor_id)
+        return index
+
+    def search(self, doctor_id, query, limit=20):
+        """Best matches for query among doctor_id's appointments, highest score first"""
+        terms = list(dict.fromkeys(query_terms(query)))
+        if not terms:
+            return []
+        index = self._index_for(doctor_id)
+        with self._lock:
+            # Candidates come from the rarest term. Each other term is then either
+            # looked up and intersected or, when few candidates are left,
+            # checked against each candidate's own tokens, whichever is less work.
+            estimates = {term: index.estimate(term) for term in terms}
+            terms.sort(key=estimates.get)
+            scores = index.matches(terms[0])
+            for term in terms[1:]:
+                if len(scores) * TOKENS_PER_APPOINTMENT < estimates[term]:
+                    scores = {cid: score + extra for cid, score in scores.items()
+                              if (extra := index.score(cid, term))}
+                else:
+                    term_scores = index.matches(term)
+                    scores = {cid: score + term_scores[cid] for cid, score in scores.items() if cid in term_scores}
+            # Equal scores: the latest appointment first
+            best = heapq.nlargest(limit, scores.items(),
+                                  key=lambda item: (item[1], index.docs[item[0]][2]["start"] or ""))
+            return [dict(index.docs[cid][2], score=round(score, 2)) for cid, score in best]
+
+    def size(self, doctor_id):
+        index = self._doctors.get(doctor_id)
+        return len(index.docs) if index is not None else 0
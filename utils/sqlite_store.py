@@ -0,0 +1,414 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from utils.appointment_store import SCHEDULE_LOG_LENGTH, ScheduleChangedError, SlotTakenError, order_key
+from utils.idempotency import SQLiteIdempotencyCache
+from utils.outbox import Outbox
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS appointments (
+    confirmation_id TEXT PRIMARY KEY,
+    doctor_id TEXT NOT NULL,
+    time TEXT NOT NULL,
+    order_key TEXT NOT NULL,
+    record TEXT NOT NULL,
+    google_event_id TEXT
+);
+CREATE UNIQUE INDEX IF NOT EXISTS appointments_slot ON appointments (doctor_id, time);
+CREATE TABLE IF NOT EXISTS store_state (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS schedule_versions (
+    doctor_id TEXT PRIMARY KEY,
+    version INTEGER NOT NULL,
+    data_version INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS schedule_changes (
+    doctor_id TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    start TEXT
+);
+CREATE INDEX IF NOT EXISTS schedule_changes_doctor ON schedule_changes (doctor_id, version);
+CREATE TABLE IF NOT EXISTS leases (
+    name TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+"""
+
+# Columns added after the first release, applied to existing databases
+MIGRATIONS = [
+    ("appointments", "google_event_id", "ALTER TABLE appointments ADD COLUMN google_event_id TEXT"),
+    ("schedule_versions", "data_version",
+     "ALTER TABLE schedule_versions ADD COLUMN data_version INTEGER NOT NULL DEFAULT 0"),
+]
+POST_MIGRATION = """
+CREATE INDEX IF NOT EXISTS appointments_google_event ON appointments (google_event_id);
+CREATE INDEX IF NOT EXISTS appointments_doctor_page ON appointments (doctor_id, order_key, confirmation_id);
+DROP INDEX IF EXISTS appointments_doctor_order;
+"""
+
+# Statements are kept as module constants so sqlite3's per-connection
+# statement cache compiles each of them once per connection.
+INSERT_APPOINTMENT = (
+    "INSERT INTO appointments (confirmation_id, doctor_id, time, order_key, record, google_event_id) "
+    "VALUES (?, ?, ?, ?, ?, ?)"
+)
+# Used by bulk imports: a taken slot or confirmation ID skips the row instead of failing the batch
+INSERT_APPOINTMENT_IF_FREE = INSERT_APPOINTMENT + " ON CONFLICT DO NOTHING"
+UPDATE_RECORD = "UPDATE appointments SET record = ?, google_event_id = ? WHERE confirmation_id = ?"
+UPDATE_SLOT = (
+    "UPDATE appointments SET time = ?, order_key = ?, record = ?, google_event_id = ? "
+    "WHERE confirmation_id = ?"
+)
+DELETE_APPOINTMENT = "DELETE FROM appointments WHERE confirmation_id = ?"
+SELECT_BY_ID = "SELECT record FROM appointments WHERE confirmation_id = ?"
+SELECT_BY_GOOGLE_EVENT = "SELECT record FROM appointments WHERE google_event_id = ?"
+SELECT_BY_SLOT = "SELECT record FROM appointments WHERE doctor_id = ? AND time = ?"
+SELECT_BY_DOCTOR = "SELECT record FROM appointments WHERE doctor_id = ? ORDER BY order_key"
+SELECT_BY_DOCTOR_BETWEEN = (
+    "SELECT record FROM appointments WHERE doctor_id = ? AND order_key >= ? AND order_key < ? "
+    "ORDER BY order_key"
+)
+# Keyset pagination over (order_key, confirmation_id); the status filter is optional
+SELECT_PAGE = (
+    "SELECT record FROM appointments WHERE doctor_id = ? AND order_key >= ? AND order_key < ? "
+    "AND (order_key, confirmation_id) > (?, ?) AND (? IS NULL OR json_extract(record, '$.status') = ?) "
+    "ORDER BY order_key, confirmation_id LIMIT ?"
+)
+SELECT_ALL = "SELECT record FROM appointments ORDER BY rowid"
+COUNT_ALL = "SELECT COUNT(*) FROM appointments"
+SELECT_SCHEDULE_VERSION = "SELECT version FROM schedule_versions WHERE doctor_id = ?"
+SELECT_DATA_VERSION = "SELECT data_version FROM schedule_versions WHERE doctor_id = ?"
+BUMP_SCHEDULE_VERSION = (
+    "INSERT INTO schedule_versions (doctor_id, version, data_version) VALUES (?, 1, 1) "
+    "ON CONFLICT (doctor_id) DO UPDATE SET version = version + 1, data_version = data_version + 1"
+)
+BUMP_DATA_VERSION = (
+    "INSERT INTO schedule_versions (doctor_id, version, data_version) VALUES (?, 0, 1) "
+    "ON CONFLICT (doctor_id) DO UPDATE SET data_version = data_version + 1"
+)
+LOG_SCHEDULE_CHANGE = "INSERT INTO schedule_changes (doctor_id, version, start) VALUES (?, ?, ?)"
+PRUNE_SCHEDULE_CHANGES = "DELETE FROM schedule_changes WHERE doctor_id = ? AND version <= ?"
+SELECT_SCHEDULE_CHANGES = "SELECT version, start FROM schedule_changes WHERE doctor_id = ? AND version > ?"
+SELECT_STATE = "SELECT value FROM store_state WHERE key = ?"
+UPSERT_STATE = (
+    "INSERT INTO store_state (key, value) VALUES (?, ?) "
+    "ON CONFLICT (key) DO UPDATE SET value = excluded.value"
+)
+ACQUIRE_LEASE = (
+    "INSERT INTO leases (name, owner, expires_at) VALUES (?, ?, ?) "
+    "ON CONFLICT (name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at "
+    "WHERE leases.owner = excluded.owner OR leases.expires_at < ?"
+)
+
+# Upper bound for order keys, which are ISO timestamps
+MAX_ORDER_KEY = "\uffff"
+
+
+class SQLiteAppointmentStore:
+    """Appointment store in a SQLite database in WAL mode.
+
+    Every gunicorn worker opens the same file, so all workers see one
+    schedule. The (doctor_id, time) unique index is what rejects double
+    bookings, which makes add() atomic across processes. Connections are
+    opened lazily, one per thread and process, and reused for every call.
+
+    The side-effect outbox and the idempotency keys live in the same
+    database, so an appointment, its outbox tasks and the response for its
+    Idempotency-Key are committed in one transaction.
+
+    Listeners (see add_listener) hear about changes made through this store
+    object only; changes from other workers show up as a data_version they
+    were not told about.
+    """
+
+    def __init__(self, path, busy_timeout_ms=5000):
+        self.path = path
+        self.busy_timeout_ms = busy_timeout_ms
+        self._local = threading.local()
+        self._listeners = []
+        self._migrate()
+        self.outbox = Outbox(path)
+        self.idempotency = SQLiteIdempotencyCache(path)
+
+    def add_listener(self, callback):
+        """Call callback(doctor_id, data_version, changes) after every change committed through this store.
+
+        changes is a list of (confirmation ID, appointment) pairs, the
+        appointment being None once removed. Callbacks run after the commit,
+        so two threads' changes may be reported out of version order.
+        """
+        self._listeners.append(callback)
+
+    def _changed_version(self, conn, doctor_id):
+        """The data_version a change just bumped to, read only when someone is listening"""
+        if not self._listeners:
+            return None
+        return conn.execute(SELECT_DATA_VERSION, (doctor_id,)).fetchone()[0]
+
+    @staticmethod
+    def _bump_schedule(conn, doctor_id, starts):
+        """Bump a doctor's schedule_version and log the appointment starts the change touched"""
+        conn.execute(BUMP_SCHEDULE_VERSION, (doctor_id,))
+        version = conn.execute(SELECT_SCHEDULE_VERSION, (doctor_id,)).fetchone()[0]
+        # One row per version even if nothing had a start, so schedule_changes() can tell the log is complete
+        conn.executemany(LOG_SCHEDULE_CHANGE, [(doctor_id, version, start) for start in set(starts)] or
+                         [(doctor_id, version, None)])
+        conn.execute(PRUNE_SCHEDULE_CHANGES, (doctor_id, version - SCHEDULE_LOG_LENGTH))
+
+    def _notify(self, doctor_id, version, changes):
+        for callback in self._listeners:
+            callback(doctor_id, version, changes)
+
+    def _migrate(self):
+        conn = self._connection()
+        conn.executescript(SCHEMA)
+        for table, column, statement in MIGRATIONS:
+            columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+            if column not in columns:
+                try:
+                    conn.execute(statement)
+                except sqlite3.OperationalError as e:
+                    # Another worker applied the same migration first
+                    if "duplicate column" not in str(e):
+                        raise
+        conn.executescript(POST_MIGRATION)
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        # A connection inherited across fork() must not be reused by the child
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(
+                self.path,
+                timeout=self.busy_timeout_ms / 1000,
+                isolation_level=None,
+                check_same_thread=False,
+                cached_statements=64,
+            )
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout_ms)}")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def _fetch_one(self, sql, params):
+        row = self._connection().execute(sql, params).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _fetch_all(self, sql, params=()):
+        return [json.loads(row[0]) for row in self._connection().execute(sql, params)]
+
+    @staticmethod
+    def _check_version(conn, doctor_id, expected_version):
+        if expected_version is None:
+            return
+        row = conn.execute(SELECT_SCHEDULE_VERSION, (doctor_id,)).fetchone()
+        if (row[0] if row else 0) != expected_version:
+            raise ScheduleChangedError(doctor_id)
+
+    def add(self, appointment, outbox_tasks=(), expected_version=None, idempotent=None):
+        """Store a new appointment and its outbox tasks, raising SlotTakenError if its slot is booked.
+
+        With expected_version, raises ScheduleChangedError instead of storing
+        if the doctor's schedule_version has moved on since it was read; the
+        check and the insert share one write transaction, so this holds
+        across worker processes. idempotent=(route, key, result) records
+        result for that Idempotency-Key in the same transaction.
+        """
+        try:
+            with self._transaction() as conn:
+                self._check_version(conn, appointment.get("doctor_id"), expected_version)
+                conn.execute(INSERT_APPOINTMENT, self._row(appointment))
+                self._bump_schedule(conn, appointment.get("doctor_id"), [appointment.get("start")])
+                version = self._changed_version(conn, appointment.get("doctor_id"))
+                if outbox_tasks:
+                    self.outbox.enqueue(outbox_tasks, conn)
+                if idempotent:
+                    self.idempotency.finish(*idempotent, conn=conn)
+        except sqlite3.IntegrityError as e:
+            raise SlotTakenError((appointment.get("doctor_id"), appointment.get("time"))) from e
+        self._notify(appointment.get("doctor_id"), version, [(appointment["confirmationId"], appointment)])
+        return appointment
+
+    def add_many(self, appointments, outbox_tasks_for=None):
+        """Store a batch of new appointments in one transaction.
+
+        Rows whose slot or confirmation ID is already taken are skipped and
+        returned; outbox_tasks_for(appointment) gives the tasks to enqueue
+        for each stored row.
+        """
+        rejected = []
+        changes = {}
+        versions = {}
+        with self._transaction() as conn:
+            for appointment in appointments:
+                if conn.execute(INSERT_APPOINTMENT_IF_FREE, self._row(appointment)).rowcount == 0:
+                    rejected.append(appointment)
+                    continue
+                changes.setdefault(appointment.get("doctor_id"), []).append(
+                    (appointment["confirmationId"], appointment))
+                if outbox_tasks_for:
+                    self.outbox.enqueue(outbox_tasks_for(appointment), conn)
+            for doctor_id, doctor_changes in changes.items():
+                self._bump_schedule(conn, doctor_id, [appointment.get("start") for _, appointment in doctor_changes])
+                versions[doctor_id] = self._changed_version(conn, doctor_id)
+        for doctor_id, doctor_changes in changes.items():
+            self._notify(doctor_id, versions[doctor_id], doctor_changes)
+        return rejected
+
+    @staticmethod
+    def _row(appointment):
+        return (
+            appointment["confirmationId"],
+            appointment.get("doctor_id"),
+            appointment.get("time"),
+            order_key(appointment),
+            json.dumps(appointment),
+            appointment.get("google_event_id"),
+        )
+
+    def remove(self, confirmation_id):
+        with self._transaction() as conn:
+            row = conn.execute(SELECT_BY_ID, (confirmation_id,)).fetchone()
+            if row is None:
+                return None
+            appointment = json.loads(row[0])
+            conn.execute(DELETE_APPOINTMENT, (confirmation_id,))
+            self._bump_schedule(conn, appointment.get("doctor_id"), [appointment.get("start")])
+            version = self._changed_version(conn, appointment.get("doctor_id"))
+        self._notify(appointment.get("doctor_id"), version, [(confirmation_id, None)])
+        return appointment
+
+    def update(self, confirmation_id, **fields):
+        """Set top-level fields on a stored appointment that do not affect its slot"""
+        with self._transaction() as conn:
+            row = conn.execute(SELECT_BY_ID, (confirmation_id,)).fetchone()
+            if row is None:
+                return None
+            appointment = json.loads(row[0])
+            appointment.update(fields)
+            conn.execute(UPDATE_RECORD, (json.dumps(appointment), appointment.get("google_event_id"), confirmation_id))
+            conn.execute(BUMP_DATA_VERSION, (appointment.get("doctor_id"),))
+            version = self._changed_version(conn, appointment.get("doctor_id"))
+        self._notify(appointment.get("doctor_id"), version, [(confirmation_id, appointment)])
+        return appointment
+
+    def reschedule(self, confirmation_id, time, expected_version=None, **fields):
+        """Move an appointment to another slot, raising SlotTakenError if that slot is booked.
+
+        expected_version works as for add().
+        """
+        try:
+            with self._transaction() as conn:
+                row = conn.execute(SELECT_BY_ID, (confirmation_id,)).fetchone()
+                if row is None:
+                    return None
+                appointment = json.loads(row[0])
+                self._check_version(conn, appointment.get("doctor_id"), expected_version)
+                old_start = appointment.get("start")
+                appointment.update(fields, time=time)
+                conn.execute(UPDATE_SLOT, (
+                    time,
+                    order_key(appointment),
+                    json.dumps(appointment),
+                    appointment.get("google_event_id"),
+                    confirmation_id,
+                ))
+                self._bump_schedule(conn, appointment.get("doctor_id"), [old_start, appointment.get("start")])
+                version = self._changed_version(conn, appointment.get("doctor_id"))
+        except sqlite3.IntegrityError as e:
+            raise SlotTakenError((appointment.get("doctor_id"), time)) from e
+        self._notify(appointment.get("doctor_id"), version, [(confirmation_id, appointment)])
+        return appointment
+
+    def get(self, confirmation_id):
+        return self._fetch_one(SELECT_BY_ID, (confirmation_id,))
+
+    def find_by_google_event_id(self, google_event_id):
+        return self._fetch_one(SELECT_BY_GOOGLE_EVENT, (google_event_id,))
+
+    def find_conflict(self, doctor_id, time):
+        """Return the appointment already holding this doctor's slot, if any"""
+        return self._fetch_one(SELECT_BY_SLOT, (doctor_id, time))
+
+    def for_doctor(self, doctor_id):
+        return self._fetch_all(SELECT_BY_DOCTOR, (doctor_id,))
+
+    def for_doctor_between(self, doctor_id, start=None, end=None):
+        """Appointments for a doctor whose time key falls in [start, end)"""
+        return self._fetch_all(SELECT_BY_DOCTOR_BETWEEN, (doctor_id, start or "", end or MAX_ORDER_KEY))
+
+    def schedule_version(self, doctor_id):
+        """Counter bumped in the same transaction as every add, remove or reschedule for a doctor"""
+        row = self._connection().execute(SELECT_SCHEDULE_VERSION, (doctor_id,)).fetchone()
+        return row[0] if row else 0
+
+    def schedule_changes(self, doctor_id, since_version):
+        """(schedule_version, starts of the appointments added, removed or moved since since_version).
+
+        None if since_version is too far back to say; rebuild from for_doctor() then.
+        """
+        conn = self._connection()
+        # One read transaction, so the version and the log agree
+        conn.execute("BEGIN")
+        try:
+            row = conn.execute(SELECT_SCHEDULE_VERSION, (doctor_id,)).fetchone()
+            rows = conn.execute(SELECT_SCHEDULE_CHANGES, (doctor_id, since_version)).fetchall()
+        finally:
+            conn.execute("COMMIT")
+        version = row[0] if row else 0
+        if len({logged for logged, _ in rows}) != version - since_version:
+            return None
+        return version, {start for _, start in rows if start}
+
+    def data_version(self, doctor_id):
+        """Counter bumped with every change to a doctor's appointments, including update()"""
+        row = self._connection().execute(SELECT_DATA_VERSION, (doctor_id,)).fetchone()
+        return row[0] if row else 0
+
+    def page_for_doctor(self, doctor_id, start=None, end=None, after=None, limit=50, status=None):
+        """Keyset page of a doctor's appointments: time key in [start, end), sorting after the key pair after"""
+        after_key, after_id = after or ("", "")
+        return self._fetch_all(SELECT_PAGE, (
+            doctor_id, start or "", end or MAX_ORDER_KEY, after_key, after_id, status, status, limit))
+
+    def get_state(self, key, default=None):
+        """Small piece of persistent bookkeeping, e.g. a calendar sync token"""
+        row = self._connection().execute(SELECT_STATE, (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def set_state(self, key, value):
+        self._connection().execute(UPSERT_STATE, (key, json.dumps(value)))
+
+    def acquire_lease(self, name, owner, ttl):
+        """Claim name for owner for ttl seconds; True if owner now holds it.
+
+        Used so only one worker process runs a given background job at a time.
+        """
+        now = time.time()
+        cursor = self._connection().execute(ACQUIRE_LEASE, (name, owner, now + ttl, now))
+        return cursor.rowcount == 1
+
+    def __len__(self):
+        return self._connection().execute(COUNT_ALL).fetchone()[0]
+
+    def __iter__(self):
+        return iter(self._fetch_all(SELECT_ALL))
@@ -0,0 +1,16 @@
+import threading
+
+
+class StripedLock:
+    """A fixed pool of locks shared out by key.
+
+    Work on the same key (e.g. one doctor's schedule) is serialised, while
+    different keys almost always get different locks and do not wait on
+    each other. stripes=1 gives a single global lock.
+    """
+
+    def __init__(self, stripes=64):
+        self._locks = [threading.Lock() for _ in range(stripes)]
+
+    def __call__(self, key):
+        return self._locks[hash(key) % len(self._locks)]
@@ -0,0 +1,176 @@
+"""Turns a patient's free-text appointment time into one canonical slot.
+
+The same parser feeds the chat reply, the booking conflict key and the
+Google Calendar event, so all three agree. A single compiled regex scans
+the text once; dateparser is only imported and consulted for inputs the
+regex finds nothing in.
+"""
+import os
+import re
+from collections import namedtuple
+from datetime import datetime, time, timedelta
+from functools import lru_cache
+from zoneinfo import ZoneInfo
+
+CLINIC_TIMEZONE = ZoneInfo(os.getenv("CLINIC_TIMEZONE", "America/New_York"))
+
+# When only a date is given
+DEFAULT_TIME = time(10, 0)
+PART_OF_DAY = {"morning": time(9, 0), "afternoon": time(14, 0), "evening": time(17, 0),
+               "tonight": time(17, 0), "noon": time(12, 0), "midday": time(12, 0)}
+
+WEEKDAYS = {"mon": 0, "tue": 1, "wed": 2, "thu": 3, "fri": 4, "sat": 5, "sun": 6}
+MONTHS = {"jan": 1, "feb": 2, "mar": 3, "apr": 4, "may": 5, "jun": 6,
+          "jul": 7, "aug": 8, "sep": 9, "oct": 10, "nov": 11, "dec": 12}
+
+_WEEKDAY = r"mon(?:day)?|tue(?:s(?:day)?)?|wed(?:nesday)?|thu(?:r(?:s(?:day)?)?)?|fri(?:day)?|saturday|sunday"
+# "sat" and "sun" are left out: "I sat down", "sun allergy"
+_MONTH = (r"jan(?:uary)?|feb(?:ruary)?|mar(?:ch)?|apr(?:il)?|may|june?|july?|aug(?:ust)?"
+          r"|sep(?:t(?:ember)?)?|oct(?:ober)?|nov(?:ember)?|dec(?:ember)?")
+_ORDINAL = r"(?:st|nd|rd|th)?"
+
+TOKEN_RE = re.compile(rf"""
+    \b(?P<iso>(?P<iso_y>\d{{4}})-(?P<iso_m>\d{{1,2}})-(?P<iso_d>\d{{1,2}}))\b
+  | \b(?P<mdy>(?P<mdy_m>\d{{1,2}})/(?P<mdy_d>\d{{1,2}})(?:/(?P<mdy_y>\d{{2,4}}))?)\b
+  | \b(?P<md_month>{_MONTH})\.?\s+(?P<md_day>\d{{1,2}}){_ORDINAL}\b
+  | \b(?P<dm_day>\d{{1,2}}){_ORDINAL}\s+(?:of\s+)?(?P<dm_month>{_MONTH})\b
+  | \b(?P<relative>day\s+after\s+tomorrow|tomorrow|today|tonight)\b
+  | \b(?P<weekday>{_WEEKDAY})\b(?:\s+(?:at\s+)?(?P<weekday_hour>\d{{1,2}})(?![\d:/]|\s*[ap]\.?m\b))?
+  | \b(?P<clock_h>\d{{1,2}})(?::(?P<clock_m>\d{{2}}))?\s*(?P<meridiem>[ap])\.?m\b\.?
+  | \b(?P<h24>[01]?\d|2[0-3]):(?P<m24>[0-5]\d)\b
+  | \bat\s+(?P<at_hour>\d{{1,2}})\b(?![\d:/])
+  | \b(?P<part>morning|afternoon|evening|noon|midday)\b
+""", re.IGNORECASE | re.VERBOSE)
+
+ParsedSlot = namedtuple("ParsedSlot", ["start", "label", "matched"])
+
+
+def format_slot(start):
+    """Canonical label for a slot, e.g. 'Friday, Oct 23 10:00 AM'"""
+    start = start.astimezone(CLINIC_TIMEZONE)
+    return f"{start:%A}, {start:%b} {start.day} {start.hour % 12 or 12}:{start:%M} {'AM' if start.hour < 12 else 'PM'}"
+
+
+def _bare_hour(hour):
+    # Clinic hours: a bare "3" means 3 PM, a bare "9" means 9 AM
+    hour = int(hour)
+    if hour > 23:
+        return None
+    if 1 <= hour <= 6:
+        hour += 12
+    return time(hour, 0)
+
+
+def _upcoming_weekday(today, weekday):
+    days_ahead = weekday - today.weekday()
+    if days_ahead <= 0:
+        days_ahead += 7
+    return today + timedelta(days=days_ahead)
+
+
+def _upcoming_date(today, month, day, year=None):
+    try:
+        candidate = today.replace(year=year or today.year, month=month, day=day)
+    except ValueError:
+        return None
+    if year is None and candidate < today:
+        candidate = candidate.replace(year=candidate.year + 1)
+    return candidate
+
+
+def _scan(text, today):
+    day = None
+    at = None
+    # A calendar date wins over a weekday or "today" seen before it, so a
+    # slot label such as "Friday, Oct 30 2:00 PM" parses back to Oct 30
+    dated = False
+    for match in TOKEN_RE.finditer(text):
+        found_day = found_time = None
+        explicit = bool(match.group("iso") or match.group("mdy") or match.group("md_month") or match.group("dm_month"))
+        if match.group("iso"):
+            found_day = _upcoming_date(today, int(match.group("iso_m")), int(match.group("iso_d")),
+                                       int(match.group("iso_y")))
+        elif match.group("mdy"):
+            year = match.group("mdy_y")
+            if year and len(year) == 2:
+                year = "20" + year
+            found_day = _upcoming_date(today, int(match.group("mdy_m")), int(match.group("mdy_d")),
+                                       int(year) if year else None)
+        elif match.group("md_month"):
+            found_day = _upcoming_date(today, MONTHS[match.group("md_month")[:3].lower()], int(match.group("md_day")))
+        elif match.group("dm_month"):
+            found_day = _upcoming_date(today, MONTHS[match.group("dm_month")[:3].lower()], int(match.group("dm_day")))
+        elif match.group("relative"):
+            relative = match.group("relative").lower()
+            if relative == "today":
+                found_day = today
+            elif relative == "tonight":
+                found_day, found_time = today, PART_OF_DAY["tonight"]
+            elif relative == "tomorrow":
+                found_day = today + timedelta(days=1)
+            else:
+                found_day = today + timedelta(days=2)
+        elif match.group("weekday"):
+            found_day = _upcoming_weekday(today, WEEKDAYS[match.group("weekday")[:3].lower()])
+            if match.group("weekday_hour"):
+                found_time = _bare_hour(match.group("weekday_hour"))
+        elif match.group("meridiem"):
+            hour = int(match.group("clock_h"))
+            minute = int(match.group("clock_m") or 0)
+            if 1 <= hour <= 12 and minute < 60:
+                hour = hour % 12 + (12 if match.group("meridiem").lower() == "p" else 0)
+                found_time = time(hour, minute)
+        elif match.group("h24"):
+            found_time = time(int(match.group("h24")), int(match.group("m24")))
+        elif match.group("at_hour"):
+            found_time = _bare_hour(match.group("at_hour"))
+        elif match.group("part"):
+            found_time = PART_OF_DAY[match.group("part").lower()]
+        if found_day is not None and (day is None or (explicit and not dated)):
+            day = found_day
+            dated = explicit
+        if at is None and found_time is not None:
+            at = found_time
+        if dated and at is not None:
+            break
+    return day, at
+
+
+def _dateparser_fallback(text, today):
+    # Imported lazily: dateparser takes a noticeable time to import and is
+    # only needed for phrasings the regex does not understand
+    import dateparser
+    return dateparser.parse(text, settings={
+        "PREFER_DATES_FROM": "future",
+        "RELATIVE_BASE": datetime.combine(today, time(0, 0)),
+    })
+
+
+@lru_cache(maxsize=4096)
+def _parse(text, today):
+    day, at = _scan(text, today)
+    if day is None and at is None:
+        parsed = _dateparser_fallback(text, today) if text.strip() else None
+        if parsed is not None:
+            # Relative phrases ("in two weeks") resolve to midnight of the relative base
+            at = parsed.time().replace(second=0, microsecond=0) if parsed.time() != time(0, 0) else DEFAULT_TIME
+            return _slot(parsed.date(), at, matched=True)
+        return _slot(today + timedelta(days=1), DEFAULT_TIME, matched=False)
+    if day is None:
+        day = today + timedelta(days=1)
+    return _slot(day, at or DEFAULT_TIME, matched=True)
+
+
+def _slot(day, at, matched):
+    start = datetime.combine(day, at, tzinfo=CLINIC_TIMEZONE)
+    return ParsedSlot(start, format_slot(start), matched)
+
+
+def parse_appointment_time(text, now=None):
+    """Canonical slot for free text; defaults to tomorrow 10 AM when nothing is recognised.
+
+    Results are memoized per (text, clinic date), so relative phrases like
+    "tomorrow" are re-resolved when the day changes.
+    """
+    now = now or datetime.now(CLINIC_TIMEZONE)
+    return _parse(text or "", now.astimezone(CLINIC_TIMEZONE).date())